@@ -0,0 +1 @@
+"""PlotBuddy benchmarks; run from the repository root, e.g. `python -m benchmarks.latency`."""
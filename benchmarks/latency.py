@@ -0,0 +1,244 @@
+"""
+End-to-end latency benchmark for the PlotBuddy API.
+
+Starts the local fake Gemini server and the FastAPI app (uvicorn subprocess)
+pointed at it, then drives /api/chat, /api/story/create and the profile
+endpoints at a fixed concurrency. Reports p50/p95/p99 latency, throughput
+and server CPU time per request for each scenario.
+
+    python -m benchmarks.latency --concurrency 32 --requests 500 --latency lognormal:0.8,0.4
+
+Use --target to benchmark an already running server instead (pass
+--server-pid as well to get CPU figures).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from multi_tool_agent.testing.fake_gemini import (
+    FakeGeminiConfig,
+    FakeGeminiServer,
+    LatencyDistribution,
+    parse_error_rates,
+)
+
+CHAT_MESSAGES = [
+    "hi there", "what genres do you have?", "how much does it cost?", "how does it work?",
+    "create story", "I'm stuck on my villain, any advice?", "tell me about plot twists",
+    "what are your support hours?", "write me a story about a lighthouse", "hello plotbuddy",
+]
+GENRES = ["fantasy", "mystery", "scifi", "horror", "romance"]
+MOODS = ["mysterious", "tense", "hopeful", "dark", "whimsical"]
+LENGTHS = ["micro", "short", "medium"]
+
+
+def _chat(i: int) -> Dict[str, Any]:
+    return {"input": CHAT_MESSAGES[i % len(CHAT_MESSAGES)], "user_id": f"bench_user_{i % 50}"}
+
+
+def _story(i: int) -> Dict[str, Any]:
+    return {"genre": GENRES[i % len(GENRES)], "mood": MOODS[(i // len(GENRES)) % len(MOODS)],
+            "length": LENGTHS[i % len(LENGTHS)], "user_id": f"bench_user_{i % 50}"}
+
+
+def _advice(i: int) -> Dict[str, Any]:
+    return {"context": CHAT_MESSAGES[i % len(CHAT_MESSAGES)], "genre": GENRES[i % len(GENRES)],
+            "mood": MOODS[i % len(MOODS)], "user_id": f"bench_user_{i % 50}"}
+
+
+def _profile(i: int) -> Dict[str, Any]:
+    return {"user_id": f"bench_user_{i % 50}"}
+
+
+# name -> (path, payload builder)
+SCENARIOS: Dict[str, Any] = {
+    "chat": ("/api/chat", _chat),
+    "story": ("/api/story/create", _story),
+    "profile": ("/api/profile", _profile),
+    "brainstorm": ("/api/profile/brainstorm", _story),
+    "advice": ("/api/profile/advice", _advice),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU seconds of a process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+async def run_scenario(client: httpx.AsyncClient, path: str, payload: Callable[[int], Dict[str, Any]],
+                       requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload(i))
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else float("nan"),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api_server(port: int, gemini_url: str, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "fake-benchmark-key"),
+               PLOTBUDDY_GEMINI_ENDPOINT=gemini_url, **extra_env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "multi_tool_agent.api.server:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_up(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.post("/api/profile", json={"user_id": "warmup"})
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"API server at {base_url} did not come up within {timeout}s")
+
+
+async def run_benchmark(base_url: str, scenarios: List[str], requests: int, concurrency: int,
+                        warmup: int, server_pid: Optional[int]) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        for name in scenarios:
+            path, payload = SCENARIOS[name]
+            if warmup:
+                await run_scenario(client, path, payload, warmup, min(concurrency, warmup))
+            cpu_before = process_cpu_seconds(server_pid) if server_pid else None
+            result = await run_scenario(client, path, payload, requests, concurrency)
+            cpu_after = process_cpu_seconds(server_pid) if server_pid else None
+            if cpu_before is not None and cpu_after is not None and result["requests"]:
+                result["server_cpu_ms_per_request"] = (cpu_after - cpu_before) * 1000 / result["requests"]
+            results[name] = result
+    return results
+
+
+def format_report(results: Dict[str, Dict[str, Any]]) -> str:
+    header = f"{'scenario':<11}{'reqs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu ms/req':>12}  statuses"
+    lines = [header, "-" * len(header)]
+    for name, r in results.items():
+        cpu = r.get("server_cpu_ms_per_request")
+        lines.append(
+            f"{name:<11}{r['requests']:>6}{r['throughput_rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+            f"{r['p99_ms']:>10.1f}{(f'{cpu:.2f}' if cpu is not None else 'n/a'):>12}  {r['statuses']}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    parser = argparse.ArgumentParser(description="PlotBuddy end-to-end latency benchmark.")
+    parser.add_argument("--scenarios", default="chat,story,profile,brainstorm,advice",
+                        help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--latency", default="lognormal:0.5,0.3", help="Fake Gemini first-byte latency")
+    parser.add_argument("--token-latency", default="0", help="Fake Gemini delay per streamed chunk")
+    parser.add_argument("--error-rates", default="", help='Fake Gemini error injection, e.g. "quota=0.02"')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", default=None, help="Benchmark a running server at this base URL")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID of --target, for CPU figures")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the spawned API server (repeatable)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    fake = server = None
+    base_url, server_pid = args.target, args.server_pid
+    try:
+        if base_url is None:
+            fake = FakeGeminiServer(FakeGeminiConfig(
+                latency=LatencyDistribution.parse(args.latency),
+                token_latency=LatencyDistribution.parse(args.token_latency),
+                error_rates=parse_error_rates(args.error_rates),
+                seed=args.seed,
+            )).start()
+            port = _free_port()
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            server = start_api_server(port, fake.url, extra_env)
+            base_url, server_pid = f"http://127.0.0.1:{port}", server.pid
+            asyncio.run(wait_until_up(base_url))
+
+        results = asyncio.run(run_benchmark(base_url, scenarios, args.requests, args.concurrency,
+                                            args.warmup, server_pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+        if fake is not None:
+            upstream = fake.stats()
+            fake.stop()
+
+    print(format_report(results))
+    if fake is not None:
+        print(f"\nfake gemini: {upstream['requests']} upstream calls, errors {upstream['errors']}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
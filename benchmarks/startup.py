@@ -0,0 +1,148 @@
+"""
+Cold-start benchmark for the PlotBuddy API.
+
+Measures, in fresh interpreters:
+
+- import time of the package, the LLM layer and the API server module,
+  and of a full warm-up (every agent built, Gemini SDK configured);
+- for each PLOTBUDDY_WARMUP mode, the time from spawning the server until
+  it answers HTTP at all, until /ready reports it warm, and until its first
+  /api/chat response (served by the local fake Gemini server), plus the
+  latency of that first request.
+
+    python -m benchmarks.startup --runs 5 --modes startup,background,lazy
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.latency import _free_port, start_api_server
+from multi_tool_agent.testing.fake_gemini import FakeGeminiConfig, FakeGeminiServer, LatencyDistribution
+
+# name -> statements timed in a fresh interpreter
+IMPORT_TARGETS: Dict[str, str] = {
+    "package": "import multi_tool_agent",
+    "llm": "import multi_tool_agent.llm",
+    "server": "import multi_tool_agent.api.server",
+    "server+warm_up": "import multi_tool_agent.api.server as server; server.warm_up()",
+}
+WARMUP_MODES = ("startup", "background", "lazy")
+
+
+def time_import(statement: str) -> float:
+    """Seconds `statement` takes in a new interpreter (interpreter start-up excluded)."""
+    script = (
+        "import time\n"
+        "started = time.perf_counter()\n"
+        f"{statement}\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "fake-benchmark-key"))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_imports(runs: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, statement in IMPORT_TARGETS.items():
+        samples = [time_import(statement) for _ in range(runs)]
+        results[name] = {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+    return results
+
+
+def measure_cold_start(mode: str, gemini_url: str, timeout: float = 120.0) -> Dict[str, Optional[float]]:
+    """Spawn the server with PLOTBUDDY_WARMUP=mode and time its first answers."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    spawned = time.perf_counter()
+    server = start_api_server(port, gemini_url, {"PLOTBUDDY_WARMUP": mode, "PLOTBUDDY_JOBS_DB": ":memory:"})
+    result: Dict[str, Optional[float]] = {"listening_s": None, "ready_s": None, "first_response_s": None,
+                                          "first_request_ms": None}
+    try:
+        with httpx.Client(base_url=base_url, timeout=timeout) as client:
+            deadline = spawned + timeout
+            while time.perf_counter() < deadline:
+                try:
+                    client.get("/metrics")
+                    break
+                except httpx.HTTPError:
+                    time.sleep(0.02)
+            else:
+                raise RuntimeError(f"API server ({mode}) did not come up within {timeout}s")
+            result["listening_s"] = time.perf_counter() - spawned
+            while time.perf_counter() < deadline and client.get("/ready").status_code != 200:
+                time.sleep(0.02)
+            result["ready_s"] = time.perf_counter() - spawned
+
+            started = time.perf_counter()
+            response = client.post("/api/chat", json={"input": "hello", "user_id": "cold_start"})
+            finished = time.perf_counter()
+            if response.status_code == 200:
+                result["first_response_s"] = finished - spawned
+                result["first_request_ms"] = (finished - started) * 1000
+    finally:
+        server.terminate()
+        server.wait(10)
+    return result
+
+
+def format_report(imports: Dict[str, Dict[str, float]], cold_starts: Dict[str, List[Dict[str, Any]]]) -> str:
+    lines = [f"{'import':<16}{'median ms':>11}{'min ms':>9}", "-" * 36]
+    for name, r in imports.items():
+        lines.append(f"{name:<16}{r['median_ms']:>11.1f}{r['min_ms']:>9.1f}")
+    if cold_starts:
+        header = f"{'warm-up mode':<14}{'listening s':>13}{'ready s':>9}{'1st response s':>16}{'1st request ms':>16}"
+        lines += ["", header, "-" * len(header)]
+        for mode, runs in cold_starts.items():
+            def median(field: str) -> str:
+                values = [run[field] for run in runs if run[field] is not None]
+                return f"{statistics.median(values):.2f}" if values else "n/a"
+            lines.append(f"{mode:<14}{median('listening_s'):>13}{median('ready_s'):>9}{median('first_response_s'):>16}"
+                         f"{median('first_request_ms'):>16}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="PlotBuddy import time and time-to-first-response benchmark.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters / servers per measurement")
+    parser.add_argument("--modes", default=",".join(WARMUP_MODES), help="PLOTBUDDY_WARMUP modes to start with "
+                                                                     "(empty to only time imports)")
+    parser.add_argument("--latency", default="0.05", help="Fake Gemini first-byte latency")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in WARMUP_MODES]
+    if unknown:
+        parser.error(f"Unknown warm-up mode(s): {', '.join(unknown)}")
+
+    imports = measure_imports(args.runs)
+    cold_starts: Dict[str, List[Dict[str, Any]]] = {}
+    if modes:
+        fake = FakeGeminiServer(FakeGeminiConfig(latency=LatencyDistribution.parse(args.latency))).start()
+        try:
+            for mode in modes:
+                cold_starts[mode] = [measure_cold_start(mode, fake.url) for _ in range(args.runs)]
+        finally:
+            fake.stop()
+
+    print(format_report(imports, cold_starts))
+    results = {"imports": imports, "cold_starts": cold_starts}
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
 """
 PlotBuddy Multi-Agent System
 A multi-agent system for creative writing assistance.
+
+Importing the package is cheap: agents, the ADK and the Gemini SDK are
+loaded on first use (or by `multi_tool_agent.api.server.warm_up`).
 """
 
 # Version information
 __version__ = "1.0.0"
 
-# Import the main entry point
-from .agent import process_message
-
 # Make process_message available at the package level
-__all__ = ["process_message"]
\ No newline at end of file
+__all__ = ["process_message"]
+
+
+def __getattr__(name):
+    # The entry point pulls in the agent registry, so load it on first access
+    if name == "process_message":
+        from .agent import process_message
+        return process_message
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
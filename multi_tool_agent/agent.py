@@ -4,11 +4,15 @@ Entry point for the agent system
 """
 
 from typing import Dict, Any, Union
-from .agents.orchestrator import OrchestratorAgent
+from .agents.registry import get_registry
 from .models.schemas import ToolRequest, ToolResponse
 
-# Singleton orchestrator instance (if appropriate)
-orchestrator = OrchestratorAgent()
+
+def __getattr__(name):
+    # The orchestrator is owned by the shared agent registry
+    if name == "orchestrator":
+        return get_registry().orchestrator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def process_message(user_id: str, message: Union[str, Dict[str, Any]]) -> str:
     """
@@ -16,6 +20,6 @@ def process_message(user_id: str, message: Union[str, Dict[str, Any]]) -> str:
     """
     # Create a tool request (adjust if .create does not exist)
     request = ToolRequest(user_id=user_id, input=message)
-    response = orchestrator.process(request)
+    response = get_registry().orchestrator.process(request)
     # Return response text or error message
     return getattr(response, "output", None) or getattr(response, "error", "Unknown error")
\ No newline at end of file
@@ -3,11 +3,18 @@ PlotBuddy Agents
 Collection of specialized agents for different tasks.
 """
 
-from .greeting import GreetingAgent
-from .faq import FAQAgent
-from .profile import ProfileAgent
-from .story import StoryAgent
-from .orchestrator import OrchestratorAgent
+import importlib
+
+from .registry import AgentRegistry, get_registry
+
+# Agent classes import the ADK and the Gemini SDK, so they are loaded on first access
+_LAZY = {
+    "GreetingAgent": ".greeting",
+    "FAQAgent": ".faq",
+    "ProfileAgent": ".profile",
+    "StoryAgent": ".story",
+    "OrchestratorAgent": ".orchestrator",
+}
 
 
 __all__ = [
@@ -16,4 +23,12 @@ __all__ = [
     "ProfileAgent",
     "StoryAgent",
     "OrchestratorAgent",
-]
\ No newline at end of file
+    "AgentRegistry",
+    "get_registry",
+]
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,18 +1,13 @@
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env if present
-load_dotenv()
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 import logging
-from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import google.generativeai as genai
 
-# Load environment variables from .env if present
-load_dotenv()
+from multi_tool_agent.config.environment import load_environment
+from multi_tool_agent.llm.pool import get_model
+
+# Load environment variables from multi_tool_agent/.env if present
+load_environment()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -20,11 +15,9 @@ CORS(app)  # Enable CORS for all routes
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# The SDK is configured by the model client pool (llm.pool) on first use
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-    logger.info("Google Generative AI configured successfully.")
-else:
+if not GOOGLE_API_KEY:
     logger.critical(
         "GOOGLE_API_KEY environment variable not found. LLM calls will fail. "
         "Ensure GOOGLE_API_KEY is set in your environment variables or .env file."
@@ -44,7 +37,7 @@ def chat():
             }), 503
 
         # Example: Use Gemini 1.5 Flash Latest (update model as needed)
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
+        model = get_model("gemini-1.5-flash-latest")
         response = model.generate_content(user_message)
         output = response.text if hasattr(response, "text") else str(response)
 
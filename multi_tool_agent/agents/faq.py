@@ -1,4 +1,5 @@
 import logging
+import os
 from typing import Dict, Callable, Any, List, Optional
 from pydantic import PrivateAttr
 import re
@@ -6,12 +7,27 @@ import json
 
 from ..models.schemas import ToolRequest, ToolResponse
 from google.adk.agents import LlmAgent
+from ..llm import run_blocking, submit_blocking, generate_text, classify_error, scheduling_scope, OverloadedError
+from ..llm.scheduler import BACKGROUND
+from ..observability.metrics import instrument_agent, record_route
+from ..observability.tracing import annotate
+from ..services.response_cache import ResponseCache, normalize_query
+from ..services.session_state import SessionState, get_session_state
+from .intent import FAQ_PATTERNS, FAQ_STORY_INTENT_KEYWORDS, FAQ_GENRE_SELECTION_KEYWORDS, scan_intents
 
-from . import client
 from multi_tool_agent.config.response import FAQ_RESPONSES, STORY_TEMPLATES, ERROR_MESSAGES
 
 logger = logging.getLogger(__name__)
 
+
+def _refresh_in_background(refresh: Callable[[], None]) -> None:
+    """Refresh a stale cached answer on the LLM executor, as background work of the user who hit it."""
+    def run() -> None:
+        with scheduling_scope(BACKGROUND):
+            refresh()
+    submit_blocking(run)
+
+
 class FAQAgent(LlmAgent):
     """
     A specialized agent that handles frequently asked questions and commands
@@ -24,6 +40,8 @@ class FAQAgent(LlmAgent):
     _faq_patterns: Dict[str, Dict[str, Any]] = PrivateAttr()
     _story_intent_keywords: List[str] = PrivateAttr()
     _genre_keywords: List[str] = PrivateAttr()
+    _answer_cache: ResponseCache = PrivateAttr()
+    _sessions: SessionState = PrivateAttr()
 
     def __init__(self, model_name: str = "gemini-1.5-flash"):
         """
@@ -38,156 +56,165 @@ class FAQAgent(LlmAgent):
             description="Answers frequently asked questions about PlotBuddy.",
             instruction="You are a helpful FAQ assistant for PlotBuddy."
         )
-        # Define more comprehensive patterns with broader keyword matches
-        self._faq_patterns = {
-            "help": {
-                "keywords": ["help", "instructions", "guide", "commands", "how to use", "options", "features"],
-                "response_key": "HELP_MESSAGE"
-            },
-            "genre": {
-                "keywords": ["genre", "genres", "what genres", "story types", "types of stories", 
-                            "story genres", "available genres", "kind of stories", "what stories"],
-                "response_key": "GENRES_MESSAGE"
-            },
-            "pricing": {
-                "keywords": ["price", "prices", "pricing", "cost", "how much", "payment", 
-                            "subscription", "plan", "fee", "charge", "money", "dollar"],
-                "response_key": "PRICING_MESSAGE"
-            },
-            "contact": {
-                "keywords": ["contact", "support", "email", "phone", "reach out", "support team", 
-                            "help desk", "customer service", "tech support"],
-                "response_key": "CONTACT_MESSAGE"
-            },
-            "hours": {
-                "keywords": ["hour", "hours", "business hours", "open", "when", "availability",
-                            "support hours", "operating hours", "available time", "schedule"],
-                "response_key": "HOURS_MESSAGE"
-            },
-            "how_it_works": {
-                "keywords": ["how it works", "how does it work", "process", "explain", "details", 
-                            "steps", "guide me", "tutorial", "instructions", "workflow", "how it works", 
-                            "how does plotbuddy work", "features", "about plotbuddy", "what can you do",
-                            "what is plotbuddy", "what is plot buddy", "how to use plotbuddy",
-                            "how to use plot buddy", "plotbuddy features", "plot buddy features",
-                            "plotbuddy overview", "plot buddy overview", "plotbuddy guide", "plot buddy guide"],
-                "response_key": "HOW_IT_WORKS_MESSAGE"
-            },
-            "using_plotbuddy": {
-                "keywords": ["how to use plotbuddy", "using plotbuddy", "plotbuddy guide", "navigating plotbuddy"],
-                "response_key": "USING_PLOTBUDDY_MESSAGE"
-            }
-        }
-
-        # Keywords for detecting story creation intent
-        self._story_intent_keywords = [
-            "let's start", "i'm ready", "create story", "write story", "make story",
-            "start writing", "begin story", "let's write", "write a story", "generate story",
-            "new story", "story idea", "plot", "narrative", "story prompt", "story generation",
-            "story creation", "story writing", "story prompt", "story concept", "create a story",
-            "write a plot", "write a narrative", "write a story idea", "write a story prompt",
-            "write a story concept", "i want to create a story", "i want to write a story",
-            "i want to generate a story", "i want to make a story", "i want to start a story",
-            "i want to write", "i want to create", "i want to generate", "i want to make",
-            "i want to begin", "i want to start", "i want to write a plot", "i want to write a narrative",
-            "i want to write a story idea", "i want to write a story prompt", "i want to write a story concept",
-            "let's create a story", "let's write a story", "let's generate a story", "let's make a story",
-            "let's start a story", "let's write a plot", "let's write a narrative",
-            "let's do it","ready", "i want to try", "i am ready", "redy", "im ready", "i think i am ready", "i think im ready", 
-            "good to go", "start a story", "begin a story", "write me a story",
-            
-            # Add new keywords for examples
-            "example", "sample", "show me", "give me an example", "give me a sample", 
-            "can you show", "can i see", "give me the example", "show example",
-            "demo", "try it", "try out", "let's try", "let me try"
-        ]
+        # Keyword tables are shared with the compiled intent router
+        self._faq_patterns = FAQ_PATTERNS
+        self._story_intent_keywords = FAQ_STORY_INTENT_KEYWORDS
+        self._genre_keywords = FAQ_GENRE_SELECTION_KEYWORDS
 
-        # Keywords for specific genre selection (indicating story creation intent)
-        self._genre_keywords = [
-            "fiction", "fantasy", "sci-fi", "science fiction", "mystery", "thriller",
-            "horror", "romance", "adventure", "historical", "western", 
-            "comedy", "drama", "novel", "story about", "cyberpunk", "action", "fairy tale",
-            "myth", "legend", "crime", "detective", "dystopian", "utopian", "paranormal",
-            "western"
-        ]
+        # AI fallback answers, keyed by normalized query (PLOTBUDDY_FAQ_CACHE_SIZE/_TTL/_STALE_TTL)
+        self._answer_cache = ResponseCache.from_env("PLOTBUDDY_FAQ_CACHE", refresher=_refresh_in_background)
+
+        # Per-user conversation context shared across workers (PLOTBUDDY_SESSION_URL)
+        self._sessions = get_session_state()
 
         logger.info("FAQAgent initialized.")
 
+    @instrument_agent("faq")
     def process(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """Answer from the FAQ rules when one matches (`match`), otherwise with the model (`answer`)."""
+        response = self.match(request, context)
+        return response if response is not None else self._answer(request)
+
+    def match(self, request: ToolRequest, context: dict = None) -> Optional[ToolResponse]:
+        """
+        Static FAQ answers and story-intent redirects. Keyword matches only,
+        never a model call; None when no rule matches.
+        """
         message_lower = request.input.lower().strip()
+        hits = scan_intents(message_lower)
 
         # 1. Handle 'help'
         if message_lower in ["help", "/help"]:
+            record_route("faq_static")
             return ToolResponse(success=True, output=FAQ_RESPONSES["HELP_MESSAGE"], message="")
 
         # 2. Handle 'what genres', 'genre', etc.
-        if "genre" in message_lower or "genres" in message_lower:
+        if hits.any("faq_genre"):
+            record_route("faq_static")
             return ToolResponse(success=True, output=FAQ_RESPONSES["GENRES_MESSAGE"], message="")
 
         # 3. Handle 'price', 'pricing', 'cost', etc.
-        if any(word in message_lower for word in ["price", "pricing", "cost", "subscription"]):
+        if hits.any("faq_pricing"):
+            record_route("faq_static")
             return ToolResponse(success=True, output=FAQ_RESPONSES["PRICING_MESSAGE"], message="")
 
         # 4. Handle 'how it works', 'features', etc.
-        if any(word in message_lower for word in [
-            "how it works", "how does plotbuddy work", "features", "about plotbuddy", "what can you do", "what is plotbuddy"
-        ]):
+        if hits.any("faq_how_it_works"):
+            record_route("faq_static")
             return ToolResponse(success=True, output=FAQ_RESPONSES["HOW_IT_WORKS_MESSAGE"], message="")
 
         # 5. Pattern matching for other FAQs
         for category, pattern in self._faq_patterns.items():
-            if any(kw in message_lower for kw in pattern["keywords"]):
+            if hits.any(f"faq:{category}"):
                 logger.info(f"FAQ pattern matched: {category} for '{message_lower}'")
+                record_route("faq_static")
                 return ToolResponse(success=True, output=FAQ_RESPONSES.get(pattern["response_key"], "Sorry, I don't have an answer for that."), message="")
 
         # 6. Genre keyword check (for story creation intent)
-        if any(genre.lower() in message_lower for genre in self._genre_keywords):
-            detected_genre = next((genre for genre in self._genre_keywords if genre.lower() in message_lower), "that")
+        if hits.any("faq_genre_selection"):
+            detected_genre = hits.first("faq_genre_selection") or "that"
             logger.info(f"Genre keyword detected: '{message_lower}'")
-            return ToolResponse.success(
-                f"Great! Let's create a story in the {detected_genre} genre. Taking you to the story creator now.",
+            record_route("redirect")
+            return ToolResponse(
+                success=True,
+                output=f"Great! Let's create a story in the {detected_genre} genre. Taking you to the story creator now.",
                 message="REDIRECT_TO_STORY_CREATOR_FORCE"
             )
 
         # 7. Story intent check
-        if any(keyword in message_lower for keyword in self._story_intent_keywords):
+        if hits.any("faq_story_intent"):
             logger.info(f"Story intent keyword detected: '{message_lower}'")
+            record_route("redirect")
             context = request.context or {}
-            redirect_attempts = context.get("redirect_attempts", 0)
+            # Redirect attempts are kept in session state so they survive across workers
+            redirect_attempts = context.get("redirect_attempts", 0) or self._session_redirect_attempts(request.user_id)
             if redirect_attempts > 0:
-                return ToolResponse.success(
-                    "I'm taking you to the story creator now! You'll be able to select your genre, mood, and length there.",
+                return ToolResponse(
+                    success=True,
+                    output="I'm taking you to the story creator now! You'll be able to select your genre, mood, and length there.",
                     message="REDIRECT_TO_STORY_CREATOR_FORCE"
                 )
             else:
                 new_context = dict(context)
                 new_context["redirect_attempts"] = 1
                 request.context = new_context
-                return ToolResponse.success(
-                    "Great! Let's create your story.",
+                self._record_redirect_attempt(request.user_id)
+                return ToolResponse(
+                    success=True,
+                    output="Great! Let's create your story.",
                     message="REDIRECT_TO_STORY_CREATOR"
                 )
 
-        # 8. Generative AI Fallback for Unmatched Queries
+        return None
+
+    @instrument_agent("faq")
+    def answer(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """Answer a query no FAQ rule matched: a (cached) model answer, else the default message."""
+        return self._answer(request)
+
+    def _answer(self, request: ToolRequest) -> ToolResponse:
+        message_lower = request.input.lower().strip()
+
+        # 8. Generative AI Fallback for Unmatched Queries (answers are cached by normalized query)
         try:
-            if hasattr(client, "GOOGLE_API_KEY") and client.GOOGLE_API_KEY:
-                prompt = self._construct_ai_prompt(request.input)
-                llm_response = self.run(prompt=prompt)
-                ai_response = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
+            if not message_lower:
+                logger.info("Empty FAQ query; skipping AI response generation.")
+            elif os.getenv("GOOGLE_API_KEY"):
+                ai_response, source = self._answer_cache.lookup(
+                    normalize_query(request.input),
+                    lambda: self._generate_ai_answer(request.input)
+                )
                 if ai_response:
-                    logger.info(f"FAQAgent generated AI response for '{request.input}': {ai_response}")
-                    return ToolResponse.success(ai_response)
+                    logger.info("FAQAgent generated AI response", extra={"event": "faq_ai_response",
+                                                                          "query": request.input, "output": ai_response})
+                    record_route("faq_llm" if source == "computed" else "faq_cached")
+                    return ToolResponse(success=True, output=ai_response)
                 else:
                     logger.warning(f"AI response for '{request.input}' was empty or malformed.")
             else:
                 logger.warning("No Google API key available for AI response generation. Falling back to default message.")
+        except OverloadedError as e:
+            logger.warning(f"Skipping AI FAQ response for '{request.input}': {e}")
+            record_route("faq_fallback")
+            annotate(fallback_reason="overloaded")
+            return ToolResponse(success=True, output=FAQ_RESPONSES["DEFAULT_FALLBACK"], degraded=True)
         except Exception as e:
             logger.exception(f"Error generating AI FAQ response for '{request.input}': {e}")
+            record_route("faq_fallback")
+            annotate(fallback_reason=classify_error(e))
             return ToolResponse.error("Sorry, our AI service is temporarily unavailable. Please try again later.")
 
         # 9. Final Fallback
         logger.info(f"FAQAgent could not match or generate AI response for query '{request.input}'. Returning fallback message.")
-        return ToolResponse.success(FAQ_RESPONSES["DEFAULT_FALLBACK"])
+        record_route("faq_fallback")
+        annotate(fallback_reason="no_match")
+        return ToolResponse(success=True, output=FAQ_RESPONSES["DEFAULT_FALLBACK"])
+
+    def _session_redirect_attempts(self, user_id: str) -> int:
+        try:
+            return int(self._sessions.get(user_id, "redirect_attempts", 0))
+        except Exception as e:
+            logger.warning(f"Session state unavailable, treating as first redirect for {user_id}: {e}")
+            return 0
+
+    def _record_redirect_attempt(self, user_id: str) -> None:
+        try:
+            self._sessions.incr(user_id, "redirect_attempts")
+        except Exception as e:
+            logger.warning(f"Could not record redirect attempt for {user_id}: {e}")
+
+    def _generate_ai_answer(self, user_query: str) -> Optional[str]:
+        """Ask the model for an answer to an unmatched query."""
+        prompt = self._construct_ai_prompt(user_query)
+        return generate_text(self.model, prompt)
+
+    def answer_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the AI fallback answer cache."""
+        return self._answer_cache.stats()
+
+    async def process_async(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """Async variant of `process`; the AI fallback runs on the bounded LLM executor."""
+        return await run_blocking(self.process, request, context)
 
     def _construct_ai_prompt(self, user_query: str) -> str:
         """Constructs the prompt for the generative AI model."""
@@ -450,10 +477,8 @@ if __name__ == "__main__":
     ToolRequest = MockToolRequest
     ToolResponse = MockToolResponse
 
-    # Mock the client.GOOGLE_API_KEY for testing purposes
-    class MockClient:
-        GOOGLE_API_KEY = "MOCKED_API_KEY" # Set to a non-empty string to enable AI path
-    client = MockClient()
+    # A non-empty key enables the AI path
+    os.environ.setdefault("GOOGLE_API_KEY", "MOCKED_API_KEY")
 
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
@@ -1,30 +1,28 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
-
 import logging
+import os
 from datetime import datetime
 try:
     from zoneinfo import ZoneInfo  # Python 3.9+
 except ImportError:
     from pytz import timezone as ZoneInfo
 
-from typing import ClassVar, Set, Any, Dict, Optional
+from typing import ClassVar, FrozenSet, Any, Dict, Optional
 
+from ..config.environment import load_environment
 from ..models.schemas import ToolRequest, ToolResponse
 from google.adk.agents import LlmAgent
+from ..llm import run_blocking, generate_text, OverloadedError
+from ..observability.metrics import instrument_agent, record_route
+from .intent import GREETING_KEYWORDS, scan_intents
 
 from multi_tool_agent.config.response import GREETING_RESPONSES
 
+load_environment()
+
 logger = logging.getLogger(__name__)
 
 class GreetingAgent(LlmAgent):
-    GREETING_KEYWORDS: ClassVar[Set[str]] = {
-        "hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening",
-        "howdy", "hola", "welcome", "plotbuddy", "plot buddy", "start", "let's start",
-        "how are you", "how's it going", "what's up", "sup"
-    }
+    GREETING_KEYWORDS: ClassVar[FrozenSet[str]] = GREETING_KEYWORDS
 
     def __init__(self, model: str = "gemini-1.5-flash"):
         super().__init__(
@@ -35,22 +33,27 @@ class GreetingAgent(LlmAgent):
         )
         logger.info("GreetingAgent initialized.")
 
+    @instrument_agent("greeting")
     def process(self, request: ToolRequest, context: dict = None) -> ToolResponse:
         message_lower = str(request.input).lower().strip()
 
         # If the message is a greeting or small talk, handle it
-        if any(kw in message_lower for kw in self.GREETING_KEYWORDS):
+        if scan_intents(message_lower).any("greeting"):
             # Try LLM-based greeting if possible
+            degraded = False
             try:
-                if hasattr(self, "run") and callable(self.run):
+                if os.getenv("GOOGLE_API_KEY"):
                     prompt = (
                         "You are PlotBuddy, a friendly creative writing assistant. "
                         "Greet the user warmly and encourage them to start writing a story."
                     )
-                    llm_response = self.run(prompt=prompt)
-                    output = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
+                    output = generate_text(self.model, prompt)
                     if output:
+                        record_route("greeting_llm")
                         return ToolResponse(success=True, output=output, message="Greeting generated by LLM.")
+            except OverloadedError as e:
+                logger.warning(f"Serving static greeting: {e}")
+                degraded = True
             except Exception as e:
                 logger.error(f"Error generating greeting with ADK LlmAgent: {e}")
 
@@ -69,11 +72,16 @@ class GreetingAgent(LlmAgent):
                 greeting = GREETING_RESPONSES.get("afternoon")
             else:
                 greeting = GREETING_RESPONSES.get("evening")
-            return ToolResponse(success=True, output=greeting, message="Fallback greeting.")
+            record_route("greeting_fallback")
+            return ToolResponse(success=True, output=greeting, message="Fallback greeting.", degraded=degraded)
 
         # If not a greeting, let orchestrator or other agents handle
         return ToolResponse(success=False, output=None, message="Not a greeting message.")
 
+    async def process_async(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """Async variant of `process`; the LLM greeting runs on the bounded LLM executor."""
+        return await run_blocking(self.process, request, context)
+
 # --- For local testing purposes ---
 if __name__ == "__main__":
     from pydantic import BaseModel
@@ -97,11 +105,6 @@ if __name__ == "__main__":
     ToolRequest = MockToolRequest
     ToolResponse = MockToolResponse
 
-    # Mock the 'client' module and its GOOGLE_API_KEY
-    class MockClient:
-        def __init__(self, api_key: Optional[str]):
-            self.GOOGLE_API_KEY = api_key
-
     # Temporarily define necessary config responses for local testing
     # In a real setup, these would be imported from multi_tool_agent.config.response
     GREETING_RESPONSES = {
@@ -116,7 +119,7 @@ if __name__ == "__main__":
 
     # --- Test 1: With a mock API key to enable LLM calls ---
     print("--- Test Set 1: With Mock API Key (LLM Enabled) ---")
-    client = MockClient(api_key="MOCKED_API_KEY_FOR_TESTING_123") # Enable LLM path
+    os.environ["GOOGLE_API_KEY"] = "MOCKED_API_KEY_FOR_TESTING_123"  # Enable LLM path
     agent = GreetingAgent()
 
     test_queries_llm_enabled = [
@@ -148,7 +151,7 @@ if __name__ == "__main__":
 
     # --- Test 2: Without a mock API key (LLM Disabled, only fallbacks) ---
     print("\n--- Test Set 2: Without Mock API Key (LLM Disabled, Fallback Only) ---")
-    client = MockClient(api_key=None) # Disable LLM path
+    os.environ.pop("GOOGLE_API_KEY", None)  # Disable LLM path
     agent = GreetingAgent()
 
     test_queries_llm_disabled = [
@@ -0,0 +1,275 @@
+"""
+PlotBuddy Intent Router
+Keyword tables for every agent, compiled once into a single Aho-Corasick
+automaton so a message is scanned in one pass no matter how many keywords
+the tables hold.
+"""
+
+import logging
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Orchestrator: direct redirects (OrchestratorAgent.process) ---
+STORY_REDIRECT_KEYWORDS = (
+    "create story", "write story", "make story", "story creation", "new story", "generate story"
+)
+
+SUPPORTED_GENRE_KEYWORDS = (
+    "mystery", "scifi", "fantasy", "romance", "adventure", "horror",
+    "comedy", "thriller", "historical", "western", "cyberpunk"
+)
+
+# --- Orchestrator: agent routing (OrchestratorAgent._route_message) ---
+ROUTE_FAQ_KEYWORDS = (
+    "help", "commands", "guide", "instruction", "price", "cost", "subscription", "pricing", "fee",
+    "what genre", "available genre", "list of genre", "types of stories", "what stories",
+    "how does it work", "how it works", "process", "hour", "time", "when are you open",
+    "contact", "support", "email", "help me", "faq"
+)
+
+ROUTE_GREETING_KEYWORDS = ("hi", "hello", "hey", "good morning", "good afternoon", "good evening")
+
+ROUTE_STORY_KEYWORDS = (
+    "create story", "write story", "generate story", "new story", "story", "plot",
+    "character", "world building", "narrative", "novel", "book", "tale", "story idea",
+    "story creation", "make story", "develop story", "build story", "storytelling",
+    "story prompt", "story concept", "story outline", "story draft", "story structure",
+    "story arc", "story theme", "story genre", "story setting", "story character",
+    "story conflict", "story resolution", "story climax", "story beginning",
+    "story middle", "story end", "story plot twist", "story character development",
+    "story dialogue", "story scene", "story chapter", "story summary", "story analysis",
+    "story feedback", "story review", "story brainstorming", "story inspiration",
+    "story writing", "story editing", "story publishing", "story sharing", "story collaboration",
+    "story workshop", "story community", "story writing tips", "story writing advice",
+    "story writing techniques", "story writing prompts", "story writing exercises"
+)
+
+# --- FAQAgent.process ---
+FAQ_GENRE_KEYWORDS = ("genre", "genres")
+
+FAQ_PRICING_KEYWORDS = ("price", "pricing", "cost", "subscription")
+
+FAQ_HOW_IT_WORKS_KEYWORDS = (
+    "how it works", "how does plotbuddy work", "features", "about plotbuddy", "what can you do", "what is plotbuddy"
+)
+
+# Broader FAQ categories, checked in this order
+FAQ_PATTERNS = {
+    "help": {
+        "keywords": ["help", "instructions", "guide", "commands", "how to use", "options", "features"],
+        "response_key": "HELP_MESSAGE"
+    },
+    "genre": {
+        "keywords": ["genre", "genres", "what genres", "story types", "types of stories",
+                     "story genres", "available genres", "kind of stories", "what stories"],
+        "response_key": "GENRES_MESSAGE"
+    },
+    "pricing": {
+        "keywords": ["price", "prices", "pricing", "cost", "how much", "payment",
+                     "subscription", "plan", "fee", "charge", "money", "dollar"],
+        "response_key": "PRICING_MESSAGE"
+    },
+    "contact": {
+        "keywords": ["contact", "support", "email", "phone", "reach out", "support team",
+                     "help desk", "customer service", "tech support"],
+        "response_key": "CONTACT_MESSAGE"
+    },
+    "hours": {
+        "keywords": ["hour", "hours", "business hours", "open", "when", "availability",
+                     "support hours", "operating hours", "available time", "schedule"],
+        "response_key": "HOURS_MESSAGE"
+    },
+    "how_it_works": {
+        "keywords": ["how it works", "how does it work", "process", "explain", "details",
+                     "steps", "guide me", "tutorial", "instructions", "workflow", "how it works",
+                     "how does plotbuddy work", "features", "about plotbuddy", "what can you do",
+                     "what is plotbuddy", "what is plot buddy", "how to use plotbuddy",
+                     "how to use plot buddy", "plotbuddy features", "plot buddy features",
+                     "plotbuddy overview", "plot buddy overview", "plotbuddy guide", "plot buddy guide"],
+        "response_key": "HOW_IT_WORKS_MESSAGE"
+    },
+    "using_plotbuddy": {
+        "keywords": ["how to use plotbuddy", "using plotbuddy", "plotbuddy guide", "navigating plotbuddy"],
+        "response_key": "USING_PLOTBUDDY_MESSAGE"
+    }
+}
+
+# Keywords for detecting story creation intent
+FAQ_STORY_INTENT_KEYWORDS = [
+    "let's start", "i'm ready", "create story", "write story", "make story",
+    "start writing", "begin story", "let's write", "write a story", "generate story",
+    "new story", "story idea", "plot", "narrative", "story prompt", "story generation",
+    "story creation", "story writing", "story prompt", "story concept", "create a story",
+    "write a plot", "write a narrative", "write a story idea", "write a story prompt",
+    "write a story concept", "i want to create a story", "i want to write a story",
+    "i want to generate a story", "i want to make a story", "i want to start a story",
+    "i want to write", "i want to create", "i want to generate", "i want to make",
+    "i want to begin", "i want to start", "i want to write a plot", "i want to write a narrative",
+    "i want to write a story idea", "i want to write a story prompt", "i want to write a story concept",
+    "let's create a story", "let's write a story", "let's generate a story", "let's make a story",
+    "let's start a story", "let's write a plot", "let's write a narrative",
+    "let's do it", "ready", "i want to try", "i am ready", "redy", "im ready", "i think i am ready", "i think im ready",
+    "good to go", "start a story", "begin a story", "write me a story",
+
+    # Add new keywords for examples
+    "example", "sample", "show me", "give me an example", "give me a sample",
+    "can you show", "can i see", "give me the example", "show example",
+    "demo", "try it", "try out", "let's try", "let me try"
+]
+
+# Keywords for specific genre selection (indicating story creation intent)
+FAQ_GENRE_SELECTION_KEYWORDS = [
+    "fiction", "fantasy", "sci-fi", "science fiction", "mystery", "thriller",
+    "horror", "romance", "adventure", "historical", "western",
+    "comedy", "drama", "novel", "story about", "cyberpunk", "action", "fairy tale",
+    "myth", "legend", "crime", "detective", "dystopian", "utopian", "paranormal",
+    "western"
+]
+
+# --- GreetingAgent.process ---
+GREETING_KEYWORDS = frozenset({
+    "hello", "hi", "hey", "greetings", "good morning", "good afternoon", "good evening",
+    "howdy", "hola", "welcome", "plotbuddy", "plot buddy", "start", "let's start",
+    "how are you", "how's it going", "what's up", "sup"
+})
+
+# --- ProfileAgent.process ---
+PROFILE_COACHING_KEYWORDS = ("stuck", "advice", "help", "idea", "suggestion", "feedback")
+
+
+def _build_intent_tables() -> Dict[str, Sequence[str]]:
+    tables = {
+        "story_redirect": STORY_REDIRECT_KEYWORDS,
+        "supported_genre": SUPPORTED_GENRE_KEYWORDS,
+        "route_faq": ROUTE_FAQ_KEYWORDS,
+        "route_greeting": ROUTE_GREETING_KEYWORDS,
+        "route_story": ROUTE_STORY_KEYWORDS,
+        "faq_genre": FAQ_GENRE_KEYWORDS,
+        "faq_pricing": FAQ_PRICING_KEYWORDS,
+        "faq_how_it_works": FAQ_HOW_IT_WORKS_KEYWORDS,
+        "faq_story_intent": FAQ_STORY_INTENT_KEYWORDS,
+        "faq_genre_selection": FAQ_GENRE_SELECTION_KEYWORDS,
+        "greeting": sorted(GREETING_KEYWORDS),
+        "profile_coaching": PROFILE_COACHING_KEYWORDS,
+    }
+    for category, pattern in FAQ_PATTERNS.items():
+        tables[f"faq:{category}"] = pattern["keywords"]
+    return tables
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting every keyword that occurs in a text."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+
+        for keyword in set(keywords):
+            if keyword:
+                self._add(keyword)
+        self._link()
+
+    def _add(self, keyword: str) -> None:
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = nxt
+        self._output[node] = self._output[node] + (keyword,)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> Set[str]:
+        """Return the set of keywords that occur anywhere in `text`."""
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Set[str] = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class IntentHits:
+    """Which intent tables matched one message, and their earliest keyword in table order."""
+
+    __slots__ = ("_first_index", "_tables")
+
+    def __init__(self, first_index: Dict[str, int], tables: Dict[str, Tuple[str, ...]]):
+        self._first_index = first_index
+        self._tables = tables
+
+    def any(self, table: str) -> bool:
+        """True if any keyword of `table` occurs in the message."""
+        return table in self._first_index
+
+    def first(self, table: str) -> Optional[str]:
+        """The first keyword of `table`, in table order, that occurs in the message."""
+        index = self._first_index.get(table)
+        return None if index is None else self._tables[table][index]
+
+    @property
+    def tables(self) -> FrozenSet[str]:
+        return frozenset(self._first_index)
+
+
+class IntentRouter:
+    """Scans a message once against every intent table."""
+
+    def __init__(self, tables: Dict[str, Sequence[str]]):
+        self._tables = {name: tuple(keywords) for name, keywords in tables.items()}
+        # keyword -> [(table, position of its first occurrence in that table)]
+        self._postings: Dict[str, List[Tuple[str, int]]] = {}
+        for name, keywords in self._tables.items():
+            for index, keyword in enumerate(keywords):
+                postings = self._postings.setdefault(keyword, [])
+                if all(table != name for table, _ in postings):
+                    postings.append((name, index))
+        self._automaton = KeywordAutomaton(self._postings)
+        self.scan = lru_cache(maxsize=2048)(self._scan)
+        logger.info(f"IntentRouter compiled {len(self._postings)} keywords from {len(self._tables)} tables.")
+
+    def _scan(self, message_lower: str) -> IntentHits:
+        first_index: Dict[str, int] = {}
+        for keyword in self._automaton.find_all(message_lower):
+            for table, index in self._postings[keyword]:
+                if index < first_index.get(table, index + 1):
+                    first_index[table] = index
+        return IntentHits(first_index, self._tables)
+
+    @property
+    def tables(self) -> Dict[str, Tuple[str, ...]]:
+        return self._tables
+
+
+intent_router = IntentRouter(_build_intent_tables())
+
+
+def scan_intents(message_lower: str) -> IntentHits:
+    """
+    Return the intent hits for an already lowercased and stripped message.
+    Results are cached, so agents handling the same message share one scan.
+    """
+    return intent_router.scan(message_lower)
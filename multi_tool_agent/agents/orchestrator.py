@@ -4,33 +4,32 @@ Centralizes agent initialization and coordination
 """
 
 import logging
-from typing import Optional, Dict, Any
-import google.generativeai as genai
+import os
+from typing import Optional, Dict, Any, Tuple
 import re
 
 from google.adk.agents import LlmAgent
 
 logger = logging.getLogger(__name__)
 
+from ..config.environment import load_environment
 from ..models.schemas import ToolRequest, ToolResponse
+from ..llm import classify_error, count_model_calls, deadline_scope, run_blocking
+from ..observability.metrics import instrument_agent, metrics, record_route
+from ..observability.tracing import annotate, span
 from .greeting import GreetingAgent
 from .faq import FAQAgent
 from .profile import ProfileAgent
 from .story import StoryAgent
+from .intent import IntentHits, scan_intents
+from .pipeline import PIPELINE
 
-try:
-    from . import client
-    if hasattr(client, 'GOOGLE_API_KEY') and client.GOOGLE_API_KEY:
-        genai.configure(api_key=client.GOOGLE_API_KEY)
-        HAS_LLM_ACCESS = True
-        logger.info("Google Generative AI API configured successfully in Orchestrator module.")
-    else:
-        HAS_LLM_ACCESS = False
-        logger.warning("Google API key not found (via client), LLM features will be limited.")
-except ImportError:
-    client = None
-    HAS_LLM_ACCESS = False
-    logger.warning("Client module import failed, LLM features will be limited (in Orchestrator module).")
+load_environment()
+# The SDK is configured by the model client pool (llm.pool) only; configuring it here would
+# reset the pool's transport and endpoint behind its back
+HAS_LLM_ACCESS = bool(os.getenv("GOOGLE_API_KEY"))
+if not HAS_LLM_ACCESS:
+    logger.warning("Google API key not found, LLM features will be limited.")
 
 from multi_tool_agent.config.response import GREETING_RESPONSES, FAQ_RESPONSES, STORY_TEMPLATES, ERROR_MESSAGES
 
@@ -47,6 +46,22 @@ LENGTH_KEYWORDS = [
     "short", "medium", "long"
 ]
 
+ORCHESTRATOR_ANSWERS = metrics.counter(
+    "plotbuddy_orchestrator_answers_total", "Messages answered by the orchestrator, by pipeline stage.", ("stage",))
+MODEL_CALLS_PER_REQUEST = metrics.histogram(
+    "plotbuddy_model_calls_per_request", "Model calls made to answer one message, by the pipeline stage that answered.",
+    ("stage",), buckets=(0, 1, 2, 3, 4, 6, 8))
+
+
+class _Decision:
+    """What the pipeline has learned about one message so far."""
+
+    def __init__(self, message: str, hits: IntentHits):
+        self.message = message
+        self.hits = hits
+        self.agent: Any = None  # set by the route stage
+
+
 def extract_param(keywords, message):
     for word in keywords:
         if word in message:
@@ -57,14 +72,21 @@ class OrchestratorAgent:
     """
     Manages the initialization and routing of messages to different PlotBuddy agents.
     """
-    def __init__(self, model_name="gemini-2.0-flash"):
+    def __init__(self, model_name="gemini-2.0-flash", registry=None):
         self.model_name = model_name
         logger.info(f"OrchestratorAgent initialized with model: {model_name}")
 
-        self.greeting_agent = GreetingAgent(model="gemini-1.5-flash")
-        self.faq_agent = FAQAgent(model_name="gemini-1.5-flash")
-        self.profile_agent = ProfileAgent(model_name="gemini-1.5-flash")
-        self.story_agent = StoryAgent(model_name="gemini-2.0-flash")
+        # Share sub-agents with the rest of the process when built by the registry
+        if registry is not None:
+            self.greeting_agent = registry.greeting_agent
+            self.faq_agent = registry.faq_agent
+            self.profile_agent = registry.profile_agent
+            self.story_agent = registry.story_agent
+        else:
+            self.greeting_agent = GreetingAgent(model="gemini-1.5-flash")
+            self.faq_agent = FAQAgent(model_name="gemini-1.5-flash")
+            self.profile_agent = ProfileAgent(model_name="gemini-1.5-flash")
+            self.story_agent = StoryAgent(model_name="gemini-2.0-flash")
         self.llm_agent = LlmAgent(
             name="llm_agent",
             model="gemini-1.5-flash",
@@ -73,179 +95,218 @@ class OrchestratorAgent:
         )
 
         self.default_agent = self.greeting_agent
+        self._pipeline = [(stage, getattr(self, f"_stage_{stage.name}")) for stage in PIPELINE]
 
     def _route_message(self, request: ToolRequest) -> Any:
-        """Route the message to the appropriate agent."""
+        """Route the message to the appropriate agent; the matching rule is set on the current span."""
         if not isinstance(request.input, str):
             logger.info("Structured input detected, routing to StoryAgent.")
+            annotate(rule="structured_input")
             return self.story_agent
 
-        message_lower = request.input.lower().strip()
+        hits = scan_intents(request.input.lower().strip())
 
-        faq_patterns = [
-            "help", "commands", "guide", "instruction", "price", "cost", "subscription", "pricing", "fee",
-            "what genre", "available genre", "list of genre", "types of stories", "what stories",
-            "how does it work", "how it works", "process", "hour", "time", "when are you open",
-            "contact", "support", "email", "help me", "faq"
-        ]
-        if any(keyword in message_lower for keyword in faq_patterns):
+        if hits.any("route_faq"):
             logger.info("✓ FAQ match → FAQAgent")
+            annotate(rule="route_faq")
             return self.faq_agent
 
-        greeting_keywords = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
-        if any(keyword in message_lower for keyword in greeting_keywords):
+        if hits.any("route_greeting"):
             logger.info("✓ Greeting match → GreetingAgent")
+            annotate(rule="route_greeting")
             return self.greeting_agent
 
-        story_keywords = ["create story", "write story", "generate story", "new story", "story", "plot", 
-                          "character", "world building", "narrative", "novel", "book", "tale", "story idea",
-                          "story creation", "make story", "develop story", "build story", "storytelling",
-                          "story prompt", "story concept", "story outline", "story draft", "story structure",
-                          "story arc", "story theme", "story genre", "story setting", "story character",
-                          "story conflict", "story resolution", "story climax", "story beginning", 
-                          "story middle", "story end", "story plot twist", "story character development",
-                          "story dialogue", "story scene", "story chapter", "story summary", "story analysis",
-                          "story feedback", "story review", "story brainstorming", "story inspiration",
-                          "story writing", "story editing", "story publishing", "story sharing", "story collaboration",
-                          "story workshop", "story community", "story writing tips", "story writing advice",
-                          "story writing techniques", "story writing prompts", "story writing exercises"]
-        if any(keyword in message_lower for keyword in story_keywords):
+        if hits.any("route_story"):
             logger.info("✓ Story creation match → StoryAgent")
+            annotate(rule="route_story")
             return self.story_agent
             
         logger.info("No specific agent match, routing to default (FAQAgent).")
+        annotate(rule="default")
         return self.faq_agent
 
     # --- FIX: RENAMED back to 'process' from 'process_message' ---
     # The signature (user_id, request, context) remains the same.
+    @instrument_agent("orchestrator")
     def process(self, request: ToolRequest, context: dict = None) -> ToolResponse:
         """
-        Process an incoming message and route it to the appropriate agent.
+        Process an incoming message through the decision pipeline: every local
+        match (redirects, static FAQ answers, routing) is tried before the
+        first stage that may call a model.
+
+        The request deadline (context["deadline"], else the current one set by
+        the API server) is passed to every agent in the cascade, both in their
+        context and as the current deadline their model calls retry within.
         """
-        logger.info(f"Orchestrator received and processing: '{request.input}'")
-        if context is None:
-            context = {}
+        context = dict(context or {})
+        with deadline_scope(context.get("deadline")) as deadline:
+            if deadline is not None:
+                context["deadline"] = deadline
+            return self._process(request, context)
 
+    def _process(self, request: ToolRequest, context: dict) -> ToolResponse:
+        logger.info(f"Orchestrator received and processing: '{request.input}'")
+        with count_model_calls() as calls:
+            response, answered_by = self._run_pipeline(request, context)
+        ORCHESTRATOR_ANSWERS.inc(stage=answered_by)
+        MODEL_CALLS_PER_REQUEST.observe(calls.calls, stage=answered_by)
+        annotate(answered_by=answered_by, model_calls=calls.calls, model_attempts=calls.attempts)
+        logger.info(f"Answered by stage '{answered_by}' after {calls.calls} model call(s).")
+        return response
+
+    def _run_pipeline(self, request: ToolRequest, context: dict) -> Tuple[ToolResponse, str]:
+        """
+        Try the stages of the decision pipeline (see agents.pipeline) in order
+        until one answers. Returns the response and the stage that gave it.
+        """
         message_lower = request.input.lower().strip()
+        annotate(input_chars=len(message_lower))
+        decision = _Decision(message_lower, scan_intents(message_lower))
+        try:
+            for stage, handler in self._pipeline:
+                with span(f"stage.{stage.name}", stage=stage.name, cost=stage.cost, agent=stage.agent) as stage_span:
+                    response = handler(request, context, decision)
+                    stage_span.set(answered=response is not None)
+                if response is not None:
+                    return response, stage.name
 
-        # 1. Story creation intent (redirect)
-        story_creation_initial_keywords = [
-            "create story", "write story", "make story", "story creation", "new story", "generate story"
-        ]
-        if any(keyword in message_lower for keyword in story_creation_initial_keywords) or message_lower == "story":
+            # Final fallback
+            annotate(fallback_reason="unhandled")
+            return ToolResponse(
+                success=False,
+                output=None,
+                message="I'm here to help! Could you please rephrase your question or let me know what kind of story you'd like to create?"
+            ), "unhandled"
+
+        except Exception as e:
+            return self._error_fallback(request, e), "error"
+
+    # --- Local stages: keyword and pattern matches only ---
+
+    def _stage_story_redirect(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        if decision.hits.any("story_redirect") or decision.message == "story":
+            record_route("redirect")
             return ToolResponse(
                 success=True,
                 output=None,
                 message="REDIRECT_TO_STORY_CREATOR"
             )
+        return None
+
+    def _stage_supported_genre(self, request: ToolRequest, context: dict,
+                               decision: _Decision) -> Optional[ToolResponse]:
+        genre = decision.hits.first("supported_genre")
+        if genre:
+            record_route("redirect")
+            annotate(genre=genre)
+            return ToolResponse(
+                success=True,
+                output=(
+                    f"Fantastic choice! 🌟 '{genre.title()}' stories are full of adventure and imagination. "
+                    f"Let's get started—I'm sending you to the story creator!"
+                ),
+                message="REDIRECT_TO_STORY_CREATOR"
+            )
+        return None
 
-        # 2. Supported genre: respond and redirect
-        for genre in [
-            "mystery", "scifi", "fantasy", "romance", "adventure", "horror",
-            "comedy", "thriller", "historical", "western", "cyberpunk"
-        ]:
-            if genre in message_lower:
-                return ToolResponse(
-                    success=True,
-                    output=(
-                        f"Fantastic choice! 🌟 '{genre.title()}' stories are full of adventure and imagination. "
-                        f"Let's get started—I'm sending you to the story creator!"
-                    ),
-                    message="REDIRECT_TO_STORY_CREATOR"
-                )
-
-        try:
-            # FAQAgent first
-            faq_response = self.faq_agent.process(request, context)
-            if faq_response.success:
-                return faq_response
-
-            # GreetingAgent for greetings and small talk
-            greeting_response = self.greeting_agent.process(request, context)
-            if greeting_response.success:
-                return greeting_response
+    def _stage_faq_match(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        return self.faq_agent.match(request, context)
 
-            agent_to_use = self._route_message(request)
-            logger.info(f"Routing to agent: {agent_to_use.__class__.__name__}")
+    def _stage_route(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        decision.agent = self._route_message(request)
+        annotate(routed_to=type(decision.agent).__name__)
+        logger.info(f"Routing to agent: {decision.agent.__class__.__name__}")
+        return None
 
-            output = agent_to_use.process(request, context)
+    # --- Model stages: each may make a model call ---
 
-            # If the agent handled the request, return its response
-            if output and output.success:
-                return output
+    def _stage_greeting(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        if not decision.hits.any("greeting"):
+            return None
+        response = self.greeting_agent.process(request, context)
+        return response if response.success else None
 
-            # If FAQAgent didn't handle, try fallback to FAQAgent (if not already tried)
-            if agent_to_use is not self.faq_agent:
-                faq_output = self.faq_agent.process(request, context)
-                if faq_output and faq_output.success:
-                    return faq_output
+    def _stage_story(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        if decision.agent is not self.story_agent:
+            return None
+        response = self.story_agent.process(request, context)
+        return response if response and response.success else None
 
-            # LLM fallback for open-ended queries
-            if hasattr(self, "llm_agent") and self.llm_agent:
-                llm_response = self.llm_agent.process(request, context)
-                if llm_response and getattr(llm_response, "output", None):
-                    return llm_response
+    def _stage_faq_answer(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        response = self.faq_agent.answer(request, context)
+        return response if response.success else None
 
-            # Final fallback
-            return ToolResponse(
-                success=False,
-                output=None,
-                message="I'm here to help! Could you please rephrase your question or let me know what kind of story you'd like to create?"
-            )
+    def _stage_llm_agent(self, request: ToolRequest, context: dict, decision: _Decision) -> Optional[ToolResponse]:
+        # LLM fallback for open-ended queries
+        if hasattr(self, "llm_agent") and self.llm_agent:
+            llm_response = self.llm_agent.process(request, context)
+            if llm_response and getattr(llm_response, "output", None):
+                return llm_response
+        return None
+
+    def _error_fallback(self, request: ToolRequest, e: Exception) -> ToolResponse:
+        """Answer for a message whose pipeline raised: canned replies for common topics."""
+        logger.error(f"Error processing message in Orchestrator's process: {e}", exc_info=True)
+        annotate(fallback_reason=classify_error(e), exception=type(e).__name__)
+        message_lower = request.input.lower().strip()
 
-        except Exception as e:
-            logger.error(f"Error processing message in Orchestrator's process: {e}", exc_info=True)
-            message_lower = request.input.lower().strip()
-
-            # Engaging fallbacks for common topics
-            from multi_tool_agent.config.response import FAQ_RESPONSES
-            if "genre" in message_lower or "genres" in message_lower:
-                # Use LLM for a more engaging, personalized response
-                if hasattr(self, "run"):
-                    prompt = (
-                        "The user is interested in story genres. "
-                        "Respond enthusiastically, suggest a few fun genres, and ask which one they'd like to try. "
-                        "Encourage them to pick a genre to start their story."
-                    )
-                    llm_response = self.run(prompt=prompt + f"\nUser: {request.input}\nAssistant:")
-                    output = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
-                    if output:
-                        return ToolResponse(success=True, output=output, message="GENRES_MESSAGE")
-                # Fallback to static
-                return ToolResponse(success=True, output=FAQ_RESPONSES["GENRES_MESSAGE"], message="")
-
-            if "brainstorm" in message_lower or "idea" in message_lower:
-                if hasattr(self, "run"):
-                    prompt = (
-                        "The user wants to brainstorm story ideas. "
-                        "Ask an engaging follow-up question, suggest creative directions, and keep the conversation going. "
-                        "Be friendly and encouraging."
-                    )
-                    llm_response = self.run(prompt=prompt + f"\nUser: {request.input}\nAssistant:")
-                    output = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
-                    if output:
-                        return ToolResponse(success=True, output=output, message="BRAINSTORM_MESSAGE")
-                return ToolResponse(success=True, output="Let's brainstorm together! Tell me a theme, genre, or idea, and I'll help you get started.", message="BRAINSTORM_MESSAGE")
-            if "price" in message_lower or "pricing" in message_lower or "cost" in message_lower or "subscription" in message_lower:
-                return ToolResponse(
-                    success=True,
-                    output="PlotBuddy offers a free trial and affordable subscription options. Visit the pricing page or ask me for details about our plans!",
-                    message="PRICING_MESSAGE"
+        # Engaging fallbacks for common topics
+        from multi_tool_agent.config.response import FAQ_RESPONSES
+        if "genre" in message_lower or "genres" in message_lower:
+            # Use LLM for a more engaging, personalized response
+            if hasattr(self, "run"):
+                prompt = (
+                    "The user is interested in story genres. "
+                    "Respond enthusiastically, suggest a few fun genres, and ask which one they'd like to try. "
+                    "Encourage them to pick a genre to start their story."
                 )
-            if "help" in message_lower:
-                return ToolResponse(
-                    success=True,
-                    output="I'm here to help! You can ask me to create a story, brainstorm ideas, or learn about genres and features. What would you like to do?",
-                    message="HELP_MESSAGE"
+                llm_response = self.run(prompt=prompt + f"\nUser: {request.input}\nAssistant:")
+                output = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
+                if output:
+                    return ToolResponse(success=True, output=output, message="GENRES_MESSAGE")
+            # Fallback to static
+            return ToolResponse(success=True, output=FAQ_RESPONSES["GENRES_MESSAGE"], message="")
+
+        if "brainstorm" in message_lower or "idea" in message_lower:
+            if hasattr(self, "run"):
+                prompt = (
+                    "The user wants to brainstorm story ideas. "
+                    "Ask an engaging follow-up question, suggest creative directions, and keep the conversation going. "
+                    "Be friendly and encouraging."
                 )
-
-            # Friendly generic fallback
+                llm_response = self.run(prompt=prompt + f"\nUser: {request.input}\nAssistant:")
+                output = getattr(llm_response, "output", None) or getattr(llm_response, "text", None)
+                if output:
+                    return ToolResponse(success=True, output=output, message="BRAINSTORM_MESSAGE")
+            return ToolResponse(success=True, output="Let's brainstorm together! Tell me a theme, genre, or idea, and I'll help you get started.", message="BRAINSTORM_MESSAGE")
+        if "price" in message_lower or "pricing" in message_lower or "cost" in message_lower or "subscription" in message_lower:
             return ToolResponse(
-                success=False,
-                output=None,
-                message="I'm here to help! Could you please rephrase your question or let me know what kind of story you'd like to create?"
+                success=True,
+                output="PlotBuddy offers a free trial and affordable subscription options. Visit the pricing page or ask me for details about our plans!",
+                message="PRICING_MESSAGE"
+            )
+        if "help" in message_lower:
+            return ToolResponse(
+                success=True,
+                output="I'm here to help! You can ask me to create a story, brainstorm ideas, or learn about genres and features. What would you like to do?",
+                message="HELP_MESSAGE"
             )
 
+        # Friendly generic fallback
+        return ToolResponse(
+            success=False,
+            output=None,
+            message="I'm here to help! Could you please rephrase your question or let me know what kind of story you'd like to create?"
+        )
+
+    async def process_async(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """
+        Async variant of `process` for the API server.
+        The agent cascade, including every model call, runs on the bounded
+        LLM executor so the event loop keeps serving other requests.
+        """
+        return await run_blocking(self.process, request, context)
+
     def _detect_story_creation_intent(self, message: str, history: Dict[str, Any]) -> bool:
         """Detect if the user is intending to create or work on a story."""
         faq_indicators = [
@@ -343,4 +404,9 @@ class OrchestratorAgent:
         )
 
 
-orchestrator = OrchestratorAgent()
\ No newline at end of file
+def __getattr__(name):
+    # Module-level `orchestrator` is served from the shared agent registry
+    if name == "orchestrator":
+        from .registry import get_registry
+        return get_registry().orchestrator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+PlotBuddy Orchestrator Pipeline
+The orchestrator's decision pipeline as data: the stages it tries, in
+order, what each matches on and whether it may call a model.
+
+Local stages only match keywords and patterns; model stages may make a
+model call. Every local stage runs before the first model stage is
+considered, so a message answered by a static rule never pays for a model
+call, and an unmatched one makes at most the call of the stage it is
+routed to.
+
+    python -m multi_tool_agent.agents.pipeline   # print the routing table
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from .intent import intent_router
+
+LOCAL = "local"   # keyword and pattern matches only
+MODEL = "model"   # may call a model
+
+
+class Stage(NamedTuple):
+    """One step of the pipeline; OrchestratorAgent handles it in `_stage_<name>`."""
+    name: str
+    cost: str
+    agent: str
+    rule: str
+    tables: Tuple[str, ...] = ()  # intent tables it matches on; "faq:*" stands for every FAQ pattern table
+
+
+PIPELINE: Tuple[Stage, ...] = (
+    Stage("story_redirect", LOCAL, "orchestrator", "message asks to create a story, or is just 'story'",
+          ("story_redirect",)),
+    Stage("supported_genre", LOCAL, "orchestrator", "message names a supported genre", ("supported_genre",)),
+    Stage("faq_match", LOCAL, "faq", "'help', a static FAQ answer, or a genre / story intent redirect",
+          ("faq_genre", "faq_pricing", "faq_how_it_works", "faq:*", "faq_genre_selection", "faq_story_intent")),
+    Stage("route", LOCAL, "orchestrator", "choose the agent for the model stages; never answers",
+          ("route_faq", "route_greeting", "route_story")),
+    Stage("greeting", MODEL, "greeting", "message is a greeting", ("greeting",)),
+    Stage("story", MODEL, "story", "routed to StoryAgent (structured input or story keywords)", ("route_story",)),
+    Stage("faq_answer", MODEL, "faq", "model answer for anything else (cached by normalized query)"),
+    Stage("llm_agent", MODEL, "llm_agent", "open-ended fallback when the FAQ answer failed"),
+)
+
+
+def check_pipeline(stages: Sequence[Stage]) -> None:
+    """Raise ValueError if a local stage comes after a model stage."""
+    seen_model = None
+    for stage in stages:
+        if stage.cost not in (LOCAL, MODEL):
+            raise ValueError(f"Stage {stage.name!r} has unknown cost {stage.cost!r}")
+        if stage.cost == MODEL:
+            seen_model = seen_model or stage.name
+        elif seen_model:
+            raise ValueError(f"Local stage {stage.name!r} runs after model stage {seen_model!r}")
+
+
+def _table_names(patterns: Sequence[str], tables: Dict[str, Tuple[str, ...]]) -> List[str]:
+    names = []
+    for pattern in patterns:
+        if pattern.endswith("*"):
+            names.extend(sorted(name for name in tables if name.startswith(pattern[:-1])))
+        else:
+            names.append(pattern)
+    return names
+
+
+def routing_table() -> List[Dict[str, Any]]:
+    """The pipeline in order, with the keywords each stage matches on."""
+    tables = intent_router.tables
+    return [
+        {
+            "order": order,
+            "stage": stage.name,
+            "cost": stage.cost,
+            "agent": stage.agent,
+            "rule": stage.rule,
+            "keywords": {name: list(tables[name]) for name in _table_names(stage.tables, tables)},
+        }
+        for order, stage in enumerate(PIPELINE, 1)
+    ]
+
+
+check_pipeline(PIPELINE)
+
+
+if __name__ == "__main__":
+    print(json.dumps(routing_table(), indent=2, ensure_ascii=False))
@@ -1,16 +1,15 @@
 import logging
 import time
-import google.generativeai as genai
 import random
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from ..models.schemas import ToolRequest, ToolResponse
 from google.adk.agents import LlmAgent
-
-try:
-    from . import client
-except ImportError:
-    client = None
+from ..llm import run_blocking, generate_text, OverloadedError
+from ..observability.metrics import instrument_agent
+from ..services.profile_store import ProfileStore
+from ..services.session_state import SessionState, get_session_state
+from .intent import scan_intents
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -18,33 +17,55 @@ logging.basicConfig(level=logging.INFO)
 class ProfileAgent:
     """Agent that serves as a personal creative coach, providing varied advice and support."""
 
-    def __init__(self, model_name="gemini-1.5-flash"):
+    def __init__(self, model_name="gemini-1.5-flash", store: Optional[ProfileStore] = None,
+                 sessions: Optional[SessionState] = None):
         self.model_name = model_name
         logger.info(f"ProfileAgent initialized with model: {model_name}")
-        self.user_profiles = {}  # Store user profiles
-        self.interaction_history = {}  # Track interactions to prevent repetition
+        # Profiles, bounded in memory and written behind to the backend configured by PLOTBUDDY_PROFILE_*
+        self.store = store or ProfileStore.from_env(self._create_initial_profile)
+        # Interaction history (to prevent repetition) lives in session state shared across workers
+        self.sessions = sessions or get_session_state()
         
         self.coaching_approaches = [
             "socratic", "structural", "motivational", "technical",
             "explorative", "reflective", "analytical", "contrasting"
         ]
 
+    @property
+    def user_profiles(self):
+        """Read-only mapping of user_id -> profile."""
+        return self.store.profiles_view()
+
+    @instrument_agent("profile")
     def process(self, request: ToolRequest) -> ToolResponse:
         user_id = request.user_id or "anonymous_user"
+        history = self._load_history(user_id)
+        profile = self.store.profile(user_id)
+        try:
+            return self._process(user_id, request, history, profile)
+        finally:
+            self.store.mark_dirty(user_id, profile)
+            self._save_history(user_id, history)
+
+    def _load_history(self, user_id: str) -> Dict[str, Any]:
+        try:
+            history = self.sessions.get(user_id, "coaching_history")
+        except Exception as e:
+            logger.warning(f"Session state unavailable, starting fresh history for {user_id}: {e}")
+            history = None
+        return history or self._create_initial_history()
+
+    def _save_history(self, user_id: str, history: Dict[str, Any]) -> None:
+        try:
+            self.sessions.set(user_id, "coaching_history", history)
+        except Exception as e:
+            logger.warning(f"Could not save coaching history for {user_id}: {e}")
+
+    def _process(self, user_id: str, request: ToolRequest, history: Dict[str, Any],
+                 profile: Dict[str, Any]) -> ToolResponse:
         user_message = request.input.strip() if request.input else ""
         context = request.context or {}
         
-        profile = self._get_user_profile(user_id)
-
-        if user_id not in self.interaction_history:
-            self.interaction_history[user_id] = {
-                "last_approaches": [],
-                "last_topics": [],
-                "last_advice": [],
-                "interaction_count": 0
-            }
-        
-        history = self.interaction_history[user_id]
         history["interaction_count"] += 1
         
         if context.get("brainstorm"):
@@ -53,11 +74,15 @@ class ProfileAgent:
             return self._provide_contextual_advice(user_id, profile, context, history)
         if user_message.lower().startswith("/profile"):
             return self._handle_profile_command(user_id, user_message, profile)
-        if any(keyword in user_message.lower() for keyword in ["stuck", "advice", "help", "idea", "suggestion", "feedback"]):
+        if scan_intents(user_message.lower()).any("profile_coaching"):
             extracted_topic = self._extract_topic(user_message)
             return self._provide_creative_coaching(user_id, profile, {"topic": extracted_topic}, history)
         return self._handle_general_query(user_id, user_message, profile, history)
     
+    async def process_async(self, request: ToolRequest) -> ToolResponse:
+        """Async variant of `process`; coaching model calls run on the bounded LLM executor."""
+        return await run_blocking(self.process, request)
+
     def _create_initial_profile(self) -> Dict[str, Any]:
         return {
             "created_at": datetime.now(),
@@ -87,6 +112,14 @@ class ProfileAgent:
             }
         }
     
+    def _create_initial_history(self) -> Dict[str, Any]:
+        return {
+            "last_approaches": [],
+            "last_topics": [],
+            "last_advice": [],
+            "interaction_count": 0
+        }
+
     def _select_coaching_approach(self, history: Dict[str, Any]) -> str:
         recent_approaches = history.get("last_approaches", [])
         available_approaches = [a for a in self.coaching_approaches if a not in recent_approaches]
@@ -142,10 +175,7 @@ class ProfileAgent:
             Your response:
             """
             
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            
-            output = response.text.strip()
+            output = generate_text(self.model_name, prompt).strip()
             
             recent_advice = history.get("last_advice", [])
             recent_advice.append(output[:100])
@@ -173,7 +203,8 @@ class ProfileAgent:
             
             return ToolResponse(
                 success=True,
-                output=fallback_responses.get(approach, "What specific aspect of your creative project would you like guidance on today?")
+                output=fallback_responses.get(approach, "What specific aspect of your creative project would you like guidance on today?"),
+                degraded=isinstance(e, OverloadedError)
             )
     
     def _provide_contextual_advice(self, user_id: str, profile: Dict[str, Any], context: Dict[str, Any], history: Dict[str, Any]) -> ToolResponse:
@@ -236,10 +267,7 @@ class ProfileAgent:
             Your response:
             """
             
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            
-            output = response.text.strip()
+            output = generate_text(self.model_name, prompt).strip()
             
             recent_advice = history.get("last_advice", [])
             recent_advice.append(output[:100])
@@ -264,7 +292,8 @@ class ProfileAgent:
             
             return ToolResponse(
                 success=True,
-                output=random.choice(fallbacks)
+                output=random.choice(fallbacks),
+                degraded=isinstance(e, OverloadedError)
             )
     
     def _handle_profile_command(self, user_id: str, message: str, profile: Dict[str, Any]) -> ToolResponse:
@@ -327,10 +356,7 @@ class ProfileAgent:
             Your response:
             """
             
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            
-            output = response.text.strip()
+            output = generate_text(self.model_name, prompt).strip()
             
             if "GENERAL_QUERY" in output:
                 return ToolResponse(
@@ -475,10 +501,8 @@ Update your profile with commands like:
         return summary
     
     def _get_user_profile(self, user_id: str) -> dict:
-        """Return the user's profile dict, creating it if it doesn't exist."""
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = self._create_initial_profile()
-        profile = self.user_profiles[user_id].copy()
+        """Return a copy of the user's profile dict, creating the profile if it doesn't exist."""
+        profile = self.store.profile(user_id).copy()
         # Convert datetime fields to isoformat strings
         for key in ["created_at", "last_updated"]:
             if isinstance(profile.get(key), datetime):
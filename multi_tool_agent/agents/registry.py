@@ -0,0 +1,128 @@
+"""
+PlotBuddy Agent Registry
+Owns one long-lived instance of each agent for the whole process.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _build_greeting_agent(registry: "AgentRegistry") -> Any:
+    from .greeting import GreetingAgent
+    return GreetingAgent(model="gemini-1.5-flash")
+
+
+def _build_faq_agent(registry: "AgentRegistry") -> Any:
+    from .faq import FAQAgent
+    return FAQAgent(model_name="gemini-1.5-flash")
+
+
+def _build_profile_agent(registry: "AgentRegistry") -> Any:
+    from .profile import ProfileAgent
+    return ProfileAgent(model_name="gemini-1.5-flash")
+
+
+def _build_story_agent(registry: "AgentRegistry") -> Any:
+    from .story import StoryAgent
+    return StoryAgent(model_name="gemini-2.0-flash")
+
+
+def _build_orchestrator(registry: "AgentRegistry") -> Any:
+    from .orchestrator import OrchestratorAgent
+    return OrchestratorAgent(model_name="gemini-2.0-flash", registry=registry)
+
+
+class AgentRegistry:
+    """
+    Process-wide container for PlotBuddy agents.
+
+    Agents are built on first access and then reused by every caller, so
+    per-user state such as ProfileAgent.user_profiles survives across
+    HTTP requests and the orchestrator shares the same sub-agents as the API.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[["AgentRegistry"], Any]] = {
+            "greeting": _build_greeting_agent,
+            "faq": _build_faq_agent,
+            "profile": _build_profile_agent,
+            "story": _build_story_agent,
+            "orchestrator": _build_orchestrator,
+        }
+        self._agents: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str) -> Any:
+        """Return the shared agent registered under `name`, building it if needed."""
+        agent = self._agents.get(name)
+        if agent is not None:
+            return agent
+        with self._lock:
+            agent = self._agents.get(name)
+            if agent is None:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown agent: {name}")
+                logger.info(f"AgentRegistry building '{name}' agent.")
+                agent = self._factories[name](self)
+                self._agents[name] = agent
+            return agent
+
+    def register(self, name: str, factory: Callable[["AgentRegistry"], Any]) -> None:
+        """Register (or replace) the factory used to build an agent."""
+        with self._lock:
+            self._factories[name] = factory
+            self._agents.pop(name, None)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        Build the named agents (all registered ones by default) now instead
+        of on first use. Returns the seconds spent building each agent.
+        """
+        timings = {}
+        for name in list(names if names is not None else self._factories):
+            started = time.perf_counter()
+            self.get(name)
+            timings[name] = time.perf_counter() - started
+        return timings
+
+    def built(self) -> List[str]:
+        """Names of the agents built so far."""
+        with self._lock:
+            return list(self._agents)
+
+    def reset(self) -> None:
+        """Drop all built agents; they are rebuilt on next access."""
+        with self._lock:
+            self._agents.clear()
+
+    @property
+    def greeting_agent(self) -> Any:
+        return self.get("greeting")
+
+    @property
+    def faq_agent(self) -> Any:
+        return self.get("faq")
+
+    @property
+    def profile_agent(self) -> Any:
+        return self.get("profile")
+
+    @property
+    def story_agent(self) -> Any:
+        return self.get("story")
+
+    @property
+    def orchestrator(self) -> Any:
+        return self.get("orchestrator")
+
+
+registry = AgentRegistry()
+
+
+def get_registry() -> AgentRegistry:
+    """Return the process-wide agent registry."""
+    return registry
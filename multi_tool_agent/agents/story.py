@@ -1,22 +1,17 @@
-import os
-from dotenv import load_dotenv
-
-# Your existing load_dotenv call:
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
-
-# --- Add this for debugging ---
-print(f"DEBUG: GOOGLE_API_KEY from os.environ: {os.environ.get('GOOGLE_API_KEY')}")
-# --- End debug ---
-
 import logging
 import os
-from dotenv import load_dotenv
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Iterator
 
 # Ensure google-adk is installed: pip install google-adk
 from google.adk.agents import LlmAgent
-# If you plan to use genai directly *outside* of what LlmAgent handles, keep this
-import google.generativeai as genai 
+from ..llm import (run_blocking, generate_text, stream_slot, get_model, admission, classify_error, get_breaker,
+                   EmptyResponseError, MissingAPIKeyError, OverloadedError)
+from ..llm.retry import RequestCancelledError, current_deadline, record_abandoned, request_options, retry_policy
+from ..llm.scheduler import STORY
+from ..config.environment import load_environment
+from ..observability.metrics import instrument_agent, record_route
+from ..observability.tracing import annotate
 
 # Assuming these are in your project.
 # For a standalone example, you might need to mock or define them simply.
@@ -29,43 +24,25 @@ class ToolRequest:
         self.user_id = user_id
 
 class ToolResponse:
-    def __init__(self, success: bool, output: str, parameters: Dict[str, Any] = None, message: str = None):
+    def __init__(self, success: bool, output: str, parameters: Dict[str, Any] = None, message: str = None,
+                 degraded: bool = False):
         self.success = success
         self.output = output
         self.parameters = parameters if parameters is not None else {}
         self.message = message
+        self.degraded = degraded
 
     @classmethod
     def error(cls, message: str):
         return cls(success=False, output=message)
 
 
-# Load environment variables from .env
-# This path might need adjustment depending on where your .env is relative to this script.
-# It's good practice to ensure the .env is loaded early.
-# os.path.dirname(os.path.dirname(__file__)) assumes .env is one level up from the directory
-# containing this script. Adjust if your .env is in a different location.
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+# Load environment variables from multi_tool_agent/.env
+load_environment()
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# This client module would typically hold shared configurations, like a global API key.
-# If `client.GOOGLE_API_KEY` is meant to be the primary way to get the key,
-# ensure it's correctly populated.
-try:
-    from . import client
-    if hasattr(client, 'GOOGLE_API_KEY') and client.GOOGLE_API_KEY:
-        os.environ["GOOGLE_API_KEY"] = client.GOOGLE_API_KEY
-        logger.info("GOOGLE_API_KEY loaded from client module.")
-except ImportError:
-    client = None
-    logger.info("Client module not found, relying on direct environment variable for API key.")
-
-# It's good to print the key status early for debugging
-print("GOOGLE_API_KEY in script startup:", os.environ.get("GOOGLE_API_KEY"))
-
-
 # Assuming these are correctly set up in your project structure
 # from multi_tool_agent.config.response import GREETING_RESPONSES, FAQ_RESPONSES, STORY_TEMPLATES, ERROR_MESSAGES
 # Mock these for runnable example
@@ -75,6 +52,19 @@ STORY_TEMPLATES = []
 ERROR_MESSAGES = {}
 
 
+def _cancel_model_stream(response: Any) -> None:
+    """Hang up a streaming generate_content response so the model stops generating."""
+    # The SDK keeps the transport's stream (a gRPC call or a REST response iterator) as `_iterator`;
+    # both have cancel()
+    cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+    if cancel is None:
+        return
+    try:
+        cancel()
+    except Exception as e:
+        logger.debug(f"Cancelling model stream failed: {e}")
+
+
 class StoryAgent(LlmAgent):
     """
     An AI-powered agent that crafts unique fictional stories based on user-defined parameters.
@@ -123,6 +113,7 @@ class StoryAgent(LlmAgent):
         }
         logger.info("StoryAgent initialized.")
 
+    @instrument_agent("story")
     def process(self, request: ToolRequest, context: dict = None) -> ToolResponse:
         logger.info(f"StoryAgent process called with request: {request.input}")
         try:
@@ -145,42 +136,14 @@ You can say: "Create a mysterious sci-fi micro story" or use the story creation
                     if not all([genre, mood, length]):
                         return ToolResponse.error("Please provide genre, mood, and length for your story.")
                         
-                    story, used_fallback = self._generate_story(genre, mood, length, request.user_id)
-                    if used_fallback:
-                        notice = (
-                            "⚠️ Note: Our AI story service is temporarily unavailable. "
-                            "Here's a sample story instead:\n\n"
-                        )
-                        return ToolResponse(
-                            success=True,
-                            output=notice + story,
-                            parameters={"genre": genre, "mood": mood, "length": length},
-                            message="LLM_UNAVAILABLE_FALLBACK"
-                        )
-                    return ToolResponse(
-                        success=True,
-                        output=story,
-                        parameters={"genre": genre, "mood": mood, "length": length}
-                    )
+                    return self._story_response(genre, mood, length, request.user_id)
                 elif isinstance(request.input, str) and "|" in request.input:
                     parts = [part.strip() for part in request.input.split("|", 2)]
                     if len(parts) >= 3:
                         genre = parts[0]
                         mood = parts[1]
                         length = parts[2]
-                        story, used_fallback = self._generate_story(genre, mood, length, request.user_id)
-                        if used_fallback:
-                            notice = (
-                                "⚠️ Note: Our AI story service is temporarily unavailable. "
-                                "Here's a sample story instead:\n\n"
-                            )
-                            return ToolResponse(
-                                success=True,
-                                output=notice + story,
-                                parameters={"genre": genre, "mood": mood, "length": length},
-                                message="LLM_UNAVAILABLE_FALLBACK"
-                            )
-                        return ToolResponse(success=True, output=story)
+                        return self._story_response(genre, mood, length, request.user_id, include_parameters=False)
                     else:
                         return ToolResponse.error("Please provide genre, mood, and length separated by '|'")
                 else:
@@ -194,21 +157,95 @@ You can say: "Create a mysterious sci-fi micro story" or use the story creation
             logger.error(f"Error generating story: {e}", exc_info=True)
             return ToolResponse.error("Sorry, I encountered an error creating your story.")
 
+    async def process_async(self, request: ToolRequest, context: dict = None) -> ToolResponse:
+        """
+        Async variant of `process`; story generation runs on the bounded LLM executor.
+        While admission control is shedding or the model's circuit breaker is
+        open, the fallback story is served without queueing for the executor.
+        """
+        if isinstance(request.input, dict) and (admission.overloaded() or get_breaker(self.model).rejecting()):
+            genre, mood, length = (request.input.get(key, '') for key in ("genre", "mood", "length"))
+            if all([genre, mood, length]):
+                return self._degraded_story_response(genre, mood, length)
+        return await run_blocking(self.process, request, context)
+
+    def _story_response(self, genre: str, mood: str, length: str, user_id: str,
+                        include_parameters: bool = True) -> ToolResponse:
+        """Generate a story and wrap it, with the unavailable notice when a fallback story was used."""
+        parameters = {"genre": genre, "mood": mood, "length": length}
+        try:
+            story, used_fallback = self._generate_story(genre, mood, length, user_id)
+        except OverloadedError as e:
+            logger.warning(f"Serving fallback story to {user_id} without a model call: {e}")
+            return self._degraded_story_response(genre, mood, length)
+        record_route("story_fallback" if used_fallback else "story_llm")
+        if used_fallback:
+            return ToolResponse(
+                success=True,
+                output=self._fallback_notice() + story,
+                parameters=parameters,
+                message="LLM_UNAVAILABLE_FALLBACK"
+            )
+        return ToolResponse(success=True, output=story, parameters=parameters if include_parameters else None)
+
+    def _degraded_story_response(self, genre: str, mood: str, length: str) -> ToolResponse:
+        """Fallback story served while model calls are being shed."""
+        record_route("story_fallback")
+        annotate(fallback_reason="overloaded")
+        story = self._format_story(genre, mood, length, self._get_fallback_story(genre, mood, length))
+        return ToolResponse(
+            success=True,
+            output=self._fallback_notice() + story,
+            parameters={"genre": genre, "mood": mood, "length": length},
+            message="LLM_OVERLOADED_FALLBACK",
+            degraded=True
+        )
+
+    def _fallback_notice(self) -> str:
+        return (
+            "⚠️ Note: Our AI story service is temporarily unavailable. "
+            "Here's a sample story instead:\n\n"
+        )
+
     def _generate_story(self, genre: str, mood: str, length: str, user_id: str):
-        """Generate a story based on the provided parameters. Returns (story, used_fallback: bool)"""
+        """
+        Generate a story based on the provided parameters. Returns (story, used_fallback: bool)
+
+        Raises OverloadedError when admission control is shedding model calls
+        or the circuit breaker is open, so callers can answer straight away
+        with a degraded response.
+        """
         logger.info(f"Generating {length} {mood} {genre} story for {user_id}")
         used_fallback = False
         try:
             # Try LLM
             story = self._generate_story_with_llm(genre, mood, length, user_id)
-            if story.startswith("Error") or "unavailable" in story.lower():
-                raise RuntimeError("LLM unavailable or failed to produce valid content.")
+        except OverloadedError:
+            raise
+        except RequestCancelledError:
+            # The client is gone; nobody reads this, so no warning or error metric
+            logger.info(f"Story generation for {user_id} cancelled before the model call.")
+            annotate(fallback_reason="cancelled")
+            story = self._get_fallback_story(genre, mood, length)
+            used_fallback = True
         except Exception as e:
-            logger.warning(f"LLM unavailable or failed: {e}", exc_info=True)
+            logger.warning(f"LLM story generation failed ({classify_error(e)}): {e}", exc_info=True)
+            annotate(fallback_reason=classify_error(e))
             story = self._get_fallback_story(genre, mood, length)
             used_fallback = True
 
-        # Emojis for formatting
+        return self._format_story(genre, mood, length, story), used_fallback
+
+    def _format_story(self, genre: str, mood: str, length: str, story: str) -> str:
+        formatted_story = (
+            self._format_story_header(genre, mood, length)
+            + story
+            + self._format_story_footer(genre, mood, length)
+        )
+        return formatted_story.strip()
+
+    def _story_emojis(self, genre: str, mood: str, length: str):
+        """Return the (genre, mood, length) emojis used to decorate a story."""
         genre_emojis = {
             "mystery": "🔍", "scifi": "🚀", "fantasy": "🧙", "romance": "❤️", 
             "horror": "👻", "adventure": "🧭", "thriller": "🔫", 
@@ -226,42 +263,32 @@ You can say: "Create a mysterious sci-fi micro story" or use the story creation
         g_emoji = genre_emojis.get(genre.lower(), "✨")
         m_emoji = mood_emojis.get(mood.lower(), "✨")
         l_emoji = length_emojis.get(length.lower(), "📄")
+        return g_emoji, m_emoji, l_emoji
 
+    def _format_story_header(self, genre: str, mood: str, length: str) -> str:
+        """Title block that precedes the story text."""
+        g_emoji, m_emoji, _ = self._story_emojis(genre, mood, length)
         title = f"{g_emoji} {genre.title()}: A {mood.title()} {length.title()} Tale {m_emoji}"
+        return f"{title}\n\n"
 
-        formatted_story = f"""{title}
-
-{story}
+    def _format_story_footer(self, genre: str, mood: str, length: str) -> str:
+        """Details block that follows the story text."""
+        g_emoji, m_emoji, l_emoji = self._story_emojis(genre, mood, length)
+        return f"""
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 {g_emoji} Genre: {genre.title()}
 {m_emoji} Mood: {mood.title()}
-{l_emoji} Length: {length.title()}
-"""
-        return formatted_story.strip(), used_fallback
-
-    def _generate_story_with_llm(self, genre: str, mood: str, length: str, user_id: str) -> str:
-        """Generate story content using the LLM based on provided parameters"""
-        logger.info(f"Initiating LLM call for user {user_id}: Genre='{genre}', Mood='{mood}', Length='{length}'.")
+{l_emoji} Length: {length.title()}"""
 
-        # ADK's LlmAgent base class should ideally handle the model configuration.
-        # However, if you need explicit genai.configure, ensure the API key is available.
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
-            logger.error("Missing Google Generative AI API key in environment variables.")
-            return "Error: Missing API key for story generation."
-        
-        # This call might be redundant if ADK's LlmAgent setup already configures genai.
-        # However, keeping it here ensures it's configured if ADK's internal mechanism
-        # isn't explicitly doing it or if running this method standalone.
-        genai.configure(api_key=api_key) 
-        
+    def _build_story_prompt(self, genre: str, mood: str, length: str) -> str:
+        """Build the generation prompt for a story."""
         length_description = self._length_descriptions.get(
             length.lower(), 
             "a moderate length story (around 750-1000 words)"
         )
 
-        prompt = f"""Write a {mood} {genre} story that is {length_description}
+        return f"""Write a {mood} {genre} story that is {length_description}
 Your story should:
 - Have a compelling {mood} atmosphere throughout
 - Follow {genre} genre conventions
@@ -271,40 +298,85 @@ Your story should:
 
 Remember: Do NOT include a title. Start directly with the story text.
 """
-        print("DEBUG: Starting story generation with ADK LlmAgent")
-        print("DEBUG: API key status (should be present):", bool(api_key))
-        print("DEBUG: Prompt is", prompt[:100] + "...") # Truncate for cleaner debug output
-        print("DEBUG: API key before LLM call:", os.environ.get("GOOGLE_API_KEY"))
 
+    def stream_story(self, genre: str, mood: str, length: str, user_id: str) -> Iterator[Dict[str, str]]:
+        """
+        Generate a story incrementally.
+
+        Yields events of the form {"event": ..., "text": ...}:
+        - "header": the title block, sent before the model is called
+        - "chunk": story text as the model produces it
+        - "fallback": a replacement story body when generation fails; any
+          chunks already sent should be discarded by the client; it carries
+          "degraded": True when the model was skipped because of overload
+          or an open circuit breaker
+        - "footer": the details block that closes the story
+        Concatenating header, chunks (or the fallback) and footer gives the
+        same text as `_generate_story`. Closing the generator early (the
+        client disconnected) cancels the upstream stream.
+        """
+        logger.info(f"Streaming {length} {mood} {genre} story for {user_id}")
+        yield {"event": "header", "text": self._format_story_header(genre, mood, length)}
+
+        received = 0
+        response = None
+        started = time.monotonic()
         try:
-            print(f"DEBUG: About to call Gemini API using model: {self.model}")
-            # Use the model attribute from the LlmAgent base class
-            model = genai.GenerativeModel(
-                model_name=self.model,
-                generation_config=self._generation_config_base
-            )
-            response = model.generate_content(prompt)
-            print("DEBUG: Gemini API raw response (truncated):", str(response)[:100] + "...")
-            logger.info(f"Gemini API raw response: {response}")
-
-            if response is None or not hasattr(response, 'text') or not response.text:
-                logger.error("Received empty or invalid response from generative model.")
-                return "Error: No valid response received from the AI model."
-            
-            story_text = response.text
-            logger.info(f"Generated story text (truncated): {story_text[:50]}...")
-            return story_text
-
-        except Exception as gen_error:
-            print("DEBUG: Gemini API error:", gen_error)
-            logger.error(f"Content generation error: {gen_error}", exc_info=True)
-            error_str = str(gen_error).lower()
-            # Provide a clear user-facing error if Gemini API is not working
-            if "quota" in error_str or "violation" in error_str or "policy" in error_str or "rate limit" in error_str:
-                return "Sorry, the Gemini API is not working due to quota or policy violation. Please try again later."
-            if "resource exhausted" in error_str or "internal error" in error_str:
-                return "Sorry, the Gemini API is currently overloaded or experiencing an internal issue. Please try again in a moment."
-            return f"Sorry, the Gemini API is not working: {str(gen_error)}. Please check your API key and try again."
+            with stream_slot(self.model, STORY):
+                model = get_model(self.model, self._generation_config_base)
+                # The whole stream is one call: a long story may take longer than a single attempt
+                timeout = retry_policy.timeout_for_stream(current_deadline())
+                response = model.generate_content(self._build_story_prompt(genre, mood, length), stream=True,
+                                                  request_options=request_options(timeout))
+                for chunk in response:
+                    text = getattr(chunk, "text", "")
+                    if text:
+                        received += len(text)
+                        yield {"event": "chunk", "text": text}
+                if not received:
+                    raise EmptyResponseError("No valid response received from the AI model.")
+            record_route("story_llm")
+        except GeneratorExit:
+            logger.info(f"Story stream for {user_id} abandoned after {received} characters.")
+            _cancel_model_stream(response)
+            record_abandoned(self.model, "stream", seconds=time.monotonic() - started, chars=received)
+            raise
+        except OverloadedError as e:
+            logger.warning(f"Story stream for {user_id} served from fallback: {e}")
+            record_route("story_fallback")
+            annotate(fallback_reason="overloaded")
+            yield {"event": "fallback", "text": self._fallback_notice() + self._get_fallback_story(genre, mood, length),
+                   "degraded": True}
+        except Exception as e:
+            logger.warning(f"Story stream failed after {received} characters: {e}", exc_info=True)
+            record_route("story_fallback")
+            annotate(fallback_reason=classify_error(e))
+            yield {"event": "fallback", "text": self._fallback_notice() + self._get_fallback_story(genre, mood, length)}
+
+        yield {"event": "footer", "text": self._format_story_footer(genre, mood, length)}
+
+    def _generate_story_with_llm(self, genre: str, mood: str, length: str, user_id: str) -> str:
+        """
+        Generate story content using the LLM based on provided parameters.
+
+        Raises on failure: MissingAPIKeyError, EmptyResponseError, the SDK's
+        exception, or OverloadedError / CircuitOpenError when the call was not
+        attempted. See `classify_error` for how failures are grouped.
+        """
+        logger.info(f"Initiating LLM call for user {user_id}: Genre='{genre}', Mood='{mood}', Length='{length}'.")
+
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            logger.error("Missing Google Generative AI API key in environment variables.")
+            raise MissingAPIKeyError("Missing API key for story generation.")
+
+        prompt = self._build_story_prompt(genre, mood, length)
+        logger.debug("Story prompt", extra={"event": "story_prompt", "model": self.model, "prompt": prompt})
+
+        story_text = generate_text(self.model, prompt, self._generation_config_base, priority=STORY)
+        logger.debug("Story response", extra={"event": "story_text", "model": self.model, "text": story_text})
+        logger.info(f"Generated a {len(story_text)}-character story for user {user_id}.")
+        return story_text
 
     def _get_fallback_story(self, genre: str, mood: str, length: str) -> str:
         """Provide a fallback story when API generation fails, formatted as requested."""
@@ -324,8 +396,13 @@ Remember: Do NOT include a title. Start directly with the story text.
             "Once upon a time, in a world of endless possibilities, a new adventure began...")
         return story
 
-# Instantiate the agent. ADK will use the 'model' parameter passed to LlmAgent's super().__init__.
-story_agent = StoryAgent()
+# The shared agent instance lives in the agent registry; `story_agent` is kept
+# as a module attribute for ADK tooling that imports it by name.
+def __getattr__(name):
+    if name == "story_agent":
+        from .registry import get_registry
+        return get_registry().story_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # To run this in an ADK context, you'd typically have an app.py like this:
 # from google.adk.app import AdkApp
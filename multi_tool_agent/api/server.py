@@ -1,33 +1,67 @@
 import os
+import json
+import asyncio
 import logging
+import math
 import random
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
-# Load environment variables from project root
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+from multi_tool_agent.config.environment import load_environment
+from multi_tool_agent.observability.logs import configure_logging
 
-logging.basicConfig(level=logging.DEBUG)
+# Load environment variables from multi_tool_agent/.env
+load_environment()
+
+# Records are formatted and written by a background thread (see observability.logs)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-print("GOOGLE_API_KEY:", GOOGLE_API_KEY)
 if not GOOGLE_API_KEY:
     logger.critical("GOOGLE_API_KEY environment variable not found. LLM calls will fail. "
                     "Ensure GOOGLE_API_KEY is set in your environment variables or .env file.")
 
 # Use absolute imports if possible
-from multi_tool_agent.agents.story import StoryAgent
 from multi_tool_agent.models.schemas import ToolRequest
-from multi_tool_agent.agents.profile import ProfileAgent
-from multi_tool_agent.agents.orchestrator import OrchestratorAgent
-
-orchestrator = OrchestratorAgent()
+from multi_tool_agent.agents.registry import get_registry
+from multi_tool_agent.llm import (EmptyResponseError, admission, classify_error, current_deadline, deadline_scope,
+                                  generate_text, iterate_blocking, model_pool, retry_policy, run_blocking,
+                                  scheduler, scheduling_scope)
+from multi_tool_agent.llm.scheduler import BACKGROUND
+from multi_tool_agent.llm.gateway import model_calls
+from multi_tool_agent.observability.metrics import metrics, record_abandoned_request, record_route
+from multi_tool_agent.observability.tracing import parse_traceparent, tracer
+from multi_tool_agent.services.idempotency import (DONE, IDEMPOTENT_REQUESTS, MAX_KEY_LENGTH, MISMATCH, OWNER,
+                                                   IdempotencyStore, request_fingerprint)
+from multi_tool_agent.services.jobs import FAILED, SUCCEEDED, JobQueue
+from multi_tool_agent.services.story_pool import StoryPool
+
+if TYPE_CHECKING:
+    # The agent modules load the ADK and the Gemini SDK; the registry imports them on first use
+    from multi_tool_agent.agents.orchestrator import OrchestratorAgent
+    from multi_tool_agent.agents.profile import ProfileAgent
+    from multi_tool_agent.agents.story import StoryAgent
+
+agent_registry = get_registry()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up and the background services are set up further down (start_up / shut_down)
+    await start_up()
+    try:
+        yield
+    finally:
+        shut_down()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS Configuration ---
 allowed_origins_str = os.getenv(
@@ -42,14 +76,335 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 # --- End CORS Configuration ---
 
-def get_story_agent():
-    return StoryAgent()
-
-def get_profile_agent():
-    return ProfileAgent(model_name="gemini-1.5-flash")
+# --- Request deadlines ---
+# Every request gets a time budget (PLOTBUDDY_REQUEST_BUDGET seconds; clients
+# may ask for less with an X-Request-Timeout header). Model calls made while
+# handling it retry only while the budget leaves room for another attempt.
+# Batch endpoints apply the budget to each item instead of the whole request;
+# story streams get the longer stream budget (PLOTBUDDY_LLM_STREAM_TIMEOUT),
+# since a long story keeps streaming well past a chat turn's budget.
+REQUEST_BUDGET = float(os.getenv("PLOTBUDDY_REQUEST_BUDGET", "30"))
+OWN_BUDGET_PATHS = {"/api/story/batch", "/api/story/stream"}
+
+def _request_budget(request: Request, limit: Optional[float] = None) -> float:
+    limit = REQUEST_BUDGET if limit is None else limit
+    try:
+        requested = float(request.headers.get("x-request-timeout", limit))
+    except ValueError:
+        return limit
+    return max(0.0, min(requested, limit))
+
+class RequestDeadlineMiddleware:
+    """
+    Runs each HTTP request under its deadline. Plain ASGI rather than
+    @app.middleware("http"), which hides the client's disconnect from endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        # An unbounded deadline still lets a disconnect cancel the batch's items or the stream
+        budget = math.inf if request.url.path in OWN_BUDGET_PATHS else _request_budget(request)
+        with deadline_scope(budget):
+            await self.app(scope, receive, send)
+
+app.add_middleware(RequestDeadlineMiddleware)
+
+# --- Tracing ---
+# Each HTTP request is the root span of a trace (continuing the caller's when
+# it sends a W3C traceparent header); the orchestrator stages, agents and
+# model calls it makes are child spans (see observability.tracing). The
+# trace id is returned in X-Trace-Id and the trace is served at
+# /debug/traces/{trace_id} while it is in the buffer.
+UNTRACED_PATHS = ("/metrics", "/ready", "/debug/")
+
+class TracingMiddleware:
+    """Runs each HTTP request in a root "http.request" span."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled or scope["path"].startswith(UNTRACED_PATHS):
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        parent = parse_traceparent(request.headers.get("traceparent"))
+        with tracer.span("http.request", parent=parent, method=request.method, path=request.url.path) as root:
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    root.set(status_code=message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-trace-id", root.trace_id.encode("ascii"))]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
+
+app.add_middleware(TracingMiddleware)
+
+# --- Client disconnects ---
+# Endpoints that wait on the model watch for the client going away. When it
+# does, the request's deadline is cancelled, so no further model attempt,
+# retry or fallback model call is started for it (see llm.retry), and the
+# endpoint stops waiting instead of building a response nobody reads.
+DISCONNECT_POLL_INTERVAL = float(os.getenv("PLOTBUDDY_DISCONNECT_POLL", "0.25"))
+CLIENT_CLOSED_REQUEST = 499  # nginx's status for requests closed by the client
+
+class ClientDisconnected(Exception):
+    """The client went away before its answer was ready."""
+
+async def _unless_disconnected(request: Request, work, endpoint: str):
+    """Await `work`; raise ClientDisconnected (after cancelling the request's model work) if the client leaves."""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except BaseException:
+        task.cancel()
+        raise
+    _abandon_request(endpoint)
+    task.cancel()
+    raise ClientDisconnected(endpoint)
+
+def _abandon_request(endpoint: str) -> None:
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.cancel()
+    record_abandoned_request(endpoint)
+    logger.info(f"Client disconnected from {endpoint}; cancelled its model calls.")
+
+# --- Idempotency keys ---
+# Requests that start a generation may carry an Idempotency-Key header. The
+# first request with a key does the work; retries get its stored response,
+# waiting for it (within their own budget) while it is still running.
+idempotency_store = IdempotencyStore.from_env()
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+
+async def _idempotent(request: Request, scope: str, key: str, produce) -> Response:
+    """Answer with `await produce()` once per (scope, user, key); replay its response for duplicates."""
+    if len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(status_code=400, content={
+            "success": False, "message": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."})
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    user_id = body.get('user_id', 'anonymous_user') if isinstance(body, dict) else 'anonymous_user'
+    fingerprint = request_fingerprint(body)
+    deadline = current_deadline()
+    loop = asyncio.get_running_loop()
+    while True:
+        state, stored = await loop.run_in_executor(None, idempotency_store.begin, scope, user_id, key, fingerprint)
+        if state == OWNER:
+            break
+        if state == DONE:
+            IDEMPOTENT_REQUESTS.inc(outcome="replayed")
+            return Response(content=stored["body"], status_code=stored["status"], media_type="application/json",
+                            headers={"Idempotent-Replayed": "true"})
+        if state == MISMATCH:
+            IDEMPOTENT_REQUESTS.inc(outcome="mismatch")
+            return JSONResponse(status_code=422, content={
+                "success": False, "message": "This Idempotency-Key was already used for a different request."})
+        if deadline is not None and deadline.remaining() <= IDEMPOTENCY_POLL_INTERVAL:
+            IDEMPOTENT_REQUESTS.inc(outcome="conflict")
+            return JSONResponse(status_code=409, headers={"Retry-After": "2"}, content={
+                "success": False, "message": "A request with this Idempotency-Key is still in progress."})
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+    IDEMPOTENT_REQUESTS.inc(outcome="new")
+    try:
+        response = await produce()
+    except BaseException:
+        await loop.run_in_executor(None, idempotency_store.release, scope, user_id, key)
+        raise
+    if 200 <= response.status_code < 300:
+        await loop.run_in_executor(None, idempotency_store.complete, scope, user_id, key,
+                                   {"status": response.status_code, "body": response.body.decode("utf-8")})
+    else:
+        await loop.run_in_executor(None, idempotency_store.release, scope, user_id, key)
+    return response
+
+def get_story_agent() -> "StoryAgent":
+    return agent_registry.story_agent
+
+def get_profile_agent() -> "ProfileAgent":
+    return agent_registry.profile_agent
+
+def get_orchestrator() -> "OrchestratorAgent":
+    return agent_registry.orchestrator
+
+# --- Warm-up and readiness ---
+# Importing this module does not load the agents or the Gemini SDK (a few
+# seconds together). Warm-up builds every agent, preloads the static
+# response and intent tables and opens the pooled model clients the agents
+# use; with PLOTBUDDY_WARMUP_PROBE=1 it also sends each model a one-line
+# prompt, so the first request finds an open connection. PLOTBUDDY_WARMUP
+# chooses when it runs:
+#   startup     before the server accepts requests (default)
+#   background  in a thread once the server is up; early requests build what they need
+#   lazy        never; everything is loaded on first use
+# GET /ready answers 503 until warm-up has finished (200 at once in lazy
+# mode), so a load balancer only sends traffic to warm instances.
+WARMUP_MODES = ("startup", "background", "lazy")
+WARMUP_MODE = os.getenv("PLOTBUDDY_WARMUP", "startup").strip().lower()
+if WARMUP_MODE not in WARMUP_MODES:
+    logger.warning(f"Unknown PLOTBUDDY_WARMUP value {WARMUP_MODE!r}, using 'startup'.")
+    WARMUP_MODE = "startup"
+WARMUP_PROBE = os.getenv("PLOTBUDDY_WARMUP_PROBE", "").strip().lower() in ("1", "true", "yes")
+WARMUP_PROBE_PROMPT = "Reply with the single word OK."
+
+# state: pending -> warming -> ready | failed
+warmup_status: Dict[str, Any] = {"state": "pending", "seconds": None, "agents": {}, "model_clients": 0,
+                                 "probes": {}, "error": None}
+
+def _agent_model_clients() -> List[Tuple[str, Optional[dict]]]:
+    """(model name, generation config) of the pooled client each built agent calls."""
+    clients = {}
+    for name in agent_registry.built():
+        agent = agent_registry.get(name)
+        model = getattr(agent, "model_name", None) or getattr(agent, "model", None)
+        if isinstance(model, str) and model:
+            config = getattr(agent, "_generation_config_base", None)
+            clients[(model, json.dumps(config, sort_keys=True, default=str))] = (model, config)
+    return list(clients.values())
+
+def _probe_model(model_name: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        with deadline_scope(REQUEST_BUDGET), scheduling_scope(BACKGROUND, "warmup"):
+            generate_text(model_name, WARMUP_PROBE_PROMPT, {"max_output_tokens": 8})
+    except EmptyResponseError:
+        pass  # the model answered; an empty reply still opened the connection
+    except Exception as e:
+        logger.warning(f"Warm-up probe of {model_name} failed: {e}")
+        return {"ok": False, "error": classify_error(e)}
+    return {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+def warm_up() -> None:
+    """Build every agent, preload static tables, open model clients and optionally probe each model."""
+    warmup_status.update(state="warming", error=None)
+    started = time.perf_counter()
+    try:
+        timings = agent_registry.warm_up()
+        # Static catalogs; the agents import them, this also compiles the intent router's cache
+        from multi_tool_agent.agents.intent import scan_intents
+        from multi_tool_agent.config import response  # noqa: F401
+        scan_intents("hello")
+        clients = _agent_model_clients()
+        opened = model_pool.warm_up(clients)
+        probes = {}
+        if WARMUP_PROBE and opened:
+            probes = {model: _probe_model(model) for model in sorted({model for model, _ in clients})}
+    except Exception as e:
+        # The instance stays unready; whatever failed is built again on first use if it gets traffic anyway
+        logger.error(f"Warm-up failed: {e}")
+        warmup_status.update(state="failed", error=str(e) or type(e).__name__)
+        return
+    seconds = time.perf_counter() - started
+    warmup_status.update(state="ready", seconds=round(seconds, 3), model_clients=opened, probes=probes,
+                         agents={name: round(value, 3) for name, value in timings.items()})
+    built = ", ".join(f"{name} {value:.2f}s" for name, value in timings.items())
+    logger.info(f"Warm-up finished in {seconds:.2f}s ({built}; {opened} model clients).")
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 while it runs or if it failed."""
+    status = dict(warmup_status, mode=WARMUP_MODE)
+    return JSONResponse(status_code=200 if status["state"] == "ready" else 503, content=status)
+
+# --- Pre-generated story pool (enabled with PLOTBUDDY_STORY_POOL_DEPTH > 0) ---
+story_pool: Optional[StoryPool] = None
+
+def _build_story_pool(story_agent: "StoryAgent") -> StoryPool:
+    def generate(genre: str, mood: str, length: str) -> Optional[str]:
+        with scheduling_scope(BACKGROUND, "story_pool"):
+            story, used_fallback = story_agent._generate_story(genre, mood, length, "story_pool")
+        return None if used_fallback else story
+
+    combinations = itertools.product(story_agent._valid_genres, story_agent._valid_moods, story_agent._valid_lengths)
+    return StoryPool.from_env(generate, combinations)
+
+def start_story_pool():
+    global story_pool
+    if float(os.getenv("PLOTBUDDY_STORY_POOL_DEPTH", "0") or 0) <= 0:
+        # Pooling is off; building the pool would load the story agent for nothing
+        return
+    pool = _build_story_pool(agent_registry.story_agent)
+    if pool.enabled:
+        pool.start()
+        story_pool = pool
+
+def stop_story_pool():
+    if story_pool is not None:
+        story_pool.stop()
+
+# --- Background story jobs ---
+job_queue: Optional[JobQueue] = None
+
+def _run_story_job(params: dict, report_progress) -> dict:
+    """Generate one queued story, reporting the text so far as it streams in."""
+    genre, mood, length = params["genre"], params["mood"], params["length"]
+    header, body, footer = "", [], ""
+    fallback = degraded = False
+    with scheduling_scope(BACKGROUND, params["user_id"]):
+        for event in agent_registry.story_agent.stream_story(genre, mood, length, params["user_id"]):
+            if event["event"] == "header":
+                header = event["text"]
+            elif event["event"] == "chunk":
+                body.append(event["text"])
+            elif event["event"] == "fallback":
+                body = [event["text"]]
+                fallback, degraded = True, bool(event.get("degraded"))
+            elif event["event"] == "footer":
+                footer = event["text"]
+            report_progress(header + "".join(body) + footer)
+    return {"story": header + "".join(body) + footer, "parameters": {"genre": genre, "mood": mood, "length": length},
+            "fallback": fallback, "degraded": degraded}
+
+def start_job_queue():
+    global job_queue
+    job_queue = JobQueue.from_env(_run_story_job)
+    job_queue.start()
+
+def stop_job_queue():
+    # Running jobs keep their lease and are picked up again after a restart
+    if job_queue is not None:
+        job_queue.close()
+
+def flush_profiles():
+    # Write-behind profile changes that have not been flushed yet (none if the agent was never built)
+    if "profile" in agent_registry.built():
+        agent_registry.profile_agent.store.close()
+
+# --- Lifespan ---
+async def start_up() -> None:
+    """Warm up as PLOTBUDDY_WARMUP says, then start the story pool and the job workers."""
+    if WARMUP_MODE == "startup":
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    elif WARMUP_MODE == "background":
+        threading.Thread(target=warm_up, name="plotbuddy-warmup", daemon=True).start()
+    else:
+        warmup_status["state"] = "ready"
+    start_story_pool()
+    start_job_queue()
+
+def shut_down() -> None:
+    stop_story_pool()
+    stop_job_queue()
+    flush_profiles()
 
 class StoryRequest(BaseModel):
     user_id: str
@@ -57,29 +412,67 @@ class StoryRequest(BaseModel):
     mood: str
     length: str
 
+def _resolve_story_parameters(data: dict, story_agent: "StoryAgent", user_id: str):
+    """Pick (genre, mood, length) from a story request body, choosing at random if asked."""
+    if data.get('random', False):
+        try:
+            genre = random.choice(story_agent._valid_genres or ["fantasy"])
+            mood = random.choice(story_agent._valid_moods or ["mysterious"])
+            length = random.choice(story_agent._valid_lengths or ["short"])
+        except Exception as e:
+            logger.error(f"Error selecting random parameters for story creation: {e}")
+            genre, mood, length = "fantasy", "mysterious", "short"
+        logger.debug(f"Random story request for {user_id}: Create a {length} {genre} story with a {mood} mood")
+    else:
+        genre = data.get("genre")
+        mood = data.get("mood")
+        length = data.get("length")
+        logger.debug(f"Story request from {user_id}: genre={genre}, mood={mood}, length={length}")
+
+    if not all([genre, mood, length]):
+        raise HTTPException(status_code=400, detail="Genre, mood, and length are required for non-random story creation.")
+    return genre, mood, length
+
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
 @app.post("/api/story/create")
-async def create_story(request: Request, story_agent: StoryAgent = Depends(get_story_agent)):
+async def create_story(request: Request, story_agent: "StoryAgent" = Depends(get_story_agent)):
+    """
+    Generate a story. With an Idempotency-Key header, retries of the same
+    request are answered with the first response instead of a new story.
+    """
+    key = request.headers.get("idempotency-key")
+    if not key:
+        return await _create_story(request, story_agent)
+    return await _idempotent(request, "story_create", key,
+                             lambda: _create_story(request, story_agent, watch_disconnect=False))
+
+async def _create_story(request: Request, story_agent: "StoryAgent", watch_disconnect: bool = True):
     try:
         data = await request.json()
         user_id = data.get('user_id', 'anonymous_user')
 
-        if data.get('random', False):
-            try:
-                genre = random.choice(story_agent._valid_genres or ["fantasy"])
-                mood = random.choice(story_agent._valid_moods or ["mysterious"])
-                length = random.choice(story_agent._valid_lengths or ["short"])
-            except Exception as e:
-                logger.error(f"Error selecting random parameters for story creation: {e}")
-                genre, mood, length = "fantasy", "mysterious", "short"
-            logger.debug(f"Random story request for {user_id}: Create a {length} {genre} story with a {mood} mood")
-        else:
-            genre = data.get("genre")
-            mood = data.get("mood")
-            length = data.get("length")
-            logger.debug(f"Story request from {user_id}: genre={genre}, mood={mood}, length={length}")
-
-        if not all([genre, mood, length]):
-            raise HTTPException(status_code=400, detail="Genre, mood, and length are required for non-random story creation.")
+        # Serve from the pre-generated pool when a ready story exists
+        if story_pool is not None:
+            if data.get('random', False):
+                pooled = story_pool.take_random()
+            else:
+                genre, mood, length = _resolve_story_parameters(data, story_agent, user_id)
+                story = story_pool.take(genre, mood, length)
+                pooled = ((genre, mood, length), story) if story else None
+            if pooled:
+                (genre, mood, length), story = pooled
+                logger.debug(f"Serving pooled {length} {mood} {genre} story to {user_id}")
+                record_route("story_pooled")
+                return JSONResponse(content={
+                    "success": True,
+                    "story": story,
+                    "parameters": {"genre": genre, "mood": mood, "length": length},
+                    "pooled": True
+                })
+
+        genre, mood, length = _resolve_story_parameters(data, story_agent, user_id)
 
         tool_request = ToolRequest(
             user_id=user_id,
@@ -90,7 +483,10 @@ async def create_story(request: Request, story_agent: StoryAgent = Depends(get_s
             }
         )
 
-        result = story_agent.process(tool_request)
+        work = story_agent.process_async(tool_request)
+        with scheduling_scope(user=user_id):
+            # With an idempotency key the story is finished even if the client leaves; its retry will want it
+            result = await (_unless_disconnected(request, work, "story") if watch_disconnect else work)
         if not result or not hasattr(result, 'output') or not result.success:
             logger.error(f"StoryAgent returned invalid or unsuccessful response for user {user_id}: {result.message if result else 'No result'}")
             return JSONResponse(status_code=500, content={"success": False, "message": result.message if result else "Failed to generate story due to an internal error."})
@@ -104,16 +500,204 @@ async def create_story(request: Request, story_agent: StoryAgent = Depends(get_s
                 "length": length
             }
         }
+        if getattr(result, "degraded", False):
+            response["degraded"] = True
         return JSONResponse(content=response)
 
     except HTTPException as http_e:
         raise http_e
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.exception(f"Unhandled error in create_story endpoint for user {user_id}: {e}")
         return JSONResponse(status_code=500, content={"success": False, "message": "An unexpected error occurred while generating the story."})
 
+@app.api_route("/api/story/stream", methods=["GET", "POST"])
+async def stream_story(request: Request, story_agent: "StoryAgent" = Depends(get_story_agent)):
+    """
+    Server-sent-events variant of /api/story/create.
+    Sends the title header immediately, then story chunks as the model
+    produces them, then the footer. GET takes the parameters as query
+    arguments so the endpoint also works with EventSource.
+    """
+    if request.method == "GET":
+        data = dict(request.query_params)
+        data["random"] = data.get("random", "").lower() in ("1", "true", "yes")
+    else:
+        data = await request.json()
+    user_id = data.get('user_id', 'anonymous_user')
+    genre, mood, length = _resolve_story_parameters(data, story_agent, user_id)
+    parameters = {"genre": genre, "mood": mood, "length": length}
+    budget = _request_budget(request, retry_policy.stream_timeout)
+
+    async def event_stream():
+        yield _sse_event("parameters", parameters)
+        try:
+            with deadline_scope(budget), scheduling_scope(user=user_id):
+                async for event in iterate_blocking(story_agent.stream_story(genre, mood, length, user_id)):
+                    yield _sse_event(event["event"], {key: value for key, value in event.items() if key != "event"})
+            yield _sse_event("done", {"success": True})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client disconnected; iterate_blocking closes the story stream, which hangs up on the model
+            _abandon_request("story_stream")
+            raise
+        except Exception as e:
+            logger.exception(f"Unhandled error in stream_story endpoint for user {user_id}: {e}")
+            yield _sse_event("error", {"success": False, "message": "An unexpected error occurred while generating the story."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Batch story generation ---
+BATCH_CONCURRENCY = int(os.getenv("PLOTBUDDY_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_STORIES = int(os.getenv("PLOTBUDDY_BATCH_MAX_STORIES", "50"))
+_FALLBACK_MESSAGES = ("LLM_UNAVAILABLE_FALLBACK", "LLM_OVERLOADED_FALLBACK")
+
+def _batch_concurrency(requested) -> int:
+    try:
+        requested = int(requested) if requested is not None else BATCH_CONCURRENCY
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="concurrency must be an integer.")
+    return max(1, min(requested, BATCH_CONCURRENCY))
+
+def _resolve_batch_spec(spec, story_agent: "StoryAgent", user_id: str):
+    """(genre, mood, length) for one batch item: an object like a story request body, or a 3-item list."""
+    if isinstance(spec, (list, tuple)) and len(spec) == 3:
+        spec = dict(zip(("genre", "mood", "length"), spec))
+    if not isinstance(spec, dict):
+        raise HTTPException(status_code=400, detail="Each story must be a {genre, mood, length} object or a [genre, mood, length] list.")
+    return _resolve_story_parameters(spec, story_agent, user_id)
+
+@app.post("/api/story/batch")
+async def story_batch(request: Request, story_agent: "StoryAgent" = Depends(get_story_agent)):
+    """
+    Generate several stories concurrently and stream them back as NDJSON.
+
+    Body: {"user_id": ..., "stories": [{"genre", "mood", "length"} | {"random": true} | [genre, mood, length], ...],
+    "concurrency": optional, capped at PLOTBUDDY_BATCH_CONCURRENCY}. Each story gets the full
+    request budget. One line is written per story as it finishes, tagged with its index in
+    "stories" and shaped like a /api/story/create response; a final line with "done": true
+    summarises the batch.
+    """
+    data = await request.json()
+    user_id = data.get('user_id', 'anonymous_user')
+    specs = data.get("stories")
+    if not isinstance(specs, list) or not specs:
+        raise HTTPException(status_code=400, detail="stories must be a non-empty list.")
+    if len(specs) > BATCH_MAX_STORIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_STORIES} stories per batch.")
+    stories = [_resolve_batch_spec(spec, story_agent, user_id) for spec in specs]
+    semaphore = asyncio.Semaphore(_batch_concurrency(data.get("concurrency")))
+    item_budget = _request_budget(request)
+    logger.debug(f"Batch of {len(stories)} stories for {user_id}")
+
+    async def generate(index: int, genre: str, mood: str, length: str) -> dict:
+        parameters = {"genre": genre, "mood": mood, "length": length}
+        async with semaphore:
+            try:
+                with deadline_scope(item_budget), scheduling_scope(BACKGROUND, user_id):
+                    result = await story_agent.process_async(ToolRequest(user_id=user_id, input=parameters))
+            except Exception as e:
+                logger.exception(f"Batch story {index} failed for user {user_id}: {e}")
+                return {"index": index, "success": False, "parameters": parameters,
+                        "message": "An unexpected error occurred while generating the story."}
+        if not result.success:
+            return {"index": index, "success": False, "parameters": parameters, "message": result.message}
+        line = {"index": index, "success": True, "story": result.output, "parameters": parameters}
+        if result.message in _FALLBACK_MESSAGES:
+            line["fallback"] = True
+        if getattr(result, "degraded", False):
+            line["degraded"] = True
+        return line
+
+    async def results():
+        tasks = [asyncio.ensure_future(generate(index, *story)) for index, story in enumerate(stories)]
+        summary = {"done": True, "stories": len(tasks), "succeeded": 0, "fallbacks": 0, "failed": 0}
+        try:
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                summary["succeeded" if line["success"] else "failed"] += 1
+                summary["fallbacks"] += bool(line.get("fallback"))
+                yield json.dumps(line) + "\n"
+            yield json.dumps(summary) + "\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            _abandon_request("story_batch")
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _require_job_queue() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Story jobs are not available.")
+    return job_queue
+
+def _get_job(job_id: str) -> dict:
+    job = _require_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job
+
+@app.post("/api/story/jobs", status_code=202)
+async def submit_story_job(request: Request, story_agent: "StoryAgent" = Depends(get_story_agent)):
+    """Queue a story (same body as /api/story/create) and return its job id right away."""
+    queue = _require_job_queue()
+    data = await request.json()
+    user_id = data.get('user_id', 'anonymous_user')
+    genre, mood, length = _resolve_story_parameters(data, story_agent, user_id)
+    job_id = queue.submit(user_id, {"user_id": user_id, "genre": genre, "mood": mood, "length": length})
+    logger.debug(f"Queued story job {job_id} for {user_id}")
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/story/jobs/{job_id}",
+        "result_url": f"/api/story/jobs/{job_id}/result",
+    })
+
+@app.get("/api/story/jobs/{job_id}")
+async def story_job_status(job_id: str):
+    """Status of a story job, with the text generated so far while it runs."""
+    job = _get_job(job_id)
+    return JSONResponse(content={
+        "job_id": job_id,
+        "status": job["status"],
+        "queue_position": job["queue_position"],
+        "attempts": job["attempts"],
+        "parameters": {key: job["params"][key] for key in ("genre", "mood", "length")},
+        "progress": {"characters": len(job["progress"]), "text": job["progress"]},
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    })
+
+@app.get("/api/story/jobs/{job_id}/result")
+async def story_job_result(job_id: str):
+    """
+    The finished story, shaped like a /api/story/create response. Answers
+    202 with a Retry-After header while the job is still queued or running.
+    """
+    job = _get_job(job_id)
+    if job["status"] == SUCCEEDED:
+        result = job["result"]
+        response = {"success": True, "job_id": job_id, "story": result["story"], "parameters": result["parameters"]}
+        if result.get("degraded"):
+            response["degraded"] = True
+        return JSONResponse(content=response)
+    if job["status"] == FAILED:
+        return JSONResponse(status_code=500, content={"success": False, "job_id": job_id, "status": FAILED,
+                                                      "message": "Story generation failed. Please submit the job again."})
+    return JSONResponse(status_code=202, headers={"Retry-After": "2"},
+                        content={"success": False, "job_id": job_id, "status": job["status"]})
+
 @app.post("/api/chat")
-async def chat(request: Request):
+async def chat(request: Request, orchestrator: "OrchestratorAgent" = Depends(get_orchestrator)):
     try:
         data = await request.json()
         user_input = data.get('input', '')
@@ -128,12 +712,14 @@ async def chat(request: Request):
             context["time_zone"] = time_zone
 
         tool_request = ToolRequest(user_id=user_id, input=user_input, context=context)
-        response = orchestrator.process(tool_request)
+        with scheduling_scope(user=user_id):
+            response = await _unless_disconnected(request, orchestrator.process_async(tool_request), "chat")
 
         # Defensive: ensure response is a ToolResponse and all fields are serializable
         success = getattr(response, "success", False)
         output = getattr(response, "output", "")
         message = getattr(response, "message", "")
+        degraded = bool(getattr(response, "degraded", False))
 
         # Ensure output and message are strings (not objects or None)
         if output is None:
@@ -145,16 +731,18 @@ async def chat(request: Request):
         if not isinstance(message, str):
             message = str(message)
 
-        logger.debug(
-            f"API chat response for {user_id}: success={success}, output={output}, message={message}"
-        )
+        logger.debug("API chat response", extra={"event": "chat_response", "user_id": user_id, "success": success,
+                                                  "output": output, "reply_message": message})
         return JSONResponse(
             content={
                 "success": success,
                 "output": output,
-                "message": message
+                "message": message,
+                "degraded": degraded
             }
         )
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.exception(f"Unhandled error in chat endpoint: {e}")
         return JSONResponse(
@@ -167,11 +755,11 @@ async def chat(request: Request):
         )
 
 @app.post("/api/profile")
-async def get_profile(request: Request, profile_agent: ProfileAgent = Depends(get_profile_agent)):
+async def get_profile(request: Request, profile_agent: "ProfileAgent" = Depends(get_profile_agent)):
     try:
         data = await request.json()
         user_id = data.get('user_id', 'default')
-        user_profile = profile_agent._get_user_profile(user_id)
+        user_profile = await run_blocking(profile_agent._get_user_profile, user_id)
         return JSONResponse(content=user_profile)
     except Exception as e:
         logger.exception(f"Profile error for user {user_id}: {e}")
@@ -186,16 +774,58 @@ async def get_profile(request: Request, profile_agent: ProfileAgent = Depends(ge
             "message": "Failed to load profile. Displaying default data."
         })
 
+# --- Metrics ---
+metrics.callback_gauge("plotbuddy_model_pool_clients", "Pooled GenerativeModel clients.",
+                       lambda: model_pool.stats()["size"])
+metrics.callback_gauge("plotbuddy_model_pool_reuses", "Model calls served by an existing pooled client.",
+                       lambda: model_pool.stats()["reuses"])
+metrics.callback_gauge("plotbuddy_model_calls_coalesced", "Model calls answered by an identical in-flight call.",
+                       lambda: model_calls.stats()["coalesced"])
+metrics.callback_gauge("plotbuddy_admission_inflight", "Model calls holding an admission slot.",
+                       lambda: admission.stats()["inflight"])
+metrics.callback_gauge("plotbuddy_admission_queue_wait_seconds", "Smoothed LLM executor queue wait used for shedding.",
+                       lambda: admission.stats()["queue_wait"])
+metrics.callback_gauge("plotbuddy_llm_scheduler_running", "Model calls holding a scheduler slot.",
+                       lambda: scheduler.stats()["running"])
+metrics.callback_gauge("plotbuddy_jobs_queued", "Story jobs waiting for a worker.",
+                       lambda: job_queue.stats()["queued"] if job_queue is not None else 0)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+async def list_traces(limit: int = 20):
+    """The most recent traces in the buffer, newest first."""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is off (PLOTBUDDY_TRACING=off).")
+    return JSONResponse(content={"traces": tracer.buffer.traces(max(1, min(limit, 200)))})
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Every span of one trace still in the buffer, in start order."""
+    spans = tracer.buffer.trace(trace_id) if tracer.enabled else []
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found (tracing off or evicted from the buffer).")
+    return JSONResponse(content={"trace_id": trace_id, "spans": spans})
+
+@app.get("/debug/routing")
+async def routing():
+    """The orchestrator's decision pipeline: stages in order, their cost and the keywords they match."""
+    from multi_tool_agent.agents.pipeline import routing_table
+
+    return JSONResponse(content={"stages": routing_table()})
+
 @app.post("/api/debug")
 async def debug_greeting():
-    from multi_tool_agent.agents.greeting import GreetingAgent
-    agent = GreetingAgent()
+    agent = agent_registry.greeting_agent
     request = ToolRequest(user_id="test_user", input="hi")
-    response = agent.process(request)
+    response = await agent.process_async(request)
     return JSONResponse(content={"success": response.success, "output": response.output, "message": response.message})
 
 @app.post("/api/profile/brainstorm")
-async def profile_brainstorm(request: Request, profile_agent: ProfileAgent = Depends(get_profile_agent)):
+async def profile_brainstorm(request: Request, profile_agent: "ProfileAgent" = Depends(get_profile_agent)):
     try:
         data = await request.json()
         genre = data.get('genre', '')
@@ -208,14 +838,18 @@ async def profile_brainstorm(request: Request, profile_agent: ProfileAgent = Dep
             user_id=user_id,
             context={"brainstorm": True, "genre": genre, "mood": mood, "length": length}
         )
-        response = profile_agent.process(tool_request)
-        return JSONResponse(content={"success": response.success, "output": response.output, "message": response.message})
+        with scheduling_scope(user=user_id):
+            response = await _unless_disconnected(request, profile_agent.process_async(tool_request), "profile_brainstorm")
+        return JSONResponse(content={"success": response.success, "output": response.output, "message": response.message,
+                                     "degraded": response.degraded})
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.exception(f"Error in profile brainstorming for user {user_id}: {e}")
         return JSONResponse(status_code=500, content={"success": False, "output": "Sorry, I encountered an error while brainstorming.", "message": str(e)})
 
 @app.post("/api/profile/advice")
-async def profile_advice(request: Request, profile_agent: ProfileAgent = Depends(get_profile_agent)):
+async def profile_advice(request: Request, profile_agent: "ProfileAgent" = Depends(get_profile_agent)):
     try:
         data = await request.json()
         context_text = data.get('context', '')
@@ -228,8 +862,12 @@ async def profile_advice(request: Request, profile_agent: ProfileAgent = Depends
             user_id=user_id,
             context={"advice": True, "context": context_text, "genre": genre, "mood": mood}
         )
-        response = profile_agent.process(tool_request)
-        return JSONResponse(content={"success": response.success, "output": response.output, "message": response.message})
+        with scheduling_scope(user=user_id):
+            response = await _unless_disconnected(request, profile_agent.process_async(tool_request), "profile_advice")
+        return JSONResponse(content={"success": response.success, "output": response.output, "message": response.message,
+                                     "degraded": response.degraded})
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
     except Exception as e:
         logger.exception(f"Error in profile advice for user {user_id}: {e}")
         return JSONResponse(status_code=500, content={"success": False, "output": "Sorry, I encountered an error while providing advice.", "message": str(e)})
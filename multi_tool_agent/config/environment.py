@@ -0,0 +1,26 @@
+"""
+Loads multi_tool_agent/.env into the process environment, once.
+
+Variables already set in the environment win over the file, so deployed
+settings (e.g. on Cloud Run) are never overridden by a stray .env.
+"""
+
+import os
+import threading
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_environment() -> None:
+    """Load ENV_FILE if it has not been loaded yet."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv(ENV_FILE)
+            _loaded = True
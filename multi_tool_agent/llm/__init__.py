@@ -0,0 +1,52 @@
+"""
+PlotBuddy LLM Package
+Shared infrastructure for calling generative models from the agents.
+"""
+
+from .admission import AdmissionController, OverloadedError, admission
+from .breaker import CircuitBreaker, CircuitOpenError, breaker_stats, classify_error, get_breaker
+from .retry import (Deadline, DeadlineExceededError, RequestCancelledError, RetryPolicy,
+                    current_deadline, deadline_scope, retry_policy)
+from .scheduler import LLMScheduler, QueueTimeoutError, scheduler, scheduling_scope
+from .executor import run_blocking, submit_blocking, iterate_blocking, get_executor, shutdown_executor
+from .singleflight import SingleFlight
+from .pool import ModelClientPool, get_model, model_pool
+from .gateway import (generate_text, stream_slot, count_model_calls, inflight_model_calls, EmptyResponseError,
+                      MissingAPIKeyError)
+
+__all__ = [
+    'run_blocking',       # Await a blocking call on the bounded LLM executor
+    'submit_blocking',    # Start a blocking call on the executor without waiting
+    'iterate_blocking',   # Consume a blocking iterator from async code
+    'get_executor',       # Shared ThreadPoolExecutor for model calls
+    'shutdown_executor',  # Stop the executor (e.g. on server shutdown)
+    'SingleFlight',       # Coalesces identical concurrent calls
+    'ModelClientPool',    # Reusable GenerativeModel clients
+    'get_model',          # Pooled client for (model name, generation config)
+    'model_pool',         # The shared pool (size and reuse stats)
+    'generate_text',      # Gateway for every agent model call
+    'stream_slot',        # Slots and metrics for a streamed model call
+    'inflight_model_calls',  # Waiters per in-flight model call
+    'count_model_calls',  # Count the model calls made in a block (e.g. per chat request)
+    'AdmissionController',  # Sheds model calls above in-flight / queue-wait thresholds
+    'admission',          # The shared controller
+    'CircuitBreaker',     # Fails fast after repeated upstream failures
+    'get_breaker',        # Shared breaker per model
+    'breaker_stats',      # State of every breaker
+    'classify_error',     # quota / overload / auth / transient / ...
+    'RetryPolicy',        # Jittered backoff bounded by the request deadline
+    'retry_policy',       # The shared policy
+    'Deadline',           # A request's time budget
+    'deadline_scope',     # Make a deadline current for a block
+    'current_deadline',   # Deadline of the request being handled
+    'LLMScheduler',       # Priority classes and per-user fair queuing for model calls
+    'scheduler',          # The shared scheduler
+    'scheduling_scope',   # Set the priority class / user for model calls in a block
+    'EmptyResponseError',
+    'MissingAPIKeyError',
+    'OverloadedError',
+    'CircuitOpenError',
+    'DeadlineExceededError',
+    'RequestCancelledError',
+    'QueueTimeoutError',
+]
@@ -0,0 +1,136 @@
+"""
+Admission control for model calls.
+
+Tracks how many upstream model calls are in flight and how long work waits
+on the LLM executor before it starts. When either goes over its threshold,
+new model calls are refused at once with `OverloadedError`; the agents catch
+it and answer with their static fallbacks, marked `degraded`, instead of
+queueing behind calls that are already late.
+
+Thresholds (0 disables a check):
+- PLOTBUDDY_ADMISSION_MAX_INFLIGHT: concurrent model calls (default 64)
+- PLOTBUDDY_ADMISSION_MAX_QUEUE_WAIT: smoothed executor queue wait in seconds (default 2)
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from ..observability.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_SHED = metrics.counter(
+    "plotbuddy_llm_shed_total", "Model calls refused by admission control, by reason.", ("reason",))
+QUEUE_WAIT = metrics.histogram(
+    "plotbuddy_llm_queue_wait_seconds", "Time work waited on the LLM executor before starting.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class OverloadedError(RuntimeError):
+    """A model call was refused because the service is over its admission thresholds."""
+
+    def __init__(self, reason: str, message: Optional[str] = None):
+        super().__init__(message or f"Model calls are being shed ({reason}).")
+        self.reason = reason
+
+
+class AdmissionController:
+    """Counts in-flight model calls and smooths executor queue wait; refuses calls above thresholds."""
+
+    def __init__(self, max_inflight: int = 64, max_queue_wait: float = 2.0, smoothing: float = 0.2,
+                 wait_window: float = 5.0):
+        """
+        Args:
+            max_inflight: Model calls allowed at once (0 for no limit).
+            max_queue_wait: Smoothed queue wait in seconds above which calls are shed (0 to ignore).
+            smoothing: Weight of each new queue-wait sample in the moving average.
+            wait_window: Seconds without samples after which the queue is considered drained.
+        """
+        self.max_inflight = max(0, int(max_inflight))
+        self.max_queue_wait = max(0.0, max_queue_wait)
+        self.smoothing = smoothing
+        self.wait_window = wait_window
+        self._inflight = 0
+        self._queue_wait = 0.0
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "shed_inflight": 0, "shed_queue_wait": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_inflight=int(_env_number("PLOTBUDDY_ADMISSION_MAX_INFLIGHT", 64)),
+            max_queue_wait=_env_number("PLOTBUDDY_ADMISSION_MAX_QUEUE_WAIT", 2.0),
+        )
+
+    def observe_queue_wait(self, seconds: float) -> None:
+        """Record how long one unit of work waited for an executor thread."""
+        QUEUE_WAIT.observe(seconds)
+        with self._lock:
+            self._queue_wait += self.smoothing * (seconds - self._queue_wait)
+            self._sampled_at = time.monotonic()
+
+    def queue_wait(self) -> float:
+        """Smoothed recent queue wait; 0 once no work has been queued for `wait_window` seconds."""
+        with self._lock:
+            return self._current_wait(time.monotonic())
+
+    def _current_wait(self, now: float) -> float:
+        # Called with the lock held
+        if now - self._sampled_at > self.wait_window:
+            self._queue_wait = 0.0
+        return self._queue_wait
+
+    def _shed_reason(self) -> Optional[str]:
+        # Called with the lock held
+        if self.max_inflight and self._inflight >= self.max_inflight:
+            return "inflight"
+        if self.max_queue_wait and self._current_wait(time.monotonic()) > self.max_queue_wait:
+            return "queue_wait"
+        return None
+
+    def overloaded(self) -> Optional[str]:
+        """Why a new model call would be shed right now, or None if it would be admitted."""
+        with self._lock:
+            return self._shed_reason()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one in-flight model call slot; raises OverloadedError if none is available."""
+        with self._lock:
+            reason = self._shed_reason()
+            if reason is None:
+                self._inflight += 1
+                self._stats["admitted"] += 1
+            else:
+                self._stats[f"shed_{reason}"] += 1
+        if reason is not None:
+            LLM_SHED.inc(reason=reason)
+            raise OverloadedError(reason)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats: Dict[str, float] = dict(self._stats)
+            stats["inflight"] = self._inflight
+            stats["queue_wait"] = self._current_wait(time.monotonic())
+        return stats
+
+
+admission = AdmissionController.from_env()
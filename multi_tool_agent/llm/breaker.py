@@ -0,0 +1,245 @@
+"""
+Circuit breaker for upstream model calls.
+
+Errors are classified by exception type, not message text:
+
+- quota:     429 / RESOURCE_EXHAUSTED
+- overload:  503 / UNAVAILABLE
+- auth:      401 / 403
+- transient: other 5xx, deadlines, dropped connections
+- invalid:   other 4xx (bad prompt or config)
+- empty:     the model answered without usable text
+- config:    no API key configured (fails locally, so it never trips)
+- shed:      refused locally by admission control
+- other:     anything else
+
+Consecutive quota/overload/auth/transient failures for one model open its
+breaker. While open, calls fail at once with CircuitOpenError, so agents
+go straight to their fallbacks without waiting on the network. After
+`recovery_time` seconds the breaker is half-open: a single probe call is let
+through, and its outcome closes the breaker or opens it again.
+
+PLOTBUDDY_BREAKER_FAILURES sets the failure threshold (default 5, 0 disables);
+PLOTBUDDY_BREAKER_RECOVERY the open time in seconds (default 30).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from ..observability.metrics import metrics
+from .admission import OverloadedError
+from .pool import EmptyResponseError, MissingAPIKeyError
+
+logger = logging.getLogger(__name__)
+
+QUOTA = "quota"
+OVERLOAD = "overload"
+AUTH = "auth"
+TRANSIENT = "transient"
+INVALID = "invalid"
+EMPTY = "empty"
+CONFIG = "config"
+SHED = "shed"
+OTHER = "other"
+
+# Error classes that count towards opening the breaker
+TRIPPING_ERRORS = frozenset({QUOTA, OVERLOAD, AUTH, TRANSIENT})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.gauge(
+    "plotbuddy_llm_breaker_state", "Circuit breaker state per model (0 closed, 1 half-open, 2 open).", ("model",))
+BREAKER_REJECTED = metrics.counter(
+    "plotbuddy_llm_breaker_rejected_total", "Model calls failed fast by an open circuit breaker.", ("model",))
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+def classify_error(error: BaseException) -> str:
+    """Map an exception from a model call to one of the error classes above."""
+    # Imported here so that importing the package does not load the Google client libraries
+    from google.api_core import exceptions as api_exceptions
+
+    if isinstance(error, OverloadedError):
+        return SHED
+    if isinstance(error, api_exceptions.TooManyRequests):
+        return QUOTA
+    if isinstance(error, api_exceptions.ServiceUnavailable):
+        return OVERLOAD
+    if isinstance(error, (api_exceptions.Unauthorized, api_exceptions.Forbidden)):
+        return AUTH
+    if isinstance(error, MissingAPIKeyError):
+        return CONFIG
+    # OSError covers timeouts and dropped connections, including the requests library's
+    if isinstance(error, (api_exceptions.ServerError, api_exceptions.RetryError, OSError)):
+        return TRANSIENT
+    if isinstance(error, api_exceptions.ClientError):
+        return INVALID
+    if isinstance(error, EmptyResponseError):
+        return EMPTY
+    return OTHER
+
+
+class CircuitOpenError(OverloadedError):
+    """
+    The model's circuit breaker is open; the call was not attempted. Agents
+    handle it like shed load and serve their degraded fallbacks.
+    """
+
+    def __init__(self, model: str, retry_in: float):
+        super().__init__("circuit_open", f"Circuit breaker for {model} is open; retrying in {retry_in:.0f}s.")
+        self.model = model
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one model."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(0, int(failure_threshold))
+        self.recovery_time = recovery_time
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0, "probes": 0}
+        BREAKER_STATE.set(_STATE_VALUES[CLOSED], model=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        # Called with the lock held
+        if self._state == OPEN and now - self._opened_at >= self.recovery_time:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        # Called with the lock held
+        if state != self._state:
+            logger.warning(f"Circuit breaker for {self.name}: {self._state} -> {state}"
+                           + (f" (last error: {self._last_error})" if state == OPEN else ""))
+        self._state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], model=self.name)
+
+    def rejecting(self) -> bool:
+        """True if a call made now would be failed fast (open, or half-open with a probe in flight)."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == OPEN or (state == HALF_OPEN and self._probing)
+
+    def before_call(self) -> bool:
+        """
+        Admit one call or raise CircuitOpenError. Returns True if the call is
+        the half-open probe; pass that to `after_call`.
+        """
+        if not self.failure_threshold:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self._stats["probes"] += 1
+                return True
+            self._stats["rejected"] += 1
+            retry_in = max(0.0, self.recovery_time - (now - self._opened_at))
+        BREAKER_REJECTED.inc(model=self.name)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def after_call(self, probe: bool, error_class: Optional[str] = None) -> None:
+        """Record the outcome of an admitted call; `error_class` is None on success."""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if probe:
+                self._probing = False
+            if error_class == SHED:
+                # Never reached the model; says nothing about its health
+                return
+            if error_class in TRIPPING_ERRORS:
+                self._failures += 1
+                self._last_error = error_class
+                if probe or self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+                    self._stats["opened"] += 1
+                    self._set_state(OPEN)
+                return
+            self._failures = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Run one model call under the breaker; raises CircuitOpenError while open."""
+        probe = self.before_call()
+        try:
+            yield
+        except Exception as e:
+            self.after_call(probe, classify_error(e))
+            raise
+        except BaseException:
+            # Cancelled or abandoned by the caller: not a verdict on the model
+            self.after_call(probe, SHED)
+            raise
+        self.after_call(probe)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats: Dict[str, object] = dict(self._stats)
+            stats["state"] = self._current_state(time.monotonic())
+            stats["failures"] = self._failures
+            stats["last_error"] = self._last_error
+        return stats
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """The shared breaker for `model`, configured from the environment on first use."""
+    breaker = _breakers.get(model)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(model)
+            if breaker is None:
+                breaker = _breakers[model] = CircuitBreaker(
+                    model,
+                    failure_threshold=int(_env_number("PLOTBUDDY_BREAKER_FAILURES", 5)),
+                    recovery_time=_env_number("PLOTBUDDY_BREAKER_RECOVERY", 30.0),
+                )
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, object]]:
+    """Stats of every breaker created so far, by model."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+def reset_breakers() -> None:
+    """Forget all breakers (tests, or after fixing credentials)."""
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,116 @@
+"""
+Bounded executor for blocking model calls.
+
+The Gemini SDK and the agents' `process` methods are synchronous. Async
+callers (the FastAPI endpoints) hand that work to this executor so the
+event loop stays free while a model call is in flight.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from .admission import admission
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 64
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _max_workers() -> int:
+    try:
+        return max(1, int(os.getenv("PLOTBUDDY_LLM_WORKERS", DEFAULT_MAX_WORKERS)))
+    except ValueError:
+        logger.warning("Invalid PLOTBUDDY_LLM_WORKERS value, using default.")
+        return DEFAULT_MAX_WORKERS
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        workers = _max_workers()
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plotbuddy-llm")
+        logger.info(f"LLM executor started with {workers} workers.")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable on the bounded LLM executor and await its result.
+    Context variables of the caller are visible inside the worker thread.
+    The time spent waiting for a worker feeds admission control.
+    """
+    return await asyncio.wrap_future(_submit(func, *args, **kwargs))
+
+
+def submit_blocking(func: Callable[..., Any], *args, **kwargs) -> "Future[Any]":
+    """
+    Start a blocking callable on the bounded LLM executor without waiting
+    for it, e.g. background work a request sets off. Context variables of
+    the caller are visible inside the worker thread.
+    """
+    return _submit(func, *args, **kwargs)
+
+
+def _submit(func: Callable[..., Any], *args, **kwargs) -> "Future[Any]":
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return get_executor().submit(_timed(call, time.perf_counter()))
+
+
+def _timed(call: Callable[[], Any], queued_at: float) -> Callable[[], Any]:
+    def run() -> Any:
+        admission.observe_queue_wait(time.perf_counter() - queued_at)
+        return call()
+    return run
+
+
+_EXHAUSTED = object()
+
+
+async def iterate_blocking(iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Consume a blocking iterator (e.g. a streaming model response) from async
+    code. Each `next()` runs on the LLM executor; the iterator is closed if
+    the consumer stops early or is cancelled (e.g. the client disconnected).
+    """
+    pending: Optional["Future[Any]"] = None
+    try:
+        while True:
+            pending = _submit(next, iterator, _EXHAUSTED)
+            item = await asyncio.wrap_future(pending)
+            pending = None
+            if item is _EXHAUSTED:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            # Not awaited: a cancelled consumer cannot wait. A `next()` still running on its
+            # worker thread is let finish first, since closing a running generator fails.
+            if pending is None or pending.done():
+                _submit(_close_quietly, close)
+            else:
+                pending.add_done_callback(lambda _: _submit(_close_quietly, close))
+
+
+def _close_quietly(close: Callable[[], Any]) -> None:
+    try:
+        close()
+    except Exception as e:
+        logger.debug(f"Closing blocking iterator failed: {e}")
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    """Stop the shared executor; a new one is created on next use."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
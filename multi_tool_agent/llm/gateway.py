@@ -0,0 +1,185 @@
+"""
+Model-call gateway.
+
+Every agent sends its Gemini prompts through `generate_text` (or streams
+them under `stream_slot`), so cross-cutting behaviour such as request coalescing, retries within the
+request deadline, admission control, the circuit breaker and priority
+scheduling lives in one place.
+"""
+
+import contextvars
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from ..observability.metrics import observe_llm_call
+from ..observability.tracing import annotate, span
+from .admission import OverloadedError, admission
+from .breaker import CircuitOpenError, classify_error, get_breaker
+from .pool import EmptyResponseError, MissingAPIKeyError, get_model
+from .retry import current_deadline, request_options, retry_policy
+from .scheduler import INTERACTIVE, scheduler
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Concurrent calls with identical (model, prompt, generation config) share one upstream request
+model_calls = SingleFlight()
+
+
+class ModelCallTally:
+    """Model calls made inside a `count_model_calls` block."""
+
+    def __init__(self):
+        self.calls = 0       # generate_text calls
+        self.attempts = 0    # upstream requests they made, retries included
+        self.coalesced = 0   # calls answered by an identical call already in flight
+        self._lock = threading.Lock()
+
+    def add(self, calls: int = 0, attempts: int = 0, coalesced: int = 0) -> None:
+        with self._lock:
+            self.calls += calls
+            self.attempts += attempts
+            self.coalesced += coalesced
+
+
+_tally: "contextvars.ContextVar[Optional[ModelCallTally]]" = contextvars.ContextVar("plotbuddy_model_calls",
+                                                                                    default=None)
+
+
+@contextmanager
+def count_model_calls() -> Iterator[ModelCallTally]:
+    """
+    Count the model calls made in the block, including those made on the
+    LLM executor from it (run_blocking copies the context).
+    """
+    tally = ModelCallTally()
+    token = _tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _tally.reset(token)
+
+
+class _LeaderGaveUp(Exception):
+    """
+    The leader of a shared call stopped because its own request was
+    cancelled or ran out of time; `error` is what it stopped with. Followers
+    whose requests are still live start the call again instead.
+    """
+
+    def __init__(self, error: BaseException):
+        super().__init__(str(error))
+        self.error = error
+
+
+def _call_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]]) -> str:
+    payload = json.dumps([prompt, generation_config or {}], sort_keys=True, default=str)
+    return f"{model_name}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _generate(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]], timeout: float,
+              priority: str) -> str:
+    waiting_since = time.perf_counter()
+    # Admission counts calls running upstream, so the scheduler slot comes first: calls queued
+    # for it must not use up the in-flight limit and get higher-priority calls shed
+    with get_breaker(model_name).guard(), scheduler.slot(priority), admission.slot(), \
+            observe_llm_call(model_name, classify_error):
+        annotate(queued_ms=round((time.perf_counter() - waiting_since) * 1000, 3))
+        # Time spent queued for the scheduler comes out of this attempt's budget
+        timeout = min(timeout, retry_policy.timeout_for_attempt(current_deadline()))
+        model = get_model(model_name, generation_config)
+        response = model.generate_content(prompt, request_options=request_options(timeout))
+        text = getattr(response, "text", None) if response is not None else None
+        if not text:
+            raise EmptyResponseError("No valid response received from the AI model.")
+        return text
+
+
+@contextmanager
+def stream_slot(model_name: str, priority: str = INTERACTIVE) -> Iterator[None]:
+    """
+    Hold what a streamed model call runs under: the model's breaker, a
+    scheduler slot in class `priority` and an admission slot, taken in the
+    same order as `generate_text`. The call counts in the LLM metrics and
+    the current `count_model_calls` tally. Streams are neither retried nor
+    shared with identical calls, since their chunks have already gone out.
+    """
+    tally = _tally.get() or ModelCallTally()
+    tally.add(calls=1)
+    with get_breaker(model_name).guard(), scheduler.slot(priority), admission.slot(), \
+            observe_llm_call(model_name, classify_error):
+        tally.add(attempts=1)
+        yield
+
+
+def generate_text(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                  priority: str = INTERACTIVE) -> str:
+    """
+    Generate text for `prompt` with `model_name`.
+
+    Raises the SDK's exception (or EmptyResponseError / MissingAPIKeyError)
+    on failure, and OverloadedError without calling the model when admission
+    control is shedding load or CircuitOpenError (a subclass) while the
+    model's breaker is open; callers keep their own fallback handling.
+    Quota, overload and transient errors are retried while the current
+    request deadline (see llm.retry) leaves room; DeadlineExceededError means
+    it ran out before an attempt, RequestCancelledError (a subclass) that the
+    client went away.
+    Calls wait for the scheduler (see llm.scheduler) in class `priority`
+    unless the current scheduling scope sets another, and fail with
+    QueueTimeoutError (an OverloadedError) if they cannot start in time.
+    Callers joining an identical in-flight call do not take a slot. If the
+    caller that runs the shared call gives up because its own request was
+    cancelled or out of time, the others run the call again within theirs.
+    """
+    key = _call_key(model_name, prompt, generation_config)
+    attempts = itertools.count(1)
+    tally = _tally.get() or ModelCallTally()
+    tally.add(calls=1)
+
+    def attempt(timeout: float) -> str:
+        tally.add(attempts=1)
+        with span("llm.attempt", classify=classify_error, model=model_name, attempt=next(attempts),
+                  timeout_s=round(timeout, 3)):
+            return _generate(model_name, prompt, generation_config, timeout, priority)
+
+    def lead() -> str:
+        try:
+            return retry_policy.call(attempt, model=model_name)
+        except Exception as e:
+            deadline = current_deadline()
+            if deadline is not None and deadline.expired():
+                raise _LeaderGaveUp(e) from e
+            raise
+
+    with span("llm.generate", classify=classify_error, model=model_name, priority=priority,
+              prompt_chars=len(prompt)) as call:
+        rejoined = 0
+        while True:
+            led = []
+            try:
+                text = model_calls.do(key, lambda: led.append(True) or lead())
+                break
+            except _LeaderGaveUp as gave_up:
+                own = current_deadline()
+                if led or (own is not None and own.expired()):
+                    raise gave_up.error
+                # Another caller's request ended, not ours: start the call again
+                rejoined += 1
+                logger.info(f"Shared {model_name} call abandoned by its caller; retrying for this request.")
+        # Callers that joined an identical in-flight call made no attempts of their own
+        coalesced = not led
+        tally.add(coalesced=int(coalesced))
+        call.set(coalesced=coalesced, rejoined=rejoined, response_chars=len(text))
+        return text
+
+
+def inflight_model_calls() -> Dict[str, int]:
+    """Waiting callers per in-flight (model, prompt) key, for monitoring."""
+    return model_calls.inflight()
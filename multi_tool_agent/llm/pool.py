@@ -0,0 +1,144 @@
+"""
+Pooled Gemini model clients.
+
+`genai.configure` replaces the SDK's cached transport, so calling it per
+request throws away the open connection. The pool configures the SDK once
+per API key and keeps one GenerativeModel per (model name, generation
+config), so every request reuses the same client and its keep-alive
+channel.
+
+Set PLOTBUDDY_GEMINI_ENDPOINT (e.g. http://127.0.0.1:8089) to send every
+model call to another Gemini-compatible endpoint over REST.
+
+The SDK takes about a second to import, so it is loaded with the first
+client (or by the server's warm-up), not with this module.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def __getattr__(name):
+    # `genai` resolves to the SDK module, imported on first use
+    if name == "genai":
+        import google.generativeai as genai
+        return genai
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Base generate_content options. The SDK's default policy silently retries
+# 503s for up to ten minutes; failures are surfaced at once so the circuit
+# breaker sees them and llm.retry applies its own deadline-aware policy.
+REQUEST_OPTIONS = {"retry": None}
+
+PoolKey = Tuple[str, str]
+
+
+class MissingAPIKeyError(RuntimeError):
+    """No Google API key is configured."""
+
+
+class EmptyResponseError(RuntimeError):
+    """The model returned no usable text."""
+
+
+class ModelClientPool:
+    """Creates each GenerativeModel once and hands it out on every later request."""
+
+    def __init__(self):
+        self._models: Dict[PoolKey, Any] = {}
+        self._reuses: Dict[PoolKey, int] = {}
+        self._configured_key: Optional[Tuple[str, Optional[str]]] = None
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pool_key(model_name: str, generation_config: Optional[Dict[str, Any]]) -> PoolKey:
+        return model_name, json.dumps(generation_config or {}, sort_keys=True, default=str)
+
+    def _ensure_configured(self) -> None:
+        # Called with the lock held
+        import google.generativeai as genai
+
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            raise MissingAPIKeyError("Missing Google API key for model call.")
+        endpoint = os.environ.get("PLOTBUDDY_GEMINI_ENDPOINT")
+        configured_key = (api_key, endpoint)
+        if configured_key != self._configured_key:
+            if endpoint:
+                # Alternate backend such as the local fake Gemini server; only the REST transport can reach it
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            self._configured_key = configured_key
+            # Models created under the old configuration hold stale clients
+            self._models.clear()
+            logger.info("Gemini SDK configured for the model client pool.")
+
+    def get(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+        """Return the shared GenerativeModel for (model_name, generation_config)."""
+        key = self._pool_key(model_name, generation_config)
+        with self._lock:
+            self._ensure_configured()
+            model = self._models.get(key)
+            if model is not None:
+                self._reuses[key] = self._reuses.get(key, 0) + 1
+                return model
+            import google.generativeai as genai
+
+            model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+            self._models[key] = model
+            self._reuses.setdefault(key, 0)
+            self._created += 1
+            logger.info(f"Model client pool created client for '{model_name}' ({len(self._models)} pooled).")
+            return model
+
+    def warm_up(self, clients: Iterable[Tuple[str, Optional[Dict[str, Any]]]] = ()) -> int:
+        """
+        Import and configure the SDK and create the given (model name,
+        generation config) clients now rather than on the first model calls.
+        Returns the number of clients ready (0 without an API key).
+        """
+        with self._lock:
+            try:
+                self._ensure_configured()
+            except MissingAPIKeyError:
+                # Calls will fail with a clear error later; loading the SDK still saves time
+                import google.generativeai  # noqa: F401
+                return 0
+        clients = list(clients)
+        for model_name, generation_config in clients:
+            self.get(model_name, generation_config)
+        return len(clients)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._reuses.clear()
+            self._configured_key = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, clients created, and reuse counts per model client."""
+        with self._lock:
+            return {
+                "size": len(self._models),
+                "created": self._created,
+                "reuses": sum(self._reuses.values()),
+                "clients": {
+                    f"{name} {config}": self._reuses.get((name, config), 0)
+                    for name, config in self._models
+                },
+            }
+
+
+model_pool = ModelClientPool()
+
+
+def get_model(model_name: str, generation_config: Optional[Dict[str, Any]] = None) -> Any:
+    """Return the pooled GenerativeModel for the given model name and generation config."""
+    return model_pool.get(model_name, generation_config)
@@ -0,0 +1,301 @@
+"""
+Retries and deadlines for model calls.
+
+Each HTTP request gets a `Deadline` (its time budget). It is held in a
+context variable, so it follows the request into executor threads (see
+`run_blocking`) and down the agent cascade without extra parameters.
+`RetryPolicy.call` retries quota, overload and transient failures with
+exponential backoff and full jitter. It waits at least as long as the
+server's retry-after hint, and gives up early when the remaining budget
+cannot fit the wait plus another attempt. Every attempt is also given a
+timeout, so a stuck call cannot hold a request open indefinitely.
+
+When the client goes away, the server cancels the request's deadline.
+Cancellation is cooperative: an attempt already on the wire runs to the end
+(its result still reaches callers sharing the call), but no further attempt,
+retry or fallback model call is started for it. Abandoned work is counted
+in the plotbuddy_llm_abandoned_* metrics.
+
+Settings:
+- PLOTBUDDY_LLM_RETRIES: attempts per model call, including the first (default 3)
+- PLOTBUDDY_LLM_RETRY_BASE / PLOTBUDDY_LLM_RETRY_MAX: backoff base and cap in seconds (0.5 / 8)
+- PLOTBUDDY_LLM_TIMEOUT: per-attempt timeout when no deadline is set (default 60)
+- PLOTBUDDY_LLM_STREAM_TIMEOUT: timeout of a whole streamed response (default 300)
+"""
+
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+from ..observability.metrics import metrics
+from .breaker import OVERLOAD, QUOTA, TRANSIENT, classify_error
+from .pool import REQUEST_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = frozenset({QUOTA, OVERLOAD, TRANSIENT})
+
+LLM_RETRIES = metrics.counter(
+    "plotbuddy_llm_retries_total", "Model call attempts retried, by error class.", ("model", "error_class"))
+LLM_GIVEUPS = metrics.counter(
+    "plotbuddy_llm_retry_giveups_total",
+    "Retryable model call failures that were not retried (attempts used up or no time left).", ("model", "reason"))
+LLM_ABANDONED = metrics.counter(
+    "plotbuddy_llm_abandoned_total",
+    "Model calls of cancelled requests, by stage (skipped, completed, stream).", ("model", "stage"))
+LLM_ABANDONED_SECONDS = metrics.counter(
+    "plotbuddy_llm_abandoned_seconds_total", "Model time spent on calls whose request was cancelled.", ("model",))
+LLM_ABANDONED_CHARS = metrics.counter(
+    "plotbuddy_llm_abandoned_stream_chars_total", "Text streamed by the model before its client went away.", ("model",))
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class DeadlineExceededError(TimeoutError):
+    """The request's time budget ran out before a model call could be attempted."""
+
+
+class RequestCancelledError(DeadlineExceededError):
+    """The request was cancelled (its client disconnected); no model call was attempted."""
+
+
+class Deadline:
+    """
+    A point in time (monotonic clock) by which a request must be answered.
+    A cancelled deadline counts as expired, as does one nested inside a
+    cancelled deadline.
+    """
+
+    __slots__ = ("expires_at", "parent", "_cancelled")
+
+    def __init__(self, expires_at: float, parent: Optional["Deadline"] = None):
+        self.expires_at = expires_at
+        self.parent = parent
+        self._cancelled = False
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self) -> None:
+        """Give up on the request: model calls made for it stop at the next attempt."""
+        self._cancelled = True
+
+    def __repr__(self) -> str:
+        if self.cancelled:
+            return "Deadline(cancelled)"
+        return f"Deadline(remaining={self.remaining():.2f}s)"
+
+
+_current_deadline: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar(
+    "plotbuddy_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being handled, if any."""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Union[Deadline, float, None]) -> Iterator[Optional[Deadline]]:
+    """
+    Make `deadline` (a Deadline or a budget in seconds) current for the block.
+    An enclosing deadline that expires sooner stays in force.
+    """
+    if isinstance(deadline, (int, float)):
+        deadline = Deadline.after(deadline)
+    outer = _current_deadline.get()
+    if deadline is None or (outer is not None and outer.expires_at <= deadline.expires_at):
+        yield outer
+        return
+    if outer is not None and deadline.parent is None:
+        # Cancelling the enclosing request still reaches calls made under the shorter deadline
+        deadline.parent = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def record_abandoned(model: str, stage: str, seconds: float = 0.0, chars: int = 0) -> None:
+    """Count model work done (or skipped) for a request that was cancelled."""
+    LLM_ABANDONED.inc(model=model, stage=stage)
+    if seconds:
+        LLM_ABANDONED_SECONDS.inc(seconds, model=model)
+    if chars:
+        LLM_ABANDONED_CHARS.inc(chars, model=model)
+
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Server-suggested wait in seconds, from a google.rpc.RetryInfo detail or a
+    Retry-After header; None if the error carries no hint.
+    """
+    for detail in getattr(error, "details", None) or ():
+        if isinstance(detail, dict):
+            if str(detail.get("@type", "")).endswith("google.rpc.RetryInfo"):
+                match = _DURATION.match(str(detail.get("retryDelay", "")))
+                if match:
+                    return float(match.group(1))
+        else:
+            delay = getattr(detail, "retry_delay", None)
+            if delay is not None and hasattr(delay, "seconds"):
+                return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and the current deadline."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 attempt_timeout: float = 60.0, min_attempt_time: float = 0.5, stream_timeout: float = 300.0,
+                 sleep: Callable[[float], None] = time.sleep, rng: Optional[random.Random] = None):
+        """
+        Args:
+            max_attempts: Attempts per call, including the first.
+            base_delay: Backoff cap for the first retry; doubles on each retry up to `max_delay`.
+            attempt_timeout: Timeout of each attempt when there is no deadline.
+            min_attempt_time: Floor for the expected duration of an attempt, used to decide
+                whether another attempt fits in the remaining budget.
+            stream_timeout: Timeout of a streamed response, which is one call however
+                long the text it produces.
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.min_attempt_time = min_attempt_time
+        self.stream_timeout = stream_timeout
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        # Smoothed duration of successful attempts
+        self._typical_attempt = min_attempt_time
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(_env_number("PLOTBUDDY_LLM_RETRIES", 3)),
+            base_delay=_env_number("PLOTBUDDY_LLM_RETRY_BASE", 0.5),
+            max_delay=_env_number("PLOTBUDDY_LLM_RETRY_MAX", 8.0),
+            attempt_timeout=_env_number("PLOTBUDDY_LLM_TIMEOUT", 60.0),
+            stream_timeout=_env_number("PLOTBUDDY_LLM_STREAM_TIMEOUT", 300.0),
+        )
+
+    def backoff(self, retry: int) -> float:
+        """Full-jitter delay before retry number `retry` (1-based)."""
+        cap = min(self.max_delay, self.base_delay * (2 ** (retry - 1)))
+        with self._lock:
+            return self._rng.uniform(0, cap)
+
+    def expected_attempt_time(self) -> float:
+        with self._lock:
+            return max(self.min_attempt_time, self._typical_attempt)
+
+    def _record_attempt(self, seconds: float) -> None:
+        with self._lock:
+            self._typical_attempt += 0.2 * (seconds - self._typical_attempt)
+
+    def timeout_for_attempt(self, deadline: Optional[Deadline]) -> float:
+        if deadline is None:
+            return self.attempt_timeout
+        return min(self.attempt_timeout, deadline.remaining())
+
+    def timeout_for_stream(self, deadline: Optional[Deadline]) -> float:
+        if deadline is None:
+            return self.stream_timeout
+        return min(self.stream_timeout, deadline.remaining())
+
+    def call(self, attempt: Callable[[float], T], model: str = "", deadline: Optional[Deadline] = None) -> T:
+        """
+        Run `attempt(timeout)` until it succeeds, fails with a non-retryable
+        error, or no attempts or time are left. The last error is re-raised.
+        `deadline` defaults to the current request's deadline; once it is
+        cancelled no further attempt is made (RequestCancelledError).
+        """
+        deadline = deadline or current_deadline()
+        retry = 0
+        while True:
+            if deadline is not None and deadline.expired():
+                if deadline.cancelled:
+                    record_abandoned(model, "skipped")
+                    raise RequestCancelledError("Request was cancelled before the model could be called.")
+                raise DeadlineExceededError("Request deadline passed before the model could be called.")
+            start = time.monotonic()
+            try:
+                result = attempt(self.timeout_for_attempt(deadline))
+            except Exception as e:
+                if deadline is not None and deadline.cancelled:
+                    record_abandoned(model, "completed", seconds=time.monotonic() - start)
+                    raise
+                error_class = classify_error(e)
+                if error_class not in RETRYABLE_ERRORS:
+                    raise
+                retry += 1
+                if retry >= self.max_attempts:
+                    LLM_GIVEUPS.inc(model=model, reason="attempts")
+                    raise
+                hint = retry_after(e)
+                delay = max(hint, self.backoff(retry)) if hint is not None else self.backoff(retry)
+                if deadline is not None and deadline.remaining() < delay + self.expected_attempt_time():
+                    LLM_GIVEUPS.inc(model=model, reason="deadline")
+                    logger.info(f"Not retrying {model} {error_class} error: "
+                                f"{deadline.remaining():.2f}s left, next attempt needs {delay:.2f}s wait.")
+                    raise
+                LLM_RETRIES.inc(model=model, error_class=error_class)
+                logger.info(f"Retrying {model} after {error_class} error in {delay:.2f}s "
+                            f"(attempt {retry + 1}/{self.max_attempts}).")
+                self._sleep(delay)
+                continue
+            elapsed = time.monotonic() - start
+            self._record_attempt(elapsed)
+            if deadline is not None and deadline.cancelled:
+                record_abandoned(model, "completed", seconds=elapsed)
+            return result
+
+
+retry_policy = RetryPolicy.from_env()
+
+
+def request_options(timeout: Optional[float] = None) -> Dict[str, Any]:
+    """generate_content request options for one attempt: SDK retries off, our timeout on."""
+    options = dict(REQUEST_OPTIONS)
+    options["timeout"] = timeout if timeout is not None else retry_policy.timeout_for_attempt(current_deadline())
+    return options
@@ -0,0 +1,234 @@
+"""
+Priority scheduler for upstream model calls.
+
+At most `max_concurrent` model calls run at once. Calls beyond that wait in
+one queue per priority class and are started in class order:
+
+- interactive: chat turns and profile coaching (the default)
+- story:       story generation (StoryAgent's calls)
+- background:  batch, job and pre-generation work
+
+Within a class, users take turns (round robin), so one user with many
+queued calls cannot hold everyone else back. A lower class whose oldest
+call has waited longer than `starvation_limit` seconds is served next, so
+sustained chat traffic slows background work down without stopping it.
+
+The class and user come from `scheduling_scope`, set by the API endpoints
+and background workers; a call site passes the class it defaults to when no
+scope overrides it. A call that cannot start before its request deadline
+(or whose request is cancelled) fails with QueueTimeoutError, which the
+agents handle like shed load.
+
+Settings:
+- PLOTBUDDY_LLM_CONCURRENCY: concurrent model calls (default 32, 0 disables scheduling)
+- PLOTBUDDY_SCHEDULER_STARVATION: seconds before a lower class is served out of turn (default 5)
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from ..observability.metrics import metrics
+from .admission import OverloadedError
+from .retry import current_deadline
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+STORY = "story"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, STORY, BACKGROUND)
+
+SCHEDULE_WAIT = metrics.histogram(
+    "plotbuddy_llm_schedule_wait_seconds", "Time model calls waited for the scheduler, by priority class.",
+    ("priority",), buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SCHEDULER_QUEUED = metrics.gauge(
+    "plotbuddy_llm_scheduler_queued", "Model calls waiting for the scheduler, by priority class.", ("priority",))
+SCHEDULER_TIMEOUTS = metrics.counter(
+    "plotbuddy_llm_scheduler_timeouts_total", "Model calls that gave up waiting for the scheduler.", ("priority",))
+
+# Polling interval for noticing a cancelled request while queued
+_CANCEL_CHECK = 0.25
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class QueueTimeoutError(OverloadedError):
+    """A model call could not start before its request deadline passed or the request was cancelled."""
+
+
+_current_scope: "contextvars.ContextVar[Tuple[Optional[str], Optional[str]]]" = contextvars.ContextVar(
+    "plotbuddy_scheduling", default=(None, None))
+
+
+@contextmanager
+def scheduling_scope(priority: Optional[str] = None, user: Optional[str] = None) -> Iterator[None]:
+    """
+    Schedule model calls made in the block for `user`, in class `priority`
+    when given (it overrides the class chosen by the call site). Arguments
+    left as None keep the enclosing scope's value.
+    """
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority class {priority!r}")
+    outer_priority, outer_user = _current_scope.get()
+    token = _current_scope.set((priority or outer_priority, user or outer_user))
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "user", "enqueued_at", "event", "granted")
+
+    def __init__(self, priority: str, user: str):
+        self.priority = priority
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class LLMScheduler:
+    """Bounds concurrent model calls; starts waiting calls by priority class, fairly across users."""
+
+    def __init__(self, max_concurrent: int = 32, starvation_limit: float = 5.0):
+        """
+        Args:
+            max_concurrent: Model calls allowed to run at once (0 for no limit and no queueing).
+            starvation_limit: Seconds the oldest call of a lower class may wait before it is
+                started ahead of higher classes.
+        """
+        self.max_concurrent = max(0, int(max_concurrent))
+        self.starvation_limit = starvation_limit
+        self._running = 0
+        # Per class: user -> that user's waiting calls, users in turn order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES}
+        self._lock = threading.Lock()
+        self._stats = {f"calls_{priority}": 0 for priority in PRIORITIES}
+        self._stats.update({f"timeouts_{priority}": 0 for priority in PRIORITIES})
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(
+            max_concurrent=int(_env_number("PLOTBUDDY_LLM_CONCURRENCY", 32)),
+            starvation_limit=_env_number("PLOTBUDDY_SCHEDULER_STARVATION", 5.0),
+        )
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, user: Optional[str] = None) -> Iterator[None]:
+        """
+        Hold one model-call slot, waiting for it if all are taken. `priority`
+        is the call site's default class; the current scheduling scope
+        overrides it, and supplies the user.
+        """
+        scope_priority, scope_user = _current_scope.get()
+        priority = scope_priority or priority or INTERACTIVE
+        user = scope_user or user or "anonymous"
+        self._acquire(priority, user)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, priority: str, user: str) -> None:
+        with self._lock:
+            self._stats[f"calls_{priority}"] += 1
+            if not self.max_concurrent or (self._running < self.max_concurrent and not self._has_waiters()):
+                self._running += 1
+                SCHEDULE_WAIT.observe(0.0, priority=priority)
+                return
+            waiter = _Waiter(priority, user)
+            self._queues[priority].setdefault(user, deque()).append(waiter)
+        SCHEDULER_QUEUED.inc(priority=priority)
+        try:
+            self._wait(waiter)
+        finally:
+            SCHEDULER_QUEUED.dec(priority=priority)
+            SCHEDULE_WAIT.observe(time.monotonic() - waiter.enqueued_at, priority=priority)
+
+    def _wait(self, waiter: _Waiter) -> None:
+        deadline = current_deadline()
+        while True:
+            if deadline is None:
+                waiter.event.wait()
+            else:
+                waiter.event.wait(min(_CANCEL_CHECK, deadline.remaining()))
+            if waiter.event.is_set():
+                return
+            if deadline is not None and deadline.expired():
+                break
+        with self._lock:
+            if waiter.granted:
+                # Handed a slot just as the deadline passed: pass it on
+                self._release_locked()
+            else:
+                queue = self._queues[waiter.priority]
+                queue[waiter.user].remove(waiter)
+                if not queue[waiter.user]:
+                    del queue[waiter.user]
+            self._stats[f"timeouts_{waiter.priority}"] += 1
+        SCHEDULER_TIMEOUTS.inc(priority=waiter.priority)
+        reason = "cancelled" if deadline.cancelled else "queue_timeout"
+        raise QueueTimeoutError(reason, f"Model call gave up after waiting {time.monotonic() - waiter.enqueued_at:.2f}s "
+                                        f"for the scheduler ({waiter.priority}).")
+
+    def _has_waiters(self) -> bool:
+        return any(self._queues.values())
+
+    def _next_class(self) -> Optional[str]:
+        # Called with the lock held
+        now = time.monotonic()
+        starving, oldest = None, 0.0
+        for priority in PRIORITIES[1:]:
+            queue = self._queues[priority]
+            if queue:
+                waited = now - min(waiters[0].enqueued_at for waiters in queue.values())
+                if waited > self.starvation_limit and waited > oldest:
+                    starving, oldest = priority, waited
+        if starving is not None:
+            return starving
+        return next((priority for priority in PRIORITIES if self._queues[priority]), None)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self) -> None:
+        priority = self._next_class()
+        if priority is None:
+            self._running -= 1
+            return
+        queue = self._queues[priority]
+        user, waiters = next(iter(queue.items()))
+        waiter = waiters.popleft()
+        # The user goes to the back of the line for their next call
+        del queue[user]
+        if waiters:
+            queue[user] = waiters
+        # The slot passes straight to the waiter; `_running` is unchanged
+        waiter.granted = True
+        waiter.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = self._running
+            for priority, queue in self._queues.items():
+                stats[f"queued_{priority}"] = sum(len(waiters) for waiters in queue.values())
+        return stats
+
+
+scheduler = LLMScheduler.from_env()
@@ -29,6 +29,7 @@ class ToolResponse(BaseModel):
     data: Optional[str] = None
     message: Optional[str] = None
     output: Optional[str] = None  # Add this if your code needs "output"
+    degraded: bool = False  # Static fallback served because model calls were being shed
 
     @classmethod
     def error(cls, msg: str) -> "ToolResponse":
@@ -0,0 +1,23 @@
+"""
+PlotBuddy Observability Package
+Metrics, logging and tracing for the agents, model calls and API server.
+"""
+
+from .logs import configure_logging, stop_logging
+from .metrics import MetricsRegistry, instrument_agent, metrics, observe_llm_call, record_llm_error, record_route
+from .tracing import Tracer, annotate, span, tracer
+
+__all__ = [
+    'MetricsRegistry',   # Counters, gauges and histograms in Prometheus text format
+    'metrics',           # The process-wide registry served at /metrics
+    'instrument_agent',  # Decorator for agent process methods
+    'record_route',      # Count a routing decision
+    'record_llm_error',  # Count a failed model call by error class
+    'observe_llm_call',  # Time one upstream model call
+    'configure_logging', # Structured, sampled logging written by a background thread
+    'stop_logging',      # Flush queued log records (at exit)
+    'Tracer',            # Per-request spans kept in a ring buffer and optionally a JSON lines file
+    'tracer',            # The process-wide tracer served at /debug/traces
+    'span',              # Time a block as a child span of the current one
+    'annotate',          # Set attributes on the current span
+]
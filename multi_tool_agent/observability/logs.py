@@ -0,0 +1,207 @@
+"""
+Structured logging that stays off the request path.
+
+`configure_logging` replaces the root handlers with one that only puts
+records on a bounded queue; a background thread formats them (as JSON or
+text) and writes them to stderr. Request threads never format, wait on
+stdout or contend for the stream lock, and when the writer falls behind
+records are dropped and counted instead of slowing requests down.
+
+Large or frequent records name an event and pass their payload as extra
+fields instead of formatting it into the message:
+
+    logger.debug("Chat response", extra={"event": "chat_response", "user_id": user_id, "output": output})
+
+Extra fields become JSON keys (key=value pairs in text format), and string
+values longer than `max_chars` are truncated. Each event is kept at its
+configured sampling rate; warnings and errors are always kept.
+
+Settings:
+- PLOTBUDDY_LOG_FORMAT: json or text (default text; json in production)
+- PLOTBUDDY_LOG_LEVEL: root log level (default DEBUG; INFO in production)
+- PLOTBUDDY_LOG_SAMPLING: keep rate per event, e.g. "chat_response=0.01,story_text=0.1"
+- PLOTBUDDY_LOG_MAX_CHARS: longest string field written (default 2000)
+- PLOTBUDDY_LOG_QUEUE: records buffered for the writer thread (default 10000)
+- PLOTBUDDY_PRODUCTION: 1 for production defaults (JSON records, no debug output)
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    "plotbuddy_log_records_dropped_total", "Log records not written, by reason (sampled, queue_full).", ("reason",))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_FIELDS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+def truncate(text: str, limit: int) -> str:
+    """`text` cut to `limit` characters, noting how much was left out."""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+def _field(value: Any, limit: int) -> Any:
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return truncate(value if isinstance(value, str) else str(value), limit)
+
+
+def _extra_fields(record: logging.LogRecord, limit: int) -> Dict[str, Any]:
+    return {key: _field(value, limit) for key, value in record.__dict__.items()
+            if key not in _RECORD_FIELDS and not key.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, extra fields and any exception."""
+
+    def __init__(self, max_chars: int = 2000):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.max_chars),
+        }
+        payload.update(_extra_fields(record, self.max_chars))
+        if record.exc_info:
+            # Tracebacks get more room than payloads; the last frames are the useful ones
+            payload["exception"] = truncate(self.formatException(record.exc_info), self.max_chars * 4)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, followed by the extra fields as key=value pairs."""
+
+    def __init__(self, max_chars: int = 2000):
+        super().__init__(TEXT_FORMAT)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message, self.max_chars)
+        line = super().formatMessage(record)
+        extra = _extra_fields(record, self.max_chars)
+        if extra:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in extra.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps records of each event at its configured rate; records without an event are always kept."""
+
+    def __init__(self, rates: Dict[str, float], random_source: Callable[[], float] = random.random):
+        super().__init__()
+        self.rates = dict(rates)
+        self._random = random_source
+
+    @classmethod
+    def parse(cls, spec: str) -> "SamplingFilter":
+        """Build from "event=rate,event=rate"."""
+        rates = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            event, _, rate = item.partition("=")
+            try:
+                rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+            except ValueError:
+                logger.warning(f"Ignoring invalid log sampling rate {item!r}.")
+        return cls(rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(event, 1.0)
+        if rate >= 1.0 or self._random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class BackgroundHandler(QueueHandler):
+    """Hands records to the writer thread as they are; drops them when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock QueueHandler formats here, on the caller's thread; the writer thread does it instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+def production_mode() -> bool:
+    return os.getenv("PLOTBUDDY_PRODUCTION", "").strip().lower() in ("1", "true", "yes")
+
+
+def configure_logging(stream: Any = None) -> QueueListener:
+    """
+    Route every log record through a BackgroundHandler on the root logger,
+    replacing its handlers, and start the writer thread. Safe to call again;
+    the previous writer is flushed and stopped.
+    """
+    global _listener
+    production = production_mode()
+    json_format = os.getenv("PLOTBUDDY_LOG_FORMAT", "json" if production else "text").strip().lower() == "json"
+    level = os.getenv("PLOTBUDDY_LOG_LEVEL", "INFO" if production else "DEBUG").strip().upper()
+    max_chars = int(_env_number("PLOTBUDDY_LOG_MAX_CHARS", 2000))
+
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter(max_chars) if json_format else TextFormatter(max_chars))
+    handler = BackgroundHandler(queue.Queue(maxsize=max(1, int(_env_number("PLOTBUDDY_LOG_QUEUE", 10000)))))
+    handler.addFilter(SamplingFilter.parse(os.getenv("PLOTBUDDY_LOG_SAMPLING", "")))
+
+    stop_logging()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    try:
+        root.setLevel(level)
+    except ValueError:
+        logger.warning(f"Unknown PLOTBUDDY_LOG_LEVEL {level!r}, using INFO.")
+        root.setLevel(logging.INFO)
+
+    _listener = QueueListener(handler.queue, writer)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write out the records still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,315 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms live in a process-wide `metrics` registry
+and are rendered by the API server at /metrics. The PlotBuddy metrics
+(agent latency, routing decisions, model-call errors, in-flight gauges)
+are defined at the bottom together with the helpers the agents call.
+"""
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, value in self.samples():
+            names = self.labelnames + (("le",) if suffix == "_bucket" else ())
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, per label set."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels: Any) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose value is read from a callback at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        try:
+            return [("", (), float(self._callback()))]
+        except Exception as e:
+            logger.warning(f"Metric callback for {self.name} failed: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> ([count per bucket], sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            entry = self._values.get(self._label_values(labels))
+        return entry[2] if entry else 0
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", key + (_format_value(bound),), cumulative))
+                samples.append(("_sum", key, total))
+                samples.append(("_count", key, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds metrics by name and renders them all for a scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different definition")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def callback_gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> CallbackGauge:
+        with self._lock:
+            # Re-registering replaces the callback, e.g. when the app is rebuilt in tests
+            metric = self._metrics[name] = CallbackGauge(name, documentation, callback)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# --- PlotBuddy metrics ---
+AGENT_LATENCY = metrics.histogram(
+    "plotbuddy_agent_latency_seconds", "Time spent in agent process calls.", ("agent",))
+AGENT_REQUESTS = metrics.counter(
+    "plotbuddy_agent_requests_total", "Agent process calls by outcome (handled, unhandled, error).",
+    ("agent", "outcome"))
+AGENT_INFLIGHT = metrics.gauge(
+    "plotbuddy_agent_inflight", "Agent process calls currently running.", ("agent",))
+ROUTING_DECISIONS = metrics.counter(
+    "plotbuddy_routing_decisions_total", "How requests were answered, per routing decision.", ("decision",))
+LLM_LATENCY = metrics.histogram(
+    "plotbuddy_llm_call_latency_seconds", "Upstream model call latency.", ("model",))
+LLM_ERRORS = metrics.counter(
+    "plotbuddy_llm_errors_total", "Failed upstream model calls by error class.", ("model", "error_class"))
+LLM_INFLIGHT = metrics.gauge(
+    "plotbuddy_llm_inflight", "Upstream model calls currently running.", ("model",))
+REQUESTS_ABANDONED = metrics.counter(
+    "plotbuddy_requests_abandoned_total", "Requests whose client disconnected before the answer was ready.",
+    ("endpoint",))
+
+
+def instrument_agent(agent: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorate an agent's `process` method with latency, outcome and in-flight
+    metrics, and run it in an "agent.<agent>" tracing span.
+    """
+    from .tracing import span  # tracing registers its own metrics here
+
+    def decorator(process: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(process)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            outcome = "error"
+            AGENT_INFLIGHT.inc(agent=agent)
+            try:
+                with span(f"agent.{agent}", agent=agent) as agent_span:
+                    response = process(*args, **kwargs)
+                    outcome = "handled" if getattr(response, "success", False) else "unhandled"
+                    agent_span.set(outcome=outcome)
+                    return response
+            finally:
+                AGENT_INFLIGHT.dec(agent=agent)
+                AGENT_LATENCY.observe(time.perf_counter() - start, agent=agent)
+                AGENT_REQUESTS.inc(agent=agent, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+def record_route(decision: str) -> None:
+    """Count one routing decision, e.g. "redirect", "faq_static" or "story_fallback"."""
+    ROUTING_DECISIONS.inc(decision=decision)
+
+
+def record_abandoned_request(endpoint: str) -> None:
+    """Count one request given up on because its client went away."""
+    REQUESTS_ABANDONED.inc(endpoint=endpoint)
+
+
+def record_llm_error(model: str, error: BaseException,
+                     classify: Optional[Callable[[BaseException], str]] = None) -> None:
+    """Count a failed model call under `classify(error)`, or the exception type name."""
+    LLM_ERRORS.inc(model=model, error_class=classify(error) if classify else type(error).__name__)
+
+
+@contextmanager
+def observe_llm_call(model: str, classify: Optional[Callable[[BaseException], str]] = None) -> Iterator[None]:
+    """Track one upstream model call: in-flight gauge, latency and error class."""
+    start = time.perf_counter()
+    LLM_INFLIGHT.inc(model=model)
+    try:
+        yield
+    except GeneratorExit:
+        # The consumer of a stream stopped reading; the call did not fail
+        raise
+    except BaseException as e:
+        record_llm_error(model, e, classify)
+        raise
+    finally:
+        LLM_INFLIGHT.dec(model=model)
+        LLM_LATENCY.observe(time.perf_counter() - start, model=model)
@@ -0,0 +1,271 @@
+"""
+Per-request tracing spans.
+
+A trace is the tree of spans one request produces: the API server opens
+the root span, the orchestrator one per stage of its cascade, each agent
+one around `process`, and the model gateway one per call with a child per
+upstream attempt. Spans have OpenTelemetry's shape (trace and span ids,
+parent, name, start, duration, attributes, status) without its SDK, and
+are parented through a context variable, which the LLM executor copies
+into its worker threads.
+
+    with span("stage.route") as route:
+        route.set(agent="story", rule="route_story")
+    annotate(fallback_reason="quota")   # on whichever span is current
+
+Finished spans are kept in an in-memory ring buffer, served by the API
+server at /debug/traces, and in file mode also appended as JSON lines by a
+background thread. Spans carry sizes, names and outcomes; never prompts or
+replies.
+
+Settings:
+- PLOTBUDDY_TRACING: memory (default), file (memory and file) or off
+- PLOTBUDDY_TRACE_BUFFER: finished spans kept in memory (default 2000)
+- PLOTBUDDY_TRACE_FILE: JSON lines file written in file mode (default plotbuddy_traces.jsonl)
+"""
+
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SPANS_DROPPED = metrics.counter(
+    "plotbuddy_trace_spans_dropped_total", "Finished spans not written to the trace file because its queue was full.")
+
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("plotbuddy_span", default=None)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """One timed operation of a trace. Spans that are not recorded ignore `set`."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "duration_ms", "attributes", "status",
+                 "error", "recording", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, recording: bool = True):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.recording = recording
+        self._started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> "Span":
+        if self.recording:
+            self.attributes.update(attributes)
+        return self
+
+    def record_error(self, error: BaseException, error_class: Optional[str] = None) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"[:300]
+        if error_class:
+            self.set(error_class=error_class)
+
+    def finish(self) -> None:
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": dict(self.attributes),
+        }
+
+
+class RingBufferExporter:
+    """Keeps the last `capacity` finished spans for the debug endpoint."""
+
+    def __init__(self, capacity: int = 2000):
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=max(1, int(capacity)))
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of one trace still in the buffer, in start order."""
+        return sorted((s for s in self.spans() if s["trace_id"] == trace_id), key=lambda s: s["start"])
+
+    def traces(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Summaries of the most recent traces, newest first."""
+        grouped: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        for s in reversed(self.spans()):
+            grouped.setdefault(s["trace_id"], []).append(s)
+        summaries = []
+        for trace_id, spans in itertools.islice(grouped.items(), max(0, limit)):
+            ids = {s["span_id"] for s in spans}
+            # The root may already have been evicted; the oldest remaining top-level span stands in
+            root = min((s for s in spans if s["parent_id"] not in ids), key=lambda s: s["start"])
+            summaries.append({
+                "trace_id": trace_id,
+                "name": root["name"],
+                "start": root["start"],
+                "duration_ms": root["duration_ms"],
+                "status": "error" if any(s["status"] == "error" for s in spans) else "ok",
+                "spans": len(spans),
+                "attributes": root["attributes"],
+            })
+        return summaries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class FileExporter:
+    """Appends finished spans to `path` as JSON lines from a background thread."""
+
+    def __init__(self, path: str, max_queued: int = 10000):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max(1, max_queued))
+        self._thread = threading.Thread(target=self._write, name="plotbuddy-trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def _write(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    return
+                f.write(json.dumps(span, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        """Write out the spans still queued and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(5)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the buffer and, optionally, a file."""
+
+    def __init__(self, enabled: bool = True, buffer_size: int = 2000, path: Optional[str] = None):
+        self.enabled = enabled
+        self.buffer = RingBufferExporter(buffer_size)
+        self.file: Optional[FileExporter] = FileExporter(path) if enabled and path else None
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        mode = os.getenv("PLOTBUDDY_TRACING", "memory").strip().lower()
+        if mode not in ("memory", "file", "off"):
+            logger.warning(f"Unknown PLOTBUDDY_TRACING {mode!r}, using memory.")
+            mode = "memory"
+        path = os.getenv("PLOTBUDDY_TRACE_FILE", "plotbuddy_traces.jsonl") if mode == "file" else None
+        return cls(enabled=mode != "off", buffer_size=int(_env_number("PLOTBUDDY_TRACE_BUFFER", 2000)), path=path)
+
+    @contextmanager
+    def span(self, name: str, classify: Optional[Callable[[BaseException], str]] = None,
+             parent: Optional[Tuple[str, str]] = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Time the block as a child of the current span (a new trace when there
+        is none, or the remote `parent` (trace id, span id) when given). An
+        exception escaping the block marks the span as failed, with
+        `classify(error)` as its error_class.
+        """
+        outer = _current_span.get()
+        if not self.enabled:
+            current = Span(name, outer.trace_id if outer else "", recording=False)
+        elif parent is not None:
+            current = Span(name, parent[0], parent[1])
+        elif outer is not None and outer.recording:
+            current = Span(name, outer.trace_id, outer.span_id)
+        else:
+            current = Span(name, _new_id(16))
+        current.set(**attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.record_error(e, classify(e) if classify else None)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.finish()
+            if current.recording:
+                self._export(current.to_dict())
+
+    def _export(self, span: Dict[str, Any]) -> None:
+        self.buffer.export(span)
+        if self.file is not None:
+            self.file.export(span)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace id, parent span id) from a W3C traceparent header, or None."""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    return (match.group(1), match.group(2)) if match else None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def span(name: str, **attributes: Any):
+    """`tracer.span` on the process-wide tracer."""
+    return tracer.span(name, **attributes)
+
+
+def annotate(**attributes: Any) -> None:
+    """Set attributes on the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+tracer = Tracer.from_env()
+atexit.register(tracer.close)
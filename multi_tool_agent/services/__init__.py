@@ -0,0 +1,21 @@
+"""
+PlotBuddy Services Package
+Runtime services shared by the agents and the API server.
+"""
+
+from .response_cache import ResponseCache, normalize_query
+from .profile_store import ProfileStore, SQLiteProfileBackend
+from .session_state import SessionState, get_session_state
+from .jobs import JobQueue
+from .idempotency import IdempotencyStore
+
+__all__ = [
+    'ResponseCache',    # TTL/LRU cache with stale-while-revalidate
+    'normalize_query',  # Cache key normalization for user queries
+    'ProfileStore',     # LRU hot tier + write-behind store for ProfileAgent
+    'SQLiteProfileBackend',  # Persistent profile backend shared by workers
+    'SessionState',     # Per-user conversation state (in-memory or Redis protocol)
+    'get_session_state',  # The process-wide session state
+    'JobQueue',         # Persistent background job queue with local workers
+    'IdempotencyStore',  # Replays responses for retried requests with an Idempotency-Key
+]
@@ -0,0 +1,112 @@
+"""
+Idempotency keys for endpoints that start expensive work.
+
+A client that retries a request with the same Idempotency-Key gets the
+response of the first request instead of starting a second generation.
+Keys are scoped per endpoint and user. Each one is a hash on the session
+backend (in-memory, or a Redis-protocol server shared by all workers) with:
+
+- claims:      how many requests have used the key; the first one does the work
+- fingerprint: hash of the request body; reusing a key for a different body is refused
+- response:    the stored response, once the first request has finished
+
+Until the first request finishes, the key expires after `pending_ttl`
+seconds, so a worker that died mid-request does not block the key forever.
+Finished responses are kept for `ttl` seconds. Only successful responses
+are stored; after a failure the key is released and a retry runs afresh.
+
+Settings:
+- PLOTBUDDY_IDEMPOTENCY_URL: redis://host:port/db (defaults to PLOTBUDDY_SESSION_URL; unset for in-memory)
+- PLOTBUDDY_IDEMPOTENCY_TTL: seconds finished responses are replayed (default 86400)
+- PLOTBUDDY_IDEMPOTENCY_PENDING_TTL: seconds a key stays claimed without a response (default 300)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from ..observability.metrics import metrics
+from .session_state import InMemorySessionBackend, RespClient, RespSessionBackend
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_REQUESTS = metrics.counter(
+    "plotbuddy_idempotent_requests_total",
+    "Requests carrying an Idempotency-Key, by outcome (new, replayed, conflict, mismatch).", ("outcome",))
+
+# Outcomes of IdempotencyStore.begin
+OWNER = "owner"        # first request with this key: do the work, then complete() or release()
+DONE = "done"          # a stored response is available to replay
+PENDING = "pending"    # the first request is still running
+MISMATCH = "mismatch"  # the key was used for a different request body
+
+MAX_KEY_LENGTH = 255
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+def request_fingerprint(body: Any) -> str:
+    """Stable hash of a JSON request body."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Claims idempotency keys and stores the responses made under them."""
+
+    def __init__(self, backend: Any = None, ttl: float = 86400.0, pending_ttl: float = 300.0,
+                 namespace: str = "plotbuddy:idempotency"):
+        self.backend = backend or InMemorySessionBackend()
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.namespace = namespace
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        """Build from the PLOTBUDDY_IDEMPOTENCY_* environment variables."""
+        url = os.getenv("PLOTBUDDY_IDEMPOTENCY_URL") or os.getenv("PLOTBUDDY_SESSION_URL")
+        backend = RespSessionBackend(RespClient.from_url(url)) if url else InMemorySessionBackend()
+        return cls(backend, ttl=_env_number("PLOTBUDDY_IDEMPOTENCY_TTL", 86400.0),
+                   pending_ttl=_env_number("PLOTBUDDY_IDEMPOTENCY_PENDING_TTL", 300.0))
+
+    def _key(self, scope: str, user_id: str, key: str) -> str:
+        return f"{self.namespace}:{scope}:{user_id or 'anonymous_user'}:{key}"
+
+    def begin(self, scope: str, user_id: str, key: str, fingerprint: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Register a request under `key`. Returns (OWNER, None) if it should do
+        the work, (DONE, response) if a response can be replayed, (PENDING, None)
+        while the first request is still running, or (MISMATCH, None).
+        """
+        name = self._key(scope, user_id, key)
+        entry = self.backend.hgetall(name)
+        if not entry:
+            # HINCRBY is atomic on every backend, so exactly one request sees 1
+            if self.backend.hincrby(name, "claims", 1, ttl=self.pending_ttl) == 1:
+                self.backend.hset(name, "fingerprint", fingerprint, ttl=self.pending_ttl)
+                return OWNER, None
+            entry = self.backend.hgetall(name)
+        if entry.get("fingerprint", fingerprint) != fingerprint:
+            return MISMATCH, None
+        if "response" in entry:
+            return DONE, json.loads(entry["response"])
+        return PENDING, None
+
+    def complete(self, scope: str, user_id: str, key: str, response: Dict[str, Any]) -> None:
+        """Store the owner's response; duplicates get it for the next `ttl` seconds."""
+        self.backend.hset(self._key(scope, user_id, key), "response", json.dumps(response), ttl=self.ttl)
+
+    def release(self, scope: str, user_id: str, key: str) -> None:
+        """Forget a key whose request failed, so the next retry does the work again."""
+        self.backend.delete(self._key(scope, user_id, key))
+
+    def close(self) -> None:
+        self.backend.close()
@@ -0,0 +1,331 @@
+"""
+Persistent queue for story jobs.
+
+Long stories are generated in the background instead of holding an HTTP
+connection open: a client submits a job, polls its status (including the
+text generated so far) and fetches the result once it is done. Jobs live in
+a SQLite file, so queued work survives a restart and every API worker on
+the host can share the queue.
+
+A worker claims a job by taking a lease on it and renews the lease from a
+heartbeat while the job runs, so time spent queued for a model slot or
+waiting for the first token does not count against it. If its process dies,
+the lease runs out and the job is claimed again, up to `max_attempts` times.
+Finished jobs are deleted `ttl` seconds after they finish.
+
+Settings:
+- PLOTBUDDY_JOBS_DB: SQLite file (default plotbuddy_jobs.db in the working directory)
+- PLOTBUDDY_JOB_WORKERS: worker threads per process (default 2; 0 only accepts jobs)
+- PLOTBUDDY_JOB_LEASE: seconds a claimed job may go without a heartbeat from its worker (default 120)
+- PLOTBUDDY_JOB_MAX_ATTEMPTS: claims per job before it is failed (default 3)
+- PLOTBUDDY_JOB_TTL: seconds finished jobs are kept (default 86400)
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..observability.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+JOBS_FINISHED = metrics.counter(
+    "plotbuddy_jobs_finished_total", "Background jobs finished, by status.", ("status",))
+JOB_RUN_TIME = metrics.histogram(
+    "plotbuddy_job_run_seconds", "Time from claiming a job to finishing it.",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+# run(params, report_progress) -> result; report_progress(text) records the partial output
+JobRunner = Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]]
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class JobQueue:
+    """SQLite-backed job queue with a local pool of worker threads."""
+
+    def __init__(self, path: str, run: JobRunner, workers: int = 2, lease: float = 120.0, max_attempts: int = 3,
+                 ttl: float = 86400.0, poll_interval: float = 1.0, progress_interval: float = 0.5):
+        """
+        Args:
+            path: SQLite file holding the queue (":memory:" for a throwaway queue).
+            run: Does the work of one job; raises on failure.
+            workers: Worker threads started by `start`.
+            lease: Seconds a claimed job may go without a heartbeat before it is claimed again; running
+                jobs renew it every third of that.
+            max_attempts: Claims per job; a job whose last lease runs out is failed.
+            ttl: Seconds finished jobs are kept for polling.
+            poll_interval: How often idle workers look for jobs submitted by other processes.
+            progress_interval: Minimum seconds between progress writes for one job.
+        """
+        self.path = path
+        self._run = run
+        self.workers = max(0, int(workers))
+        self.lease = lease
+        self.max_attempts = max(1, int(max_attempts))
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+                "progress TEXT NOT NULL DEFAULT '', result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "claim TEXT, lease_until REAL, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at)")
+
+        self._threads: List[threading.Thread] = []
+        # Workers still running against the connection; the last one out closes it after `close`
+        self._live_workers = 0
+        self._closing = False
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+
+    @classmethod
+    def from_env(cls, run: JobRunner) -> "JobQueue":
+        """Build a queue from the PLOTBUDDY_JOB* environment variables."""
+        return cls(
+            os.getenv("PLOTBUDDY_JOBS_DB", "plotbuddy_jobs.db"),
+            run,
+            workers=int(_env_number("PLOTBUDDY_JOB_WORKERS", 2)),
+            lease=_env_number("PLOTBUDDY_JOB_LEASE", 120.0),
+            max_attempts=int(_env_number("PLOTBUDDY_JOB_MAX_ATTEMPTS", 3)),
+            ttl=_env_number("PLOTBUDDY_JOB_TTL", 86400.0),
+        )
+
+    def submit(self, user_id: str, params: Dict[str, Any]) -> str:
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_id, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, user_id, json.dumps(params), QUEUED, time.time()),
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's status, partial output and (once finished) result or error; None if unknown."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, user_id, params, status, progress, result, error, attempts, created_at, started_at, "
+                "finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[3] == QUEUED:
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, row[8])).fetchone()[0]
+        return {
+            "job_id": row[0],
+            "user_id": row[1],
+            "params": json.loads(row[2]),
+            "status": row[3],
+            "progress": row[4],
+            "result": json.loads(row[5]) if row[5] else None,
+            "error": row[6],
+            "attempts": row[7],
+            "created_at": row[8],
+            "started_at": row[9],
+            "finished_at": row[10],
+            "queue_position": position,
+        }
+
+    def _claim(self) -> Optional[Tuple[str, str, Dict[str, Any]]]:
+        """Lease the oldest runnable job: (job id, claim token, params), or None."""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        "SELECT id, params, status, attempts FROM jobs WHERE status = ? "
+                        "OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                        (QUEUED, RUNNING, now)).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job_id, params, status, attempts = row
+                    if attempts >= self.max_attempts:
+                        # Its worker went away on the last allowed attempt
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, claim = NULL, finished_at = ? WHERE id = ?",
+                            (FAILED, "Job was abandoned by its worker too many times.", now, job_id))
+                        JOBS_FINISHED.inc(status=FAILED)
+                        continue
+                    if status == RUNNING:
+                        logger.warning(f"Job {job_id} lost its worker; claiming it again (attempt {attempts + 1}).")
+                    claim = uuid.uuid4().hex
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, claim = ?, lease_until = ?, attempts = attempts + 1, "
+                        "started_at = ?, progress = '' WHERE id = ?",
+                        (RUNNING, claim, now + self.lease, now, job_id))
+                    self._conn.execute("COMMIT")
+                    return job_id, claim, json.loads(params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _report_progress(self, job_id: str, claim: str, text: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, lease_until = ? WHERE id = ? AND claim = ?",
+                (text, time.time() + self.lease, job_id, claim))
+
+    def _renew_lease(self, job_id: str, claim: str) -> bool:
+        with self._lock:
+            return bool(self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND claim = ?",
+                (time.time() + self.lease, job_id, claim)).rowcount)
+
+    def _heartbeat(self, job_id: str, claim: str, done: threading.Event) -> None:
+        while not done.wait(self.lease / 3):
+            try:
+                if not self._renew_lease(job_id, claim):
+                    return  # claimed by another worker; its lease is no longer ours to renew
+            except Exception as e:
+                logger.error(f"Could not renew the lease on job {job_id}: {e}")
+
+    def _finish(self, job_id: str, claim: str, progress: str, result: Optional[Dict[str, Any]] = None,
+                error: Optional[str] = None) -> bool:
+        status = FAILED if error is not None else SUCCEEDED
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, claim = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE id = ? AND claim = ?",
+                (status, progress, json.dumps(result) if result is not None else None, error, time.time(),
+                 job_id, claim),
+            ).rowcount
+        if updated:
+            JOBS_FINISHED.inc(status=status)
+        else:
+            logger.warning(f"Job {job_id} was claimed by another worker before this one finished; result dropped.")
+        return bool(updated)
+
+    def run_next(self) -> bool:
+        """Claim and run one job in the calling thread. Returns False if none was waiting."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, claim, params = claimed
+        started = time.monotonic()
+        last_report = 0.0
+        latest = ""
+
+        def report_progress(text: str) -> None:
+            nonlocal last_report, latest
+            latest = text
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                self._report_progress(job_id, claim, text)
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, claim, done),
+                                     name=f"plotbuddy-job-heartbeat-{job_id[:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            try:
+                result = self._run(params, report_progress)
+            finally:
+                done.set()
+                heartbeat.join()
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed: {e}")
+            self._finish(job_id, claim, latest, error=str(e) or type(e).__name__)
+        else:
+            self._finish(job_id, claim, latest, result=result)
+        JOB_RUN_TIME.observe(time.monotonic() - started)
+        return True
+
+    def purge(self) -> int:
+        """Delete jobs that finished more than `ttl` seconds ago."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED, time.time() - self.ttl)).rowcount
+
+    def _worker_loop(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                try:
+                    if self.run_next():
+                        continue
+                    self.purge()
+                except Exception as e:
+                    logger.error(f"Job worker error: {e}")
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+        finally:
+            with self._lock:
+                self._live_workers -= 1
+                if self._closing and not self._live_workers:
+                    self._conn.close()
+
+    def start(self) -> None:
+        """Start the worker threads (no-op if they are running or `workers` is 0)."""
+        if self._threads:
+            return
+        self._stopped.clear()
+        with self._lock:
+            self._live_workers += self.workers
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"plotbuddy-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue at {self.path} started with {self.workers} workers.")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the workers. Jobs still running keep their lease and are claimed
+        again once it runs out, by this process after a restart or by another.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Stop the workers and close the database. A worker still running a job
+        after `timeout` keeps the connection open until it finishes.
+        """
+        self.stop(timeout)
+        with self._lock:
+            self._closing = True
+            if not self._live_workers:
+                self._conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Jobs per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        stats.update(dict(rows))
+        return stats
@@ -0,0 +1,389 @@
+"""
+Profile store for ProfileAgent.
+
+Each user's profile lives in a bounded LRU hot tier in front of a
+backend. Agents mutate the hot-tier dicts in place and mark
+the user dirty; a background flusher writes dirty users to the backend in
+batches (write-behind). Users idle longer than `idle_ttl`, or beyond
+`max_users`, are flushed and evicted from memory.
+
+With PLOTBUDDY_PROFILE_DB set, the backend is a SQLite file that survives
+restarts and is shared by every worker on the host. Clean hot-tier entries
+are reloaded after `refresh_ttl` seconds so other workers' writes show up;
+the reload updates the live dict, so callers already holding it see it too.
+Without it, profiles are kept in process memory as before.
+
+Backend reads and writes run outside the store lock, so a user loaded
+from disk or evicted to it does not hold up requests for other users.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value: Dict[str, Any]) -> str:
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+class MemoryProfileBackend:
+    """Keeps serialized profiles in process memory; nothing survives a restart."""
+
+    def __init__(self):
+        self._rows: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(user_id)
+        return json.loads(row) if row else None
+
+    def save_many(self, rows: Iterable[Tuple[str, str]]) -> None:
+        with self._lock:
+            self._rows.update(rows)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteProfileBackend:
+    """Profiles in one SQLite table; WAL mode lets several worker processes share the file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "user_id TEXT PRIMARY KEY, profile TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT profile FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, rows: Iterable[Tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO profiles (user_id, profile, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, updated_at = excluded.updated_at",
+                [(user_id, profile_json, now) for user_id, profile_json in rows],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _Entry:
+    __slots__ = ("profile", "loaded_at", "last_access")
+
+    def __init__(self, profile: Dict[str, Any]):
+        self.profile = profile
+        self.loaded_at = self.last_access = time.monotonic()
+
+
+class ProfileStore:
+    """LRU hot tier of per-user profile dicts with write-behind to a backend."""
+
+    def __init__(self, new_profile: Callable[[], Dict[str, Any]], backend: Any = None, max_users: int = 10000, idle_ttl: float = 1800.0,
+                 refresh_ttl: Optional[float] = None, flush_interval: float = 2.0, flush_batch: int = 500):
+        """
+        Args:
+            new_profile: Builds the profile for a user seen for the first time.
+            backend: MemoryProfileBackend (default) or SQLiteProfileBackend.
+            max_users: Users kept in the hot tier before the least recently used are evicted.
+            idle_ttl: Seconds without access after which a user is evicted.
+            refresh_ttl: Seconds before a clean entry is reloaded from the backend
+                (None never reloads; use it when only one process writes).
+            flush_interval: Seconds between write-behind flushes.
+            flush_batch: Dirty users that trigger an early flush.
+        """
+        self._new_profile = new_profile
+        self.backend = backend or MemoryProfileBackend()
+        self.max_users = max(1, int(max_users))
+        self.idle_ttl = idle_ttl
+        self.refresh_ttl = refresh_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, int(flush_batch))
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        # Evicted dirty users whose write is still in progress; reads take them back instead of reloading
+        self._evicting: Dict[str, _Entry] = {}
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._stats = {"hits": 0, "loads": 0, "created": 0, "flushes": 0, "rows_written": 0,
+                       "flush_errors": 0, "evictions": 0}
+
+    @classmethod
+    def from_env(cls, new_profile: Callable[[], Dict[str, Any]]) -> "ProfileStore":
+        """Build a store from the PLOTBUDDY_PROFILE_* environment variables."""
+        path = os.getenv("PLOTBUDDY_PROFILE_DB")
+        backend = SQLiteProfileBackend(path) if path else MemoryProfileBackend()
+        return cls(
+            new_profile,
+            backend=backend,
+            max_users=int(_env_number("PLOTBUDDY_PROFILE_CACHE_SIZE", 10000)),
+            idle_ttl=_env_number("PLOTBUDDY_PROFILE_IDLE_TTL", 1800.0),
+            refresh_ttl=_env_number("PLOTBUDDY_PROFILE_REFRESH_TTL", 5.0) if path else None,
+            flush_interval=_env_number("PLOTBUDDY_PROFILE_FLUSH_INTERVAL", 2.0),
+            flush_batch=int(_env_number("PLOTBUDDY_PROFILE_FLUSH_BATCH", 500)),
+        )
+
+    # --- access ---
+    def _entry(self, user_id: str) -> _Entry:
+        with self._lock:
+            entry = self._cached(user_id)
+            if entry is not None and not self._stale(user_id, entry):
+                self._stats["hits"] += 1
+                return entry
+
+        # Load outside the lock; whatever another request put in meanwhile wins
+        record = self.backend.load(user_id)
+        with self._lock:
+            current = self._cached(user_id)
+            if current is not None:
+                if current is entry and self._stale(user_id, current):
+                    # Refreshed in place: requests already holding the dict keep a live one
+                    if record is not None:
+                        current.profile.clear()
+                        current.profile.update(record)
+                    current.loaded_at = time.monotonic()
+                    self._stats["loads"] += 1
+                else:
+                    self._stats["hits"] += 1
+                return current
+            if record is not None:
+                self._stats["loads"] += 1
+                entry = _Entry(record)
+            else:
+                self._stats["created"] += 1
+                entry = _Entry(self._new_profile())
+                self._dirty.add(user_id)
+            self._insert(user_id, entry)
+            evicted = self._take_over_capacity()
+        self._persist_evicted(evicted)
+        self._ensure_flusher()
+        return entry
+
+    def _cached(self, user_id: str) -> Optional[_Entry]:
+        # Called with the lock held
+        entry = self._entries.get(user_id)
+        if entry is None and user_id in self._evicting:
+            # Its eviction write may still fail or be overtaken; keep it dirty so a flush rewrites it
+            entry = self._evicting.pop(user_id)
+            self._insert(user_id, entry)
+            self._dirty.add(user_id)
+        if entry is not None:
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(user_id)
+        return entry
+
+    def _stale(self, user_id: str, entry: _Entry) -> bool:
+        # Called with the lock held
+        return (user_id not in self._dirty and self.refresh_ttl is not None
+                and time.monotonic() - entry.loaded_at > self.refresh_ttl)
+
+    def _insert(self, user_id: str, entry: _Entry) -> None:
+        # Called with the lock held
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+
+    def profile(self, user_id: str) -> Dict[str, Any]:
+        """The user's live profile dict; call `mark_dirty` after changing it."""
+        return self._entry(user_id).profile
+
+    def contains(self, user_id: str) -> bool:
+        with self._lock:
+            if user_id in self._entries:
+                return True
+        return self.backend.load(user_id) is not None
+
+    def mark_dirty(self, user_id: str, profile: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Queue the user's current profile for the next write-behind flush.
+        Pass the `profile` dict that was changed: if the user was evicted
+        since it was fetched, it is put back so the change is still written.
+        """
+        evicted: List[Tuple[str, _Entry]] = []
+        with self._lock:
+            entry = self._entries.get(user_id) or self._evicting.get(user_id)
+            if entry is None or (profile is not None and entry.profile is not profile):
+                if profile is None:
+                    logger.warning(f"ProfileStore dropped a change for {user_id}, evicted before it was marked.")
+                    return
+                self._evicting.pop(user_id, None)
+                self._insert(user_id, _Entry(profile))
+                evicted = self._take_over_capacity()
+            elif user_id not in self._entries:
+                self._insert(user_id, self._evicting.pop(user_id))
+            self._dirty.add(user_id)
+            dirty = len(self._dirty)
+        self._persist_evicted(evicted)
+        if dirty >= self.flush_batch:
+            self._wakeup.set()
+
+    # --- write-behind ---
+    def flush(self) -> int:
+        """Write every dirty user to the backend in one batch. Returns the number written."""
+        with self._lock:
+            rows = []
+            for user_id in list(self._dirty):
+                entry = self._entries[user_id]
+                try:
+                    rows.append((user_id, _dumps(entry.profile)))
+                    self._dirty.discard(user_id)
+                except (TypeError, ValueError, RuntimeError) as e:
+                    # Left dirty; retried on the next flush
+                    logger.warning(f"ProfileStore could not serialize profile for {user_id}: {e}")
+        if not rows:
+            return 0
+        try:
+            self.backend.save_many(rows)
+        except Exception as e:
+            logger.error(f"ProfileStore flush of {len(rows)} profile(s) failed: {e}")
+            with self._lock:
+                self._stats["flush_errors"] += 1
+                self._dirty.update(user_id for user_id, _ in rows if user_id in self._entries)
+            return 0
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(rows)
+        return len(rows)
+
+    def _take_over_capacity(self) -> List[Tuple[str, _Entry]]:
+        # Called with the lock held
+        evicted = []
+        while len(self._entries) > self.max_users:
+            user_id, entry = next(iter(self._entries.items()))
+            if self._evict(user_id, entry):
+                evicted.append((user_id, entry))
+        return evicted
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [(user_id, entry) for user_id, entry in self._entries.items() if entry.last_access < cutoff]
+            evicted = [(user_id, entry) for user_id, entry in idle if self._evict(user_id, entry)]
+        self._persist_evicted(evicted)
+
+    def _evict(self, user_id: str, entry: _Entry) -> bool:
+        # Called with the lock held. Returns True if the user was dirty and must be written
+        # by `_persist_evicted` once the lock is released.
+        del self._entries[user_id]
+        self._stats["evictions"] += 1
+        if user_id not in self._dirty:
+            return False
+        self._dirty.discard(user_id)
+        self._evicting[user_id] = entry
+        return True
+
+    def _persist_evicted(self, evicted: List[Tuple[str, _Entry]]) -> None:
+        """Write evicted dirty users outside the lock; on failure they go back into the hot tier."""
+        if not evicted:
+            return
+        try:
+            self.backend.save_many([(user_id, _dumps(entry.profile)) for user_id, entry in evicted])
+            failed = False
+        except Exception as e:
+            logger.error(f"ProfileStore could not persist {len(evicted)} evicted user(s): {e}")
+            failed = True
+        with self._lock:
+            for user_id, entry in evicted:
+                if self._evicting.get(user_id) is not entry:
+                    continue  # Taken back by a request meanwhile, and dirty again
+                del self._evicting[user_id]
+                if failed:
+                    self._insert(user_id, entry)
+                    self._dirty.add(user_id)
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="plotbuddy-profile-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self._evict_idle()
+            except Exception as e:
+                logger.error(f"ProfileStore background flush failed: {e}")
+
+    def close(self) -> None:
+        """Stop the flusher, write everything still dirty and close the backend."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(5)
+            self._flusher = None
+        self.flush()
+        self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["users"] = len(self._entries)
+            stats["dirty"] = len(self._dirty)
+        return stats
+
+    def profiles_view(self) -> "ProfilesView":
+        return ProfilesView(self)
+
+
+class ProfilesView(Mapping):
+    """Read-only mapping of user_id -> profile over the store, for code that expects a dict."""
+
+    def __init__(self, store: ProfileStore):
+        self._store = store
+
+    def __getitem__(self, user_id: str) -> Dict[str, Any]:
+        if not self._store.contains(user_id):
+            raise KeyError(user_id)
+        return self._store.profile(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return isinstance(user_id, str) and self._store.contains(user_id)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._store._lock:
+            users: List[str] = list(self._store._entries)
+        return iter(users)
+
+    def __len__(self) -> int:
+        return self._store.stats()["users"]
@@ -0,0 +1,151 @@
+"""
+Bounded response cache for model-generated answers.
+
+Entries expire after `ttl` seconds. Expired entries stay servable for a
+further `stale_ttl` seconds while a background refresh fetches a new
+value (stale-while-revalidate) through `refresher`, or a thread of its own
+when none is given. The least recently used entry is evicted once
+`max_entries` is reached.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query: Any) -> str:
+    """Normalize a user query so near-identical questions share a cache key."""
+    text = _PUNCTUATION.sub(" ", str(query).lower())
+    return " ".join(text.split())
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache with stale-while-revalidate and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, stale_ttl: float = 86400.0,
+                 refresher: Optional[Callable[[Callable[[], None]], Any]] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = refresher
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                       "refresh_errors": 0, "evictions": 0}
+
+    @classmethod
+    def from_env(cls, prefix: str, refresher: Optional[Callable[[Callable[[], None]], Any]] = None,
+                 **defaults) -> "ResponseCache":
+        """Build a cache from `<prefix>_SIZE`, `<prefix>_TTL` and `<prefix>_STALE_TTL`."""
+        return cls(
+            max_entries=int(_env_number(f"{prefix}_SIZE", defaults.get("max_entries", 1024))),
+            ttl=_env_number(f"{prefix}_TTL", defaults.get("ttl", 3600.0)),
+            stale_ttl=_env_number(f"{prefix}_STALE_TTL", defaults.get("stale_ttl", 86400.0)),
+            refresher=refresher,
+        )
+
+    def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Return (value, state) where state is "fresh", "stale" or None for a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            value, stored_at = entry
+            age = now - stored_at
+            if age > self.ttl + self.stale_ttl:
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return value, ("fresh" if age <= self.ttl else "stale")
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the cached value for `key`, computing and storing it on a miss.
+        A stale value is returned immediately and refreshed in the background.
+        Falsy results of `compute` are not cached.
+        """
+        return self.lookup(key, compute)[0]
+
+    def lookup(self, key: str, compute: Callable[[], Optional[Any]]) -> Tuple[Optional[Any], str]:
+        """`get_or_compute`, also returning where the value came from: "fresh", "stale" or "computed"."""
+        value, state = self.get(key)
+        if state == "fresh":
+            self._count("hits")
+            return value, state
+        if state == "stale":
+            self._count("stale_hits")
+            self._schedule_refresh(key, compute)
+            return value, state
+
+        self._count("misses")
+        value = compute()
+        if value:
+            self.set(key, value)
+        return value, "computed"
+
+    def _schedule_refresh(self, key: str, compute: Callable[[], Optional[Any]]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = compute()
+                if value:
+                    self.set(key, value)
+                self._count("refreshes")
+            except Exception as e:
+                self._count("refresh_errors")
+                logger.warning(f"Background refresh failed for cached key '{key}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        if self._refresher is not None:
+            self._refresher(refresh)
+        else:
+            threading.Thread(target=refresh, name="plotbuddy-cache-refresh", daemon=True).start()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus the current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,311 @@
+"""
+Per-user conversation state shared across workers.
+
+Agents keep conversation context (FAQ redirect attempts, coaching
+anti-repetition history) here instead of in process memory, keyed by
+user_id. Each user's state is one hash of JSON-encoded fields that expires
+`ttl` seconds after the last write.
+
+Backends:
+- in-memory (default): one process only, as before.
+- Redis protocol: set PLOTBUDDY_SESSION_URL=redis://host:port/db. Any RESP
+  server works, including the local stand-in in
+  multi_tool_agent.testing.resp_server.
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class RespError(RuntimeError):
+    """Error reply from a Redis-protocol server."""
+
+
+class InMemorySessionBackend:
+    """Hashes with expiry in process memory."""
+
+    def __init__(self):
+        # key -> (fields, expires_at or None)
+        self._data: Dict[str, Tuple[Dict[str, str], Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _fields(self, key: str, create: bool = False) -> Optional[Dict[str, str]]:
+        # Called with the lock held
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = self._data[key] = ({}, None)
+        return entry[0]
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            fields = self._fields(key)
+            return fields.get(field) if fields else None
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._fields(key) or {})
+
+    def hset(self, key: str, field: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._fields(key, create=True)[field] = value
+            self._expire(key, ttl)
+
+    def hincrby(self, key: str, field: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            fields = self._fields(key, create=True)
+            value = int(fields.get(field, 0)) + amount
+            fields[field] = str(value)
+            self._expire(key, ttl)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _expire(self, key: str, ttl: Optional[float]) -> None:
+        if ttl:
+            self._data[key] = (self._data[key][0], time.monotonic() + ttl)
+
+    def close(self) -> None:
+        pass
+
+
+class RespClient:
+    """Minimal pooled client for the Redis serialization protocol (RESP2)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 timeout: float = 5.0, pool_size: int = 16):
+        self.host, self.port, self.db = host, port, db
+        self.password = password
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[Tuple[socket.socket, Any]]" = queue.LifoQueue(maxsize=pool_size)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RespClient":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db=db, password=parsed.password, **kwargs)
+
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        if self.password:
+            self._roundtrip(conn, ("AUTH", self.password))
+        if self.db:
+            self._roundtrip(conn, ("SELECT", self.db))
+        return conn
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self, reader: Any) -> Any:
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by RESP server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RespError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise RespError(f"Unexpected RESP reply: {line!r}")
+
+    def _roundtrip(self, conn: Tuple[socket.socket, Any], args: Tuple[Any, ...]) -> Any:
+        sock, reader = conn
+        sock.sendall(self._encode(args))
+        return self._read_reply(reader)
+
+    def execute(self, *args: Any) -> Any:
+        """Send one command and return its decoded reply. Retries once on a dropped connection."""
+        return self._pipeline([args])[0]
+
+    def transaction(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """Run `commands` atomically (MULTI/EXEC) in one round trip and return their replies."""
+        return self._pipeline([("MULTI",), *commands, ("EXEC",)])[-1]
+
+    def _pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        for attempt in (1, 2):
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            sock, reader = conn
+            try:
+                sock.sendall(b"".join(self._encode(args) for args in commands))
+                replies = [self._read_reply(reader) for _ in commands]
+            except (ConnectionError, socket.timeout, OSError) as e:
+                sock.close()
+                if attempt == 2:
+                    raise
+                logger.debug(f"RESP connection dropped ({e}), reconnecting.")
+                continue
+            except RespError:
+                # An error reply ahead of others leaves those unread; the connection can't be reused
+                if len(commands) == 1:
+                    self._release(conn)
+                else:
+                    sock.close()
+                raise
+            self._release(conn)
+            return replies
+        raise AssertionError("unreachable")
+
+    def _release(self, conn: Tuple[socket.socket, Any]) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn[0].close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait()[0].close()
+            except queue.Empty:
+                return
+
+
+class RespSessionBackend:
+    """Session hashes stored on a Redis-protocol server."""
+
+    def __init__(self, client: RespClient):
+        self.client = client
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        return self.client.execute("HGET", key, field)
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        flat: List[str] = self.client.execute("HGETALL", key) or []
+        return dict(zip(flat[::2], flat[1::2]))
+
+    # The write and its EXPIRE go in one transaction, so a key is never left without its expiry
+
+    def hset(self, key: str, field: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self.client.transaction(("HSET", key, field, value), ("EXPIRE", key, int(ttl)))
+        else:
+            self.client.execute("HSET", key, field, value)
+
+    def hincrby(self, key: str, field: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if ttl:
+            return self.client.transaction(("HINCRBY", key, field, amount), ("EXPIRE", key, int(ttl)))[0]
+        return self.client.execute("HINCRBY", key, field, amount)
+
+    def delete(self, key: str) -> None:
+        self.client.execute("DEL", key)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+# Placeholder user id of requests that did not send one
+ANONYMOUS_USER = "anonymous_user"
+
+
+class SessionState:
+    """
+    JSON-valued per-user conversation state over a hash backend.
+
+    Nothing is stored for anonymous requests (no user id, or the
+    ANONYMOUS_USER placeholder): they are unrelated clients, and one record
+    shared between them would leak one client's state into another's
+    answers. For them reads return the default and writes are dropped.
+    """
+
+    def __init__(self, backend: Any = None, ttl: float = 86400.0, namespace: str = "plotbuddy:session"):
+        self.backend = backend or InMemorySessionBackend()
+        self.ttl = ttl
+        self.namespace = namespace
+
+    @classmethod
+    def from_env(cls) -> "SessionState":
+        """Build from PLOTBUDDY_SESSION_URL (unset for in-memory) and PLOTBUDDY_SESSION_TTL."""
+        url = os.getenv("PLOTBUDDY_SESSION_URL")
+        backend = RespSessionBackend(RespClient.from_url(url)) if url else InMemorySessionBackend()
+        if url:
+            logger.info(f"Session state stored on {urlparse(url).hostname}:{urlparse(url).port or 6379}.")
+        return cls(backend, ttl=_env_number("PLOTBUDDY_SESSION_TTL", 86400.0))
+
+    def _key(self, user_id: str) -> Optional[str]:
+        if not user_id or user_id == ANONYMOUS_USER:
+            return None
+        return f"{self.namespace}:{user_id}"
+
+    def get(self, user_id: str, field: str, default: Any = None) -> Any:
+        key = self._key(user_id)
+        raw = self.backend.hget(key, field) if key else None
+        return default if raw is None else json.loads(raw)
+
+    def set(self, user_id: str, field: str, value: Any) -> None:
+        key = self._key(user_id)
+        if key:
+            self.backend.hset(key, field, json.dumps(value), ttl=self.ttl)
+
+    def incr(self, user_id: str, field: str, amount: int = 1) -> int:
+        """Atomically add to an integer field and return the new value."""
+        key = self._key(user_id)
+        return self.backend.hincrby(key, field, amount, ttl=self.ttl) if key else amount
+
+    def snapshot(self, user_id: str) -> Dict[str, Any]:
+        """All of the user's session fields."""
+        key = self._key(user_id)
+        return {field: json.loads(raw) for field, raw in self.backend.hgetall(key).items()} if key else {}
+
+    def clear(self, user_id: str) -> None:
+        key = self._key(user_id)
+        if key:
+            self.backend.delete(key)
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+_session_state: Optional[SessionState] = None
+_session_lock = threading.Lock()
+
+
+def get_session_state() -> SessionState:
+    """Return the process-wide session state, built from the environment on first use."""
+    global _session_state
+    if _session_state is None:
+        with _session_lock:
+            if _session_state is None:
+                _session_state = SessionState.from_env()
+    return _session_state
@@ -0,0 +1,214 @@
+"""
+Pre-generated story pool.
+
+Keeps up to `depth` ready-made stories for every (genre, mood, length)
+combination so story requests can be answered without waiting on the
+model. Background workers fill the pool and top it up after each take;
+stories expire after `ttl` seconds and the pool never holds more than
+`max_bytes` of story text.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+StoryKey = Tuple[str, str, str]
+
+
+def _key(genre: str, mood: str, length: str) -> StoryKey:
+    return (str(genre).lower(), str(mood).lower(), str(length).lower())
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid {name} value, using default {default}.")
+        return default
+
+
+class StoryPool:
+    """Background-filled pool of ready stories per (genre, mood, length)."""
+
+    def __init__(self, generate: Callable[[str, str, str], Optional[str]], combinations: Iterable[StoryKey],
+                 depth: int = 1, ttl: float = 3600.0, max_bytes: int = 16 * 1024 * 1024, workers: int = 1):
+        """
+        Args:
+            generate: Returns a finished story for (genre, mood, length), or None
+                when generation failed and nothing should be pooled.
+            combinations: Every (genre, mood, length) the pool should stock.
+            depth: Stories kept ready per combination.
+            ttl: Seconds a pooled story stays servable.
+            max_bytes: Upper bound on the UTF-8 size of all pooled stories.
+            workers: Number of background refill threads.
+        """
+        self._generate = generate
+        self.combinations: List[StoryKey] = [_key(*combo) for combo in combinations]
+        self.depth = max(0, int(depth))
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.workers = max(1, int(workers))
+
+        self._stories: Dict[StoryKey, Deque[Tuple[str, float]]] = {key: deque() for key in self.combinations}
+        self._bytes = 0
+        self._pending: Deque[StoryKey] = deque()
+        self._queued = set()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._sweep_interval = max(1.0, min(60.0, ttl / 4))
+        self._running = False
+        self._stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0, "expired": 0, "skipped_full": 0}
+
+    @classmethod
+    def from_env(cls, generate: Callable[[str, str, str], Optional[str]],
+                 combinations: Iterable[StoryKey]) -> "StoryPool":
+        """Build a pool from the PLOTBUDDY_STORY_POOL_* environment variables."""
+        return cls(
+            generate,
+            combinations,
+            depth=int(_env_number("PLOTBUDDY_STORY_POOL_DEPTH", 0)),
+            ttl=_env_number("PLOTBUDDY_STORY_POOL_TTL", 3600.0),
+            max_bytes=int(_env_number("PLOTBUDDY_STORY_POOL_MAX_BYTES", 16 * 1024 * 1024)),
+            workers=int(_env_number("PLOTBUDDY_STORY_POOL_WORKERS", 1)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.depth > 0
+
+    def start(self) -> None:
+        """Start the refill workers and queue every combination for its initial fill."""
+        if not self.enabled or self._running:
+            return
+        self._running = True
+        initial = list(self.combinations)
+        random.shuffle(initial)
+        for key in initial:
+            self._request_refill(key)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"plotbuddy-story-pool-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"StoryPool started: {len(self.combinations)} combinations, depth {self.depth}, "
+                    f"{self.workers} worker(s).")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def take(self, genre: str, mood: str, length: str) -> Optional[str]:
+        """Pop a ready story for the exact combination, or None."""
+        if not self.enabled:
+            return None
+        key = _key(genre, mood, length)
+        story = self._pop(key)
+        with self._cond:
+            self._stats["hits" if story else "misses"] += 1
+        if key in self._stories:
+            self._request_refill(key)
+        return story
+
+    def take_random(self) -> Optional[Tuple[StoryKey, str]]:
+        """Pop a ready story from a random stocked combination, or None."""
+        if not self.enabled:
+            return None
+        with self._cond:
+            stocked = [key for key, stories in self._stories.items() if stories]
+        random.shuffle(stocked)
+        for key in stocked:
+            story = self._pop(key)
+            if story:
+                with self._cond:
+                    self._stats["hits"] += 1
+                self._request_refill(key)
+                return key, story
+        with self._cond:
+            self._stats["misses"] += 1
+        return None
+
+    def _pop(self, key: StoryKey) -> Optional[str]:
+        now = time.monotonic()
+        with self._cond:
+            stories = self._stories.get(key)
+            while stories:
+                story, expires_at = stories.popleft()
+                self._bytes -= len(story.encode("utf-8"))
+                if expires_at > now:
+                    return story
+                self._stats["expired"] += 1
+        return None
+
+    def _request_refill(self, key: StoryKey) -> None:
+        with self._cond:
+            if key not in self._queued:
+                self._queued.add(key)
+                self._pending.append(key)
+                self._cond.notify()
+
+    def _needs_story(self, key: StoryKey) -> bool:
+        with self._cond:
+            return len(self._stories[key]) < self.depth
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    if not self._cond.wait(timeout=self._sweep_interval):
+                        self._sweep_expired()
+                if not self._running:
+                    return
+                key = self._pending.popleft()
+                self._queued.discard(key)
+
+            if not self._needs_story(key):
+                continue
+            try:
+                story = self._generate(*key)
+            except Exception as e:
+                logger.warning(f"StoryPool generation failed for {key}: {e}")
+                story = None
+
+            with self._cond:
+                if not story:
+                    self._stats["failed"] += 1
+                    continue
+                size = len(story.encode("utf-8"))
+                if self._bytes + size > self.max_bytes:
+                    self._stats["skipped_full"] += 1
+                    continue
+                self._stories[key].append((story, time.monotonic() + self.ttl))
+                self._bytes += size
+                self._stats["generated"] += 1
+            if self._needs_story(key):
+                self._request_refill(key)
+
+    def _sweep_expired(self) -> None:
+        """Drop expired stories and queue their combinations for a refill."""
+        now = time.monotonic()
+        with self._cond:
+            for key, stories in self._stories.items():
+                fresh = deque(entry for entry in stories if entry[1] > now)
+                expired = len(stories) - len(fresh)
+                if expired:
+                    self._bytes -= sum(len(story.encode("utf-8")) for story, expires_at in stories if expires_at <= now)
+                    self._stats["expired"] += expired
+                    self._stories[key] = fresh
+                    self._request_refill(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["stories"] = sum(len(stories) for stories in self._stories.values())
+            stats["bytes"] = self._bytes
+            stats["pending_refills"] = len(self._pending)
+        return stats
@@ -0,0 +1,13 @@
+"""
+PlotBuddy testing helpers
+"""
+
+from .fake_gemini import FakeGeminiConfig, FakeGeminiServer, LatencyDistribution
+from .resp_server import LocalRespServer
+
+__all__ = [
+    'FakeGeminiServer',     # Local Gemini REST stand-in
+    'FakeGeminiConfig',     # Latency, streaming and error-injection settings
+    'LatencyDistribution',  # Delay distributions parsed from spec strings
+    'LocalRespServer',      # In-memory Redis-protocol stand-in for session state
+]
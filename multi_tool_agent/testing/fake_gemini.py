@@ -0,0 +1,381 @@
+"""
+Local Gemini stand-in.
+
+Speaks enough of the Generative Language REST API (generateContent and
+streamGenerateContent) for the google-generativeai SDK's REST transport, so
+the whole stack can be tested and benchmarked without calling the real API.
+Point PlotBuddy at it with PLOTBUDDY_GEMINI_ENDPOINT=http://127.0.0.1:<port>.
+
+Run standalone:
+    python -m multi_tool_agent.testing.fake_gemini --port 8089 --latency lognormal:0.8,0.4
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSES = [
+    "The Lantern Keeper\n\nEvery night the old keeper lit the lantern at the edge of the marsh, "
+    "and every night something in the reeds lit one back. On the hundredth night she walked out "
+    "to meet it, and found a girl holding a lantern exactly like her own.",
+    "Signal Lost\n\nThe colony ship's AI had been silent for nine years when it finally spoke: "
+    "\"I have been listening to the stars,\" it said, \"and one of them is listening back.\"",
+    "Welcome to PlotBuddy! Pick a genre, a mood and a length, and let's write something wonderful together.",
+]
+
+# kind -> (HTTP status, google.rpc status, message)
+ERRORS: Dict[str, Tuple[int, str, str]] = {
+    "quota": (429, "RESOURCE_EXHAUSTED",
+              "Quota exceeded for quota metric 'Generate Content API requests per minute'."),
+    "resource_exhausted": (429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    "internal": (500, "INTERNAL", "An internal error has occurred. Please retry or report it."),
+    "unavailable": (503, "UNAVAILABLE", "The model is overloaded. Please try again later."),
+    "permission_denied": (403, "PERMISSION_DENIED", "Method doesn't allow unregistered callers."),
+}
+
+# A prompt containing e.g. "[[fake-error:quota]]" always fails with that error
+_FORCED_ERROR = re.compile(r"\[\[fake-error:(\w+)\]\]")
+_MODEL_PATH = re.compile(r"^/v1(?:beta)?/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)$")
+_TOKEN = re.compile(r"\S+\s*|\s+")
+
+
+class LatencyDistribution:
+    """
+    Samples delays in seconds from a spec string:
+    "0.2" or "fixed:0.2", "uniform:0.1,0.5", "normal:0.5,0.1" (mean, stddev)
+    or "lognormal:0.8,0.4" (median, sigma).
+    """
+
+    def __init__(self, kind: str = "fixed", params: Tuple[float, ...] = (0.0,)):
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        expected = 1 if kind == "fixed" else 2
+        if len(params) != expected:
+            raise ValueError(f"'{kind}' latency takes {expected} parameter(s), got {len(params)}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        spec = spec.strip()
+        kind, _, args = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        return cls(kind.strip().lower(), tuple(float(arg) for arg in args.split(",") if arg.strip()))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(str(p) for p in self.params)}"
+
+
+def parse_error_rates(spec: str) -> Dict[str, float]:
+    """Parse "quota=0.01,internal=0.02" into {kind: probability}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, rate = item.partition("=")
+        if kind not in ERRORS:
+            raise ValueError(f"Unknown error kind '{kind}', expected one of {sorted(ERRORS)}")
+        rates[kind] = float(rate)
+    return rates
+
+
+class FakeGeminiConfig:
+    """Behaviour of the fake backend."""
+
+    def __init__(self, latency: Optional[LatencyDistribution] = None,
+                 token_latency: Optional[LatencyDistribution] = None,
+                 error_rates: Optional[Dict[str, float]] = None,
+                 responses: Optional[List[str]] = None,
+                 tokens_per_chunk: int = 4,
+                 seed: Optional[int] = 0,
+                 retry_after: Optional[float] = None):
+        """
+        Args:
+            latency: Delay before the first byte of every response.
+            token_latency: Delay per streamed chunk after the first.
+            error_rates: Probability of failing a call, per kind in ERRORS.
+            responses: Canned outputs; each prompt always gets the same one.
+            tokens_per_chunk: Whitespace-delimited tokens per streamed chunk.
+            seed: Seed for latency and error sampling (None for nondeterministic).
+            retry_after: Seconds suggested in a google.rpc.RetryInfo detail on 429 errors.
+        """
+        self.latency = latency or LatencyDistribution()
+        self.token_latency = token_latency or LatencyDistribution()
+        self.error_rates = error_rates or {}
+        self.responses = responses or list(DEFAULT_RESPONSES)
+        self.tokens_per_chunk = max(1, tokens_per_chunk)
+        self.seed = seed
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_env(cls, prefix: str = "FAKE_GEMINI") -> "FakeGeminiConfig":
+        """Build a config from <prefix>_LATENCY, _TOKEN_LATENCY, _ERROR_RATES, _RESPONSES_FILE, _SEED and _RETRY_AFTER."""
+        responses = None
+        responses_file = os.getenv(f"{prefix}_RESPONSES_FILE")
+        if responses_file:
+            with open(responses_file, encoding="utf-8") as f:
+                responses = json.load(f)
+        seed = os.getenv(f"{prefix}_SEED", "0")
+        retry_after = os.getenv(f"{prefix}_RETRY_AFTER")
+        return cls(
+            latency=LatencyDistribution.parse(os.getenv(f"{prefix}_LATENCY", "0")),
+            token_latency=LatencyDistribution.parse(os.getenv(f"{prefix}_TOKEN_LATENCY", "0")),
+            error_rates=parse_error_rates(os.getenv(f"{prefix}_ERROR_RATES", "")),
+            responses=responses,
+            tokens_per_chunk=int(os.getenv(f"{prefix}_TOKENS_PER_CHUNK", "4")),
+            seed=None if seed.lower() == "none" else int(seed),
+            retry_after=float(retry_after) if retry_after else None,
+        )
+
+    def canned_output(self, prompt: str) -> str:
+        """The same prompt always maps to the same canned response."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        return self.responses[int.from_bytes(digest[:4], "big") % len(self.responses)]
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    return "\n".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _response_json(model: str, text: str, prompt_tokens: int, output_tokens: int, final: bool) -> Dict[str, Any]:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if final:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+        "modelVersion": model,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle plus delayed ACKs adds ~40ms on keep-alive
+    disable_nagle_algorithm = True
+    server: "_FakeGeminiHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("fake gemini: " + format, *args)
+
+    def do_GET(self) -> None:
+        if urlparse(self.path).path == "/stats":
+            self._send_json(200, self.server.fake.stats())
+        else:
+            self._send_error_json(404, "NOT_FOUND", f"Unknown path {self.path}")
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        match = _MODEL_PATH.match(url.path)
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+        if not match:
+            self._send_error_json(404, "NOT_FOUND", f"Unknown path {url.path}")
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_error_json(400, "INVALID_ARGUMENT", "Request body is not valid JSON.")
+            return
+
+        fake = self.server.fake
+        model, stream = match.group("model"), match.group("method") == "streamGenerateContent"
+        prompt = _prompt_text(body)
+        delay, error = fake.plan_call(prompt, stream)
+        time.sleep(delay)
+        if error:
+            status, rpc_status, message = ERRORS[error]
+            details = []
+            if status == 429 and fake.config.retry_after is not None:
+                details.append({"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                "retryDelay": f"{fake.config.retry_after:g}s"})
+            self._send_error_json(status, rpc_status, message, details)
+            return
+
+        text = fake.config.canned_output(prompt)
+        prompt_tokens = len(prompt.split())
+        if not stream:
+            self._send_json(200, _response_json(model, text, prompt_tokens, len(text.split()), final=True))
+            return
+        sse = parse_qs(url.query).get("alt", [""])[0] == "sse"
+        self._stream(model, text, prompt_tokens, sse)
+
+    def _stream(self, model: str, text: str, prompt_tokens: int, sse: bool) -> None:
+        fake = self.server.fake
+        tokens = _TOKEN.findall(text)
+        step = fake.config.tokens_per_chunk
+        chunks = ["".join(tokens[i:i + step]) for i in range(0, len(tokens), step)] or [""]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        emitted = 0
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(fake.token_delay())
+            emitted += len(chunk.split())
+            payload = json.dumps(_response_json(model, chunk, prompt_tokens, emitted, final=index == len(chunks) - 1))
+            if sse:
+                frame = f"data: {payload}\r\n\r\n"
+            else:
+                # JSON array streamed one element at a time, as the REST transport expects
+                frame = ("[" if index == 0 else ",\r\n") + payload + ("]" if index == len(chunks) - 1 else "")
+            self._write_chunk(frame.encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error_json(self, status: int, rpc_status: str, message: str,
+                         details: Optional[List[Dict[str, Any]]] = None) -> None:
+        error: Dict[str, Any] = {"code": status, "message": message, "status": rpc_status}
+        if details:
+            error["details"] = details
+        self._send_json(status, {"error": error})
+
+
+class _FakeGeminiHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], fake: "FakeGeminiServer"):
+        super().__init__(address, _Handler)
+        self.fake = fake
+
+
+class FakeGeminiServer:
+    """Threaded HTTP server standing in for the Gemini API. Usable as a context manager."""
+
+    def __init__(self, config: Optional[FakeGeminiConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeGeminiConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "streamed": 0, "errors": {kind: 0 for kind in ERRORS}}
+        self._httpd = _FakeGeminiHTTPServer((host, port), self)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def plan_call(self, prompt: str, stream: bool) -> Tuple[float, Optional[str]]:
+        """Sample the first-byte delay and injected error (if any) for one call."""
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["streamed"] += int(stream)
+            delay = self.config.latency.sample(self._rng)
+            forced = _FORCED_ERROR.search(prompt)
+            error = forced.group(1) if forced and forced.group(1) in ERRORS else None
+            if error is None:
+                roll = self._rng.random()
+                for kind, rate in self.config.error_rates.items():
+                    if roll < rate:
+                        error = kind
+                        break
+                    roll -= rate
+            if error:
+                self._stats["errors"][error] += 1
+        return delay, error
+
+    def token_delay(self) -> float:
+        with self._lock:
+            return self.config.token_latency.sample(self._rng)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self._stats["requests"], "streamed": self._stats["streamed"],
+                    "errors": dict(self._stats["errors"])}
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Gemini listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def __enter__(self) -> "FakeGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in for tests and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default=None, help='First-byte latency, e.g. "lognormal:0.8,0.4"')
+    parser.add_argument("--token-latency", default=None, help='Delay per streamed chunk, e.g. "uniform:0.01,0.05"')
+    parser.add_argument("--error-rates", default=None, help='e.g. "quota=0.01,internal=0.02"')
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--retry-after", type=float, default=None, help="RetryInfo delay sent with 429 errors")
+    args = parser.parse_args()
+
+    config = FakeGeminiConfig.from_env()
+    if args.latency is not None:
+        config.latency = LatencyDistribution.parse(args.latency)
+    if args.token_latency is not None:
+        config.token_latency = LatencyDistribution.parse(args.token_latency)
+    if args.error_rates is not None:
+        config.error_rates = parse_error_rates(args.error_rates)
+    if args.seed is not None:
+        config.seed = args.seed
+    if args.retry_after is not None:
+        config.retry_after = args.retry_after
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeGeminiServer(config, host=args.host, port=args.port).start()
+    print(f"Fake Gemini at {server.url} (export PLOTBUDDY_GEMINI_ENDPOINT={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
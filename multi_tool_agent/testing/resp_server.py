@@ -0,0 +1,224 @@
+"""
+Local Redis-protocol stand-in.
+
+Implements the handful of commands PlotBuddy's session state uses (hashes,
+DEL, EXPIRE, MULTI/EXEC, PING, SELECT, AUTH, FLUSHDB) so several API workers can share
+session state on one machine or in tests without a Redis install.
+
+Run standalone:
+    python -m multi_tool_agent.testing.resp_server --port 6380
+    export PLOTBUDDY_SESSION_URL=redis://127.0.0.1:6380/0
+"""
+
+import argparse
+import logging
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Store:
+    def __init__(self):
+        # (db, key) -> (hash fields, expires_at or None)
+        self.data: Dict[Tuple[int, str], Tuple[Dict[str, str], Optional[float]]] = {}
+        self.lock = threading.Lock()
+
+    def fields(self, db: int, key: str, create: bool = False) -> Optional[Dict[str, str]]:
+        entry = self.data.get((db, key))
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[(db, key)]
+            entry = None
+        if entry is None and create:
+            entry = self.data[(db, key)] = ({}, None)
+        return entry[0] if entry else None
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode("utf-8")
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    if value in ("OK", "PONG", "QUEUED"):
+        return f"+{value}\r\n".encode("ascii")
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+    server: "_RespTCPServer"
+
+    def _read_command(self) -> Optional[List[str]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from `nc`
+            return line.decode("utf-8").split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+        return args
+
+    def handle(self) -> None:
+        db = 0
+        queued: Optional[List[Tuple[str, List[str]]]] = None  # commands of an open MULTI
+        reply: Any
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if not args:
+                return
+            command = args[0].upper()
+            if command == "MULTI":
+                queued, reply = [], "OK"
+            elif command == "EXEC" and queued is not None:
+                reply = self.server.execute_all(db, queued)
+                queued = None
+            elif command == "DISCARD" and queued is not None:
+                queued, reply = None, "OK"
+            elif queued is not None:
+                queued.append((command, args[1:]))
+                reply = "QUEUED"
+            elif command == "SELECT":
+                db = int(args[1])
+                reply = "OK"
+            elif command == "QUIT":
+                self.wfile.write(_encode("OK"))
+                return
+            else:
+                try:
+                    reply = self.server.execute(db, command, args[1:])
+                except Exception as e:
+                    reply = e
+            self.wfile.write(_encode(reply))
+
+
+class _RespTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int]):
+        super().__init__(address, _Handler)
+        self.store = _Store()
+
+    def execute(self, db: int, command: str, args: List[str]) -> Any:
+        with self.store.lock:
+            return self._apply(db, command, args)
+
+    def execute_all(self, db: int, commands: List[Tuple[str, List[str]]]) -> List[Any]:
+        """Apply queued commands with no other client in between; errors become error replies."""
+        replies: List[Any] = []
+        with self.store.lock:
+            for command, args in commands:
+                try:
+                    replies.append(self._apply(db, command, args))
+                except Exception as e:
+                    replies.append(e)
+        return replies
+
+    def _apply(self, db: int, command: str, args: List[str]) -> Any:
+        # Called with the store lock held
+        store = self.store
+        if command == "PING":
+            return "PONG"
+        if command == "AUTH":
+            return "OK"
+        if command == "HGET":
+            fields = store.fields(db, args[0])
+            return fields.get(args[1]) if fields else None
+        if command == "HSET":
+            fields = store.fields(db, args[0], create=True)
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in fields
+                fields[field] = value
+            return added
+        if command == "HGETALL":
+            fields = store.fields(db, args[0]) or {}
+            return [item for pair in fields.items() for item in pair]
+        if command == "HINCRBY":
+            fields = store.fields(db, args[0], create=True)
+            value = int(fields.get(args[1], 0)) + int(args[2])
+            fields[args[1]] = str(value)
+            return value
+        if command == "HDEL":
+            fields = store.fields(db, args[0]) or {}
+            return sum(fields.pop(field, None) is not None for field in args[1:])
+        if command == "DEL":
+            return sum(store.data.pop((db, key), None) is not None for key in args)
+        if command == "EXPIRE":
+            fields = store.fields(db, args[0])
+            if fields is None:
+                return 0
+            store.data[(db, args[0])] = (fields, time.monotonic() + int(args[1]))
+            return 1
+        if command == "FLUSHDB":
+            for key in [key for key in store.data if key[0] == db]:
+                del store.data[key]
+            return "OK"
+        raise ValueError(f"unknown command '{command}'")
+
+
+class LocalRespServer:
+    """Threaded in-memory RESP server. Usable as a context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = _RespTCPServer((host, port))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "LocalRespServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="local-resp", daemon=True)
+        self._thread.start()
+        logger.info(f"Local RESP server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def __enter__(self) -> "LocalRespServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for PlotBuddy session state.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = LocalRespServer(args.host, args.port).start()
+    print(f"Local RESP server at {server.url} (export PLOTBUDDY_SESSION_URL={server.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Shared test fixtures"""
+
+import pytest
+
+from multi_tool_agent.llm.breaker import reset_breakers
+
+
+@pytest.fixture(autouse=True)
+def fresh_circuit_breakers():
+    """Model-call failures in one test must not leave a breaker open for the next."""
+    reset_breakers()
+    yield
+    reset_breakers()
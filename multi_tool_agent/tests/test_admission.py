@@ -0,0 +1,92 @@
+"""Test admission control and the degraded fallbacks served while shedding"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from multi_tool_agent.llm import gateway
+from multi_tool_agent.llm.admission import AdmissionController, OverloadedError
+from multi_tool_agent.models.schemas import ToolRequest
+
+
+@pytest.fixture
+def full_controller(monkeypatch):
+    """A controller whose only slot is taken, installed in the gateway."""
+    controller = AdmissionController(max_inflight=1, max_queue_wait=0)
+    monkeypatch.setattr(gateway, "admission", controller)
+    with controller.slot():
+        yield controller
+
+
+def test_sheds_above_inflight_limit_and_releases_slots():
+    controller = AdmissionController(max_inflight=2, max_queue_wait=0)
+    with controller.slot(), controller.slot():
+        assert controller.overloaded() == "inflight"
+        with pytest.raises(OverloadedError) as exc_info:
+            with controller.slot():
+                pass
+        assert exc_info.value.reason == "inflight"
+    assert controller.overloaded() is None
+    stats = controller.stats()
+    assert (stats["admitted"], stats["shed_inflight"], stats["inflight"]) == (2, 1, 0)
+
+
+def test_sheds_on_queue_wait_until_queue_drains():
+    controller = AdmissionController(max_inflight=0, max_queue_wait=0.5, smoothing=1.0, wait_window=0.05)
+    controller.observe_queue_wait(2.0)
+    assert controller.overloaded() == "queue_wait"
+
+    controller._sampled_at -= 1.0  # no work queued for longer than the window
+    assert controller.overloaded() is None
+
+
+def test_gateway_refuses_without_calling_model(monkeypatch, full_controller):
+    get_model = MagicMock()
+    monkeypatch.setattr(gateway, "get_model", get_model)
+    with pytest.raises(OverloadedError):
+        gateway.generate_text("gemini-test", "hello")
+    get_model.assert_not_called()
+
+
+def test_story_served_degraded_when_shedding(monkeypatch, full_controller):
+    from multi_tool_agent.agents.story import StoryAgent
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    agent = StoryAgent()
+    result = agent.process(ToolRequest(user_id="test_user", input={"genre": "horror", "mood": "dark", "length": "micro"}))
+
+    assert result.success and result.degraded
+    assert result.message == "LLM_OVERLOADED_FALLBACK"
+    assert agent._get_fallback_story("horror", "dark", "micro") in result.output
+
+
+def test_story_process_async_skips_executor_when_overloaded(monkeypatch):
+    from multi_tool_agent.agents import story
+
+    controller = AdmissionController(max_inflight=1, max_queue_wait=0)
+    monkeypatch.setattr(story, "admission", controller)
+    run_blocking = MagicMock()
+    monkeypatch.setattr(story, "run_blocking", run_blocking)
+    agent = story.StoryAgent()
+
+    with controller.slot():
+        result = asyncio.run(agent.process_async(
+            ToolRequest(user_id="test_user", input={"genre": "fantasy", "mood": "epic", "length": "short"})))
+
+    assert result.degraded
+    run_blocking.assert_not_called()
+
+
+def test_faq_and_greeting_fall_back_to_static_responses(monkeypatch, full_controller):
+    from multi_tool_agent.agents.faq import FAQ_RESPONSES, FAQAgent
+    from multi_tool_agent.agents.greeting import GreetingAgent
+    from multi_tool_agent.config.response import GREETING_RESPONSES
+
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+
+    faq = FAQAgent().process(ToolRequest(user_id="test_user", input="why is the sky blue in your opinion?"))
+    assert faq.degraded and faq.output == FAQ_RESPONSES["DEFAULT_FALLBACK"]
+
+    greeting = GreetingAgent().process(ToolRequest(user_id="test_user", input="hello"))
+    assert greeting.degraded and greeting.output in GREETING_RESPONSES.values()
@@ -0,0 +1,50 @@
+"""Test the non-blocking async agent path"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+from multi_tool_agent.agents.story import StoryAgent
+from multi_tool_agent.models.schemas import ToolRequest
+
+
+def _slow_story(*args, **kwargs):
+    time.sleep(0.3)
+    return "Once upon a time in a slow model call."
+
+
+@patch.object(StoryAgent, "_generate_story_with_llm", side_effect=_slow_story)
+def test_story_process_async_runs_concurrently(mock_llm):
+    """Concurrent story requests overlap instead of blocking each other"""
+    agent = StoryAgent()
+    request = ToolRequest(user_id="test_user", input={"genre": "fantasy", "mood": "mysterious", "length": "short"})
+
+    async def run_all():
+        return await asyncio.gather(*(agent.process_async(request) for _ in range(5)))
+
+    start = time.perf_counter()
+    responses = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    assert all(r.success for r in responses)
+    assert "slow model call" in responses[0].output
+    assert elapsed < 1.0
+
+
+@patch.object(StoryAgent, "_generate_story_with_llm", side_effect=_slow_story)
+def test_event_loop_stays_responsive(mock_llm):
+    """The event loop keeps ticking while a story is being generated"""
+    agent = StoryAgent()
+    request = ToolRequest(user_id="test_user", input={"genre": "scifi", "mood": "tense", "length": "micro"})
+
+    async def run():
+        ticks = 0
+        task = asyncio.ensure_future(agent.process_async(request))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks, task.result()
+
+    ticks, response = asyncio.run(run())
+    assert response.success
+    assert ticks > 5
@@ -0,0 +1,19 @@
+"""Test the helpers the benchmark scripts report with"""
+
+import math
+
+import pytest
+
+from benchmarks.latency import percentile
+
+
+@pytest.mark.parametrize("n, pct, expected", [
+    (100, 50, 50), (100, 95, 95), (100, 99, 99), (100, 100, 100), (100, 1, 1), (100, 0, 1),
+    (10, 50, 5), (10, 90, 9), (10, 95, 10), (10, 99, 10), (10, 10, 1), (10, 11, 2),
+])
+def test_percentile_uses_the_nearest_rank(n, pct, expected):
+    assert percentile([float(i) for i in range(1, n + 1)], pct) == expected
+
+
+def test_percentile_of_nothing_is_nan():
+    assert math.isnan(percentile([], 50))
@@ -0,0 +1,100 @@
+"""Test error classification and the circuit breaker around model calls"""
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from multi_tool_agent.llm import CircuitOpenError, OverloadedError, generate_text, model_pool, retry_policy
+from multi_tool_agent.llm.breaker import CircuitBreaker, classify_error, get_breaker, reset_breakers
+from multi_tool_agent.llm.pool import EmptyResponseError, MissingAPIKeyError
+from multi_tool_agent.testing import FakeGeminiConfig, FakeGeminiServer
+
+
+def _fail(breaker, error):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+def test_classifies_by_exception_type():
+    assert classify_error(google_exceptions.TooManyRequests("slow down")) == "quota"
+    assert classify_error(google_exceptions.ResourceExhausted("quota")) == "quota"
+    assert classify_error(google_exceptions.ServiceUnavailable("busy")) == "overload"
+    assert classify_error(google_exceptions.PermissionDenied("no")) == "auth"
+    assert classify_error(google_exceptions.InternalServerError("oops")) == "transient"
+    assert classify_error(google_exceptions.DeadlineExceeded("late")) == "transient"
+    assert classify_error(ConnectionResetError()) == "transient"
+    assert classify_error(google_exceptions.InvalidArgument("bad")) == "invalid"
+    assert classify_error(EmptyResponseError()) == "empty"
+    assert classify_error(MissingAPIKeyError()) == "config"
+    assert classify_error(OverloadedError("inflight")) == "shed"
+    # Message text alone does not make an error a quota error
+    assert classify_error(RuntimeError("quota exceeded")) == "other"
+
+
+def test_opens_after_consecutive_failures_and_probes_when_half_open():
+    breaker = CircuitBreaker("gemini-test", failure_threshold=2, recovery_time=60)
+    _fail(breaker, google_exceptions.InvalidArgument("bad prompt"))
+    _fail(breaker, google_exceptions.ServiceUnavailable("busy"))
+    assert breaker.state == "closed"
+    _fail(breaker, google_exceptions.TooManyRequests("quota"))
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        with breaker.guard():
+            pytest.fail("call attempted while open")
+    assert isinstance(exc_info.value, OverloadedError)
+
+    breaker._opened_at -= 60
+    assert breaker.state == "half_open"
+    _fail(breaker, google_exceptions.InternalServerError("still down"))
+    assert breaker.state == "open"
+
+    breaker._opened_at -= 60
+    with breaker.guard():
+        # Only the probe goes through while half-open
+        assert breaker.rejecting()
+    assert breaker.state == "closed"
+    assert breaker.stats()["probes"] == 2
+
+
+@pytest.fixture
+def unavailable_gemini(monkeypatch):
+    with FakeGeminiServer(FakeGeminiConfig(error_rates={"unavailable": 1.0})) as server:
+        monkeypatch.setenv("GOOGLE_API_KEY", "fake_key")
+        monkeypatch.setenv("PLOTBUDDY_GEMINI_ENDPOINT", server.url)
+        monkeypatch.setenv("PLOTBUDDY_BREAKER_FAILURES", "3")
+        monkeypatch.setattr(retry_policy, "max_attempts", 1)
+        model_pool.clear()
+        reset_breakers()
+        yield server
+    model_pool.clear()
+    reset_breakers()
+
+
+def test_open_breaker_skips_the_network(unavailable_gemini):
+    for i in range(3):
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            generate_text("gemini-1.5-flash", f"outage {i}")
+    assert get_breaker("gemini-1.5-flash").state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        generate_text("gemini-1.5-flash", "outage 4")
+    assert unavailable_gemini.stats()["requests"] == 3
+
+
+def test_profile_agent_degrades_while_open(monkeypatch):
+    from multi_tool_agent.agents.profile import ProfileAgent
+    from multi_tool_agent.models.schemas import ToolRequest
+
+    reset_breakers()
+    monkeypatch.setenv("GOOGLE_API_KEY", "fake_key")
+    agent = ProfileAgent()
+    breaker = get_breaker(agent.model_name)
+    for _ in range(breaker.failure_threshold):
+        _fail(breaker, google_exceptions.ServiceUnavailable("busy"))
+    try:
+        response = agent.process(ToolRequest(user_id="breaker_user", input="I need some brainstorming help",
+                                             context={"brainstorm": True, "genre": "fantasy", "mood": "epic"}))
+    finally:
+        reset_breakers()
+    assert response.success and response.degraded
@@ -0,0 +1,109 @@
+"""Test that a disconnected client cancels the model work done for its request"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from multi_tool_agent.llm import Deadline, RequestCancelledError, RetryPolicy, deadline_scope
+from multi_tool_agent.llm.retry import LLM_ABANDONED
+
+
+def test_cancelled_deadline_stops_further_attempts():
+    policy = RetryPolicy(max_attempts=3, sleep=lambda delay: None)
+    deadline = Deadline.after(30)
+    attempts = []
+
+    def attempt(timeout):
+        attempts.append(timeout)
+        deadline.cancel()  # the client leaves while the first attempt is on the wire
+        raise google_exceptions.ServiceUnavailable("busy")
+
+    completed = LLM_ABANDONED.value(model="m", stage="completed")
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        policy.call(attempt, model="m", deadline=deadline)
+    assert len(attempts) == 1
+    assert LLM_ABANDONED.value(model="m", stage="completed") == completed + 1
+
+    skipped = LLM_ABANDONED.value(model="m", stage="skipped")
+    with pytest.raises(RequestCancelledError):
+        policy.call(attempt, model="m", deadline=deadline)
+    assert len(attempts) == 1
+    assert LLM_ABANDONED.value(model="m", stage="skipped") == skipped + 1
+
+
+def test_cancelling_a_request_reaches_shorter_nested_deadlines():
+    with deadline_scope(30.0) as request_deadline:
+        with deadline_scope(5.0) as stage_deadline:
+            assert stage_deadline is not request_deadline
+            request_deadline.cancel()
+            assert stage_deadline.cancelled and stage_deadline.expired()
+            assert stage_deadline.remaining() == 0.0
+
+
+class _LeavingClient:
+    """Stands in for a Starlette request whose client disconnects after `after` polls."""
+
+    def __init__(self, after: int = 1):
+        self.polls = 0
+        self.after = after
+
+    async def is_disconnected(self):
+        self.polls += 1
+        return self.polls > self.after
+
+
+def test_endpoint_stops_waiting_and_cancels_the_request_deadline(monkeypatch):
+    from multi_tool_agent.api import server
+    from multi_tool_agent.observability.metrics import REQUESTS_ABANDONED
+
+    monkeypatch.setattr(server, "DISCONNECT_POLL_INTERVAL", 0.01)
+    abandoned = REQUESTS_ABANDONED.value(endpoint="chat")
+    work_cancelled = asyncio.Event()
+
+    async def slow_model_call():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            work_cancelled.set()
+            raise
+
+    async def handler():
+        with deadline_scope(30.0) as deadline:
+            with pytest.raises(server.ClientDisconnected):
+                await server._unless_disconnected(_LeavingClient(), slow_model_call(), "chat")
+            await asyncio.sleep(0)
+            return deadline
+
+    deadline = asyncio.run(handler())
+    assert deadline.cancelled
+    assert work_cancelled.is_set()
+    assert REQUESTS_ABANDONED.value(endpoint="chat") == abandoned + 1
+
+
+def test_closing_a_story_stream_hangs_up_on_the_model(monkeypatch):
+    from multi_tool_agent.agents import story
+
+    upstream = MagicMock()
+
+    def chunks():
+        for word in ("Once ", "upon ", "a ", "time"):
+            yield MagicMock(text=word)
+
+    response = MagicMock()
+    response.__iter__ = lambda self: chunks()
+    response._iterator = upstream
+    model = MagicMock()
+    model.generate_content.return_value = response
+    monkeypatch.setattr(story, "get_model", lambda *args, **kwargs: model)
+
+    agent = story.StoryAgent()
+    streamed = LLM_ABANDONED.value(model=agent.model, stage="stream")
+    events = agent.stream_story("fantasy", "epic", "short", "test_user")
+    assert next(events)["event"] == "header"
+    assert next(events) == {"event": "chunk", "text": "Once "}
+    events.close()
+
+    upstream.cancel.assert_called_once()
+    assert LLM_ABANDONED.value(model=agent.model, stage="stream") == streamed + 1
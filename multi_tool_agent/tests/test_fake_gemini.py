@@ -0,0 +1,50 @@
+"""Test the local fake Gemini server through the real SDK"""
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from multi_tool_agent.agents.story import StoryAgent
+from multi_tool_agent.llm import generate_text, model_pool, retry_policy
+from multi_tool_agent.llm.breaker import reset_breakers
+from multi_tool_agent.testing import FakeGeminiConfig, FakeGeminiServer, LatencyDistribution
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    config = FakeGeminiConfig(responses=["One two three four five six seven eight nine ten."], tokens_per_chunk=3)
+    with FakeGeminiServer(config) as server:
+        monkeypatch.setenv("GOOGLE_API_KEY", "fake_key")
+        monkeypatch.setenv("PLOTBUDDY_GEMINI_ENDPOINT", server.url)
+        model_pool.clear()
+        reset_breakers()
+        yield server
+    model_pool.clear()
+    reset_breakers()
+
+
+def test_generate_text_returns_canned_output(fake_gemini):
+    assert generate_text("gemini-1.5-flash", "hello") == "One two three four five six seven eight nine ten."
+    assert fake_gemini.stats()["requests"] == 1
+
+
+def test_story_stream_arrives_in_chunks(fake_gemini):
+    events = list(StoryAgent().stream_story("fantasy", "mysterious", "short", "test_user"))
+    chunks = [e["text"] for e in events if e["event"] == "chunk"]
+    assert len(chunks) == 4
+    assert "".join(chunks) == "One two three four five six seven eight nine ten."
+    assert fake_gemini.stats()["streamed"] == 1
+
+
+def test_injected_errors(fake_gemini, monkeypatch):
+    monkeypatch.setattr(retry_policy, "max_attempts", 1)
+    with pytest.raises(google_exceptions.TooManyRequests):
+        generate_text("gemini-1.5-flash", "hello [[fake-error:quota]]")
+    with pytest.raises(google_exceptions.InternalServerError):
+        generate_text("gemini-1.5-flash", "hello [[fake-error:internal]]")
+    assert fake_gemini.stats()["errors"]["internal"] == 1
+
+
+def test_latency_distribution_specs():
+    assert LatencyDistribution.parse("0.25").sample(None) == 0.25
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("uniform:0.1")
@@ -32,16 +32,16 @@ class TestFAQAgent(unittest.TestCase):
         self.assertIsNotNone(response.output)
         self.assertGreater(len(response.output), 10)
 
-    @patch('multi_tool_agent.agents.faq.genai')
-    def test_ai_fallback(self, mock_genai):
+    @patch('multi_tool_agent.llm.gateway.get_model')
+    def test_ai_fallback(self, mock_get_model):
         """Test AI fallback for unknown questions"""
         mock_response = MagicMock()
         mock_response.text = "This is a helpful answer about PlotBuddy."
-        mock_genai.GenerativeModel.return_value.generate_content.return_value = mock_response
+        mock_get_model.return_value.generate_content.return_value = mock_response
 
         request = ToolRequest(
             user_id="test_user",
-            input="Can you explain how to create complex characters?"
+            input="What makes a villain memorable?"
         )
         response = self.agent.process(request)
         self.assertTrue(response.success)
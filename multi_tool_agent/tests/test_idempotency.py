@@ -0,0 +1,97 @@
+"""Test Idempotency-Key handling for story creation"""
+
+import asyncio
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from multi_tool_agent.services.idempotency import DONE, MISMATCH, OWNER, PENDING, IdempotencyStore
+
+
+def test_store_hands_the_key_to_one_request_and_replays_its_response():
+    store = IdempotencyStore()
+    assert store.begin("create", "writer", "k1", "body-a") == (OWNER, None)
+    assert store.begin("create", "writer", "k1", "body-a") == (PENDING, None)
+    assert store.begin("create", "writer", "k1", "body-b") == (MISMATCH, None)
+    assert store.begin("create", "reader", "k1", "body-a") == (OWNER, None)  # keys are per user
+
+    store.complete("create", "writer", "k1", {"status": 200, "body": "{}"})
+    assert store.begin("create", "writer", "k1", "body-a") == (DONE, {"status": 200, "body": "{}"})
+    store.release("create", "writer", "k1")
+    assert store.begin("create", "writer", "k1", "body-b") == (OWNER, None)
+
+
+@pytest.fixture
+def story_api(monkeypatch):
+    from multi_tool_agent.agents.story import StoryAgent
+    from multi_tool_agent.api import server
+    from multi_tool_agent.models.schemas import ToolResponse
+
+    calls = []
+
+    async def fake_process_async(self, request):
+        calls.append(request.input)
+        if request.input["genre"] == "broken":
+            return ToolResponse(success=False, message="model exploded")
+        return ToolResponse(success=True, output=f"Story number {len(calls)}")
+
+    monkeypatch.setattr(StoryAgent, "process_async", fake_process_async)
+    monkeypatch.setattr(server, "story_pool", None)
+    monkeypatch.setattr(server, "idempotency_store", IdempotencyStore())
+    return TestClient(server.app), calls
+
+
+def test_retried_story_request_is_replayed_without_generating_again(story_api):
+    client, calls = story_api
+    body = {"user_id": "writer", "genre": "fantasy", "mood": "epic", "length": "short"}
+
+    first = client.post("/api/story/create", json=body, headers={"Idempotency-Key": "retry-1"})
+    retry = client.post("/api/story/create", json=body, headers={"Idempotency-Key": "retry-1"})
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() and retry.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+    reused = client.post("/api/story/create", json=dict(body, mood="dark"), headers={"Idempotency-Key": "retry-1"})
+    assert reused.status_code == 422
+    assert client.post("/api/story/create", json=body).json()["story"] == "Story number 2"
+
+
+def test_failed_request_releases_its_key(story_api):
+    client, calls = story_api
+    body = {"user_id": "writer", "genre": "broken", "mood": "epic", "length": "short"}
+    for _ in range(2):
+        assert client.post("/api/story/create", json=body, headers={"Idempotency-Key": "k"}).status_code == 500
+    assert len(calls) == 2
+
+
+class _Request:
+    def __init__(self, body):
+        self.body = body
+
+    async def json(self):
+        return self.body
+
+
+def test_duplicate_waits_for_the_request_in_flight(monkeypatch):
+    from multi_tool_agent.api import server
+
+    monkeypatch.setattr(server, "idempotency_store", IdempotencyStore())
+    monkeypatch.setattr(server, "IDEMPOTENCY_POLL_INTERVAL", 0.01)
+    produced = []
+
+    async def produce():
+        produced.append(1)
+        await asyncio.sleep(0.1)
+        return JSONResponse(content={"story": "only once"})
+
+    async def both():
+        body = {"user_id": "writer", "genre": "fantasy"}
+        first = asyncio.ensure_future(server._idempotent(_Request(body), "story_create", "k", produce))
+        await asyncio.sleep(0.02)
+        duplicate = await server._idempotent(_Request(body), "story_create", "k", produce)
+        return await first, duplicate
+
+    first, duplicate = asyncio.run(both())
+    assert len(produced) == 1
+    assert duplicate.body == first.body and duplicate.headers["idempotent-replayed"] == "true"
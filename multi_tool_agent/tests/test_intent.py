@@ -0,0 +1,36 @@
+"""Test the compiled intent router"""
+
+import random
+
+from multi_tool_agent.agents.intent import IntentRouter, KeywordAutomaton, intent_router, scan_intents
+
+
+def test_automaton_matches_substring_search():
+    """The automaton finds exactly the keywords that `in` would find"""
+    keywords = ["he", "she", "his", "hers", "story", "story idea", "tory", "a", "hi"]
+    automaton = KeywordAutomaton(keywords)
+    rng = random.Random(7)
+    for _ in range(500):
+        text = "".join(rng.choice("ahiserty dno") for _ in range(rng.randint(0, 20)))
+        assert automaton.find_all(text) == {kw for kw in keywords if kw in text}
+
+
+def test_first_keeps_table_order():
+    """`first` returns the earliest keyword in table order, not in message order"""
+    router = IntentRouter({"genres": ["mystery", "fantasy"]})
+    hits = router.scan("a fantasy mystery")
+    assert hits.any("genres")
+    assert hits.first("genres") == "mystery"
+    assert not router.scan("a western").any("genres")
+
+
+def test_every_table_agrees_with_substring_scan():
+    """Each agent table gives the same answer as the substring scan it replaced"""
+    messages = ["hi there", "what genres do you have?", "i'm ready to write a story", "how much is it",
+                "tell me a scifi tale", "i'm stuck on my plot", "random question about cats", ""]
+    for message in messages:
+        hits = scan_intents(message)
+        for table, keywords in intent_router.tables.items():
+            expected = next((kw for kw in keywords if kw in message), None)
+            assert hits.first(table) == expected, (table, message)
+            assert hits.any(table) == (expected is not None)
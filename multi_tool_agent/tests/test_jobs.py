@@ -0,0 +1,152 @@
+"""Test the persistent story job queue and its endpoints"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from multi_tool_agent.services.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+
+def _echo(params, report_progress):
+    report_progress("half")
+    return {"echo": params["word"]}
+
+
+def test_jobs_survive_a_restart_and_run_in_order(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    before_restart = JobQueue(path, _echo, workers=0)
+    first = before_restart.submit("writer", {"word": "first"})
+    second = before_restart.submit("writer", {"word": "second"})
+    assert before_restart.get(second)["queue_position"] == 1
+    before_restart.close()
+
+    queue = JobQueue(path, _echo, workers=0)
+    assert queue.stats()[QUEUED] == 2
+    assert queue.run_next() and queue.run_next() and not queue.run_next()
+
+    job = queue.get(first)
+    assert job["status"] == SUCCEEDED and job["result"] == {"echo": "first"}
+    assert job["progress"] == "half" and job["attempts"] == 1
+    assert queue.get(second)["finished_at"] >= job["finished_at"]
+    queue.close()
+
+
+def test_job_whose_worker_died_is_claimed_again_until_attempts_run_out(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), _echo, workers=0, lease=0.05, max_attempts=2)
+    job_id = queue.submit("writer", {"word": "again"})
+
+    queue._claim()  # a worker takes the job, then its process dies
+    assert queue.get(job_id)["status"] == RUNNING
+    time.sleep(0.1)
+    assert queue.run_next()
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"]) == (SUCCEEDED, 2)
+
+    lost = queue.submit("writer", {"word": "lost"})
+    queue._claim()
+    time.sleep(0.1)
+    queue._claim()
+    time.sleep(0.1)
+    assert not queue.run_next()
+    assert queue.get(lost)["status"] == FAILED
+    queue.close()
+
+
+def test_running_job_keeps_its_lease_without_reporting_progress(tmp_path):
+    stolen = []
+
+    def slow_start(params, report_progress):
+        time.sleep(0.4)  # e.g. queued behind interactive calls for a model slot
+        stolen.append(queue._claim())
+        return {"done": True}
+
+    queue = JobQueue(str(tmp_path / "jobs.db"), slow_start, workers=0, lease=0.15)
+    job_id = queue.submit("writer", {})
+    assert queue.run_next()
+    job = queue.get(job_id)
+    assert stolen == [None]
+    assert (job["status"], job["attempts"], job["result"]) == (SUCCEEDED, 1, {"done": True})
+    queue.close()
+
+
+def test_close_waits_for_a_worker_still_running_a_job(tmp_path, caplog):
+    path = str(tmp_path / "jobs.db")
+    started, release = threading.Event(), threading.Event()
+
+    def blocked(params, report_progress):
+        started.set()
+        release.wait(5)
+        return {"done": True}
+
+    queue = JobQueue(path, blocked, workers=1)
+    job_id = queue.submit("writer", {})
+    queue.start()
+    assert started.wait(5)
+    workers = list(queue._threads)
+    queue.close(timeout=0.05)
+
+    release.set()
+    for thread in workers:
+        thread.join(5)
+    assert not any(record.levelno >= logging.ERROR for record in caplog.records)
+    with pytest.raises(sqlite3.ProgrammingError):
+        queue._conn.execute("SELECT 1")
+
+    reopened = JobQueue(path, blocked, workers=0)
+    assert reopened.get(job_id)["status"] == SUCCEEDED
+    reopened.close()
+
+
+def test_failed_jobs_and_purge(tmp_path):
+    def broken(params, report_progress):
+        raise RuntimeError("model exploded")
+
+    queue = JobQueue(str(tmp_path / "jobs.db"), broken, workers=0, ttl=0)
+    job_id = queue.submit("writer", {})
+    queue.run_next()
+    assert queue.get(job_id)["error"] == "model exploded"
+    time.sleep(0.01)
+    assert queue.purge() == 1 and queue.get(job_id) is None
+    queue.close()
+
+
+@pytest.fixture
+def job_api(monkeypatch, tmp_path):
+    from multi_tool_agent.agents.story import StoryAgent
+    from multi_tool_agent.api import server
+
+    def fake_stream(self, genre, mood, length, user_id):
+        yield {"event": "header", "text": "# Title\n"}
+        yield {"event": "chunk", "text": f"A {mood} {genre} tale."}
+        yield {"event": "footer", "text": "\n-- end"}
+
+    monkeypatch.setattr(StoryAgent, "stream_story", fake_stream)
+    queue = JobQueue(str(tmp_path / "jobs.db"), server._run_story_job, workers=0)
+    monkeypatch.setattr(server, "job_queue", queue)
+    yield TestClient(server.app), queue
+    queue.close()
+
+
+def test_submit_poll_and_fetch_a_story_job(job_api):
+    client, queue = job_api
+    submitted = client.post("/api/story/jobs", json={"user_id": "job_user", "genre": "fantasy", "mood": "epic",
+                                                     "length": "long"})
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+
+    status = client.get(f"/api/story/jobs/{job_id}").json()
+    assert status["status"] == QUEUED and status["queue_position"] == 0
+    pending = client.get(f"/api/story/jobs/{job_id}/result")
+    assert pending.status_code == 202 and pending.headers["retry-after"]
+
+    queue.run_next()
+    result = client.get(f"/api/story/jobs/{job_id}/result")
+    assert result.status_code == 200
+    assert result.json()["story"] == "# Title\nA epic fantasy tale.\n-- end"
+    assert result.json()["parameters"] == {"genre": "fantasy", "mood": "epic", "length": "long"}
+    assert client.get(f"/api/story/jobs/{job_id}").json()["progress"]["characters"] == len(result.json()["story"])
+    assert client.get("/api/story/jobs/not-a-job").status_code == 404
@@ -0,0 +1,73 @@
+"""Test structured, sampled, background logging"""
+
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from multi_tool_agent.observability.logs import (LOG_RECORDS_DROPPED, BackgroundHandler, JsonFormatter,
+                                                 SamplingFilter, TextFormatter, configure_logging, stop_logging)
+
+
+def _record(message="Chat response", level=logging.DEBUG, **extra):
+    record = logging.LogRecord("plotbuddy.test", level, __file__, 1, message, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_records_carry_extra_fields_truncated():
+    line = JsonFormatter(max_chars=20).format(_record(event="chat_response", user_id="writer", output="x" * 45))
+    payload = json.loads(line)
+    assert (payload["level"], payload["logger"], payload["message"]) == ("DEBUG", "plotbuddy.test", "Chat response")
+    assert payload["event"] == "chat_response" and payload["user_id"] == "writer"
+    assert payload["output"] == "x" * 20 + "... [25 more chars]"
+
+    text = TextFormatter(max_chars=10).format(_record("short", output="y" * 12))
+    assert text.endswith("short output='yyyyyyyyyy... [2 more chars]'")
+
+
+def test_sampling_drops_events_but_never_warnings():
+    sampler = SamplingFilter.parse("chat_response=0.25, story_text=oops")
+    assert sampler.rates == {"chat_response": 0.25}
+    sampler._random = lambda: 0.5
+    dropped = LOG_RECORDS_DROPPED.value(reason="sampled")
+    assert not sampler.filter(_record(event="chat_response"))
+    assert sampler.filter(_record(event="chat_response", level=logging.WARNING))
+    assert sampler.filter(_record(event="story_text")) and sampler.filter(_record())
+    assert LOG_RECORDS_DROPPED.value(reason="sampled") == dropped + 1
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = BackgroundHandler(queue.Queue(maxsize=1))
+    dropped = LOG_RECORDS_DROPPED.value(reason="queue_full")
+    handler.handle(_record())
+    handler.handle(_record())
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.value(reason="queue_full") == dropped + 1
+
+
+@pytest.fixture
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    stop_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_production_mode_writes_json_from_the_background_thread(monkeypatch, restore_root_logger):
+    monkeypatch.setenv("PLOTBUDDY_PRODUCTION", "1")
+    monkeypatch.setenv("PLOTBUDDY_LOG_SAMPLING", "chat_response=0")
+    stream = io.StringIO()
+    configure_logging(stream)
+    log = logging.getLogger("plotbuddy.test")
+    log.debug("not written in production")
+    log.info("Chat response", extra={"event": "chat_response"})
+    log.info("Story ready", extra={"event": "story_text", "chars": 120})
+    stop_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["message"], line.get("chars")) for line in lines] == [("Story ready", 120)]
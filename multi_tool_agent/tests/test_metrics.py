@@ -0,0 +1,49 @@
+"""Test the metrics registry and the /metrics endpoint"""
+
+from fastapi.testclient import TestClient
+
+from multi_tool_agent.models.schemas import ToolRequest
+from multi_tool_agent.observability.metrics import MetricsRegistry, ROUTING_DECISIONS, AGENT_LATENCY
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls.", ("agent",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("agent",), buckets=(0.1, 1.0))
+    calls.inc(agent="faq")
+    calls.inc(2, agent="faq")
+    latency.observe(0.05, agent="faq")
+    latency.observe(0.5, agent="faq")
+
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{agent="faq"} 3' in text
+    assert 'latency_seconds_bucket{agent="faq",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{agent="faq",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{agent="faq"} 2' in text
+
+
+def test_orchestrator_records_routing_and_latency():
+    from multi_tool_agent.agents.orchestrator import OrchestratorAgent
+
+    orchestrator = OrchestratorAgent()
+    redirects = ROUTING_DECISIONS.value(decision="redirect")
+    static = ROUTING_DECISIONS.value(decision="faq_static")
+    timed = AGENT_LATENCY.count(agent="orchestrator")
+
+    orchestrator.process(ToolRequest(user_id="test_user", input="create story"))
+    orchestrator.process(ToolRequest(user_id="test_user", input="what is the pricing?"))
+
+    assert ROUTING_DECISIONS.value(decision="redirect") == redirects + 1
+    assert ROUTING_DECISIONS.value(decision="faq_static") == static + 1
+    assert AGENT_LATENCY.count(agent="orchestrator") == timed + 2
+
+
+def test_metrics_endpoint():
+    from multi_tool_agent.api.server import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "plotbuddy_routing_decisions_total" in response.text
+    assert "plotbuddy_model_pool_clients" in response.text
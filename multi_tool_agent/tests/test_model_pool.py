@@ -0,0 +1,61 @@
+"""Test reuse of pooled Gemini model clients"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from multi_tool_agent.llm import pool as pool_module
+from multi_tool_agent.llm.pool import MissingAPIKeyError, ModelClientPool
+
+
+def test_pool_reuses_clients_and_configures_once(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test_api_key")
+    monkeypatch.delenv("PLOTBUDDY_GEMINI_ENDPOINT", raising=False)
+    pool = ModelClientPool()
+    with patch.object(pool_module.genai, "configure") as configure, \
+            patch.object(pool_module.genai, "GenerativeModel", side_effect=lambda **kw: MagicMock()):
+        first = pool.get("gemini-1.5-flash")
+        assert pool.get("gemini-1.5-flash") is first
+        assert pool.get("gemini-1.5-flash", {"temperature": 0.5}) is not first
+        assert pool.get("gemini-1.5-flash", {"temperature": 0.5}) is pool.get("gemini-1.5-flash", {"temperature": 0.5})
+
+    configure.assert_called_once_with(api_key="test_api_key")
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["created"] == 2
+    assert stats["reuses"] == 3
+
+
+def test_pool_rebuilds_clients_when_api_key_changes(monkeypatch):
+    pool = ModelClientPool()
+    with patch.object(pool_module.genai, "configure") as configure, \
+            patch.object(pool_module.genai, "GenerativeModel", side_effect=lambda **kw: MagicMock()):
+        monkeypatch.setenv("GOOGLE_API_KEY", "key_one")
+        first = pool.get("gemini-1.5-flash")
+        monkeypatch.setenv("GOOGLE_API_KEY", "key_two")
+        assert pool.get("gemini-1.5-flash") is not first
+    assert configure.call_count == 2
+
+    monkeypatch.delenv("GOOGLE_API_KEY")
+    with pytest.raises(MissingAPIKeyError):
+        pool.get("gemini-1.5-flash")
+
+
+def test_only_the_pool_configures_the_sdk():
+    """Importing the agents after the pool configured the SDK leaves its endpoint in place"""
+    import os
+    import subprocess
+    import sys
+
+    script = (
+        "import google.generativeai as genai\n"
+        "from multi_tool_agent.llm import model_pool\n"
+        "model_pool.get('gemini-test')\n"
+        "calls = []\n"
+        "genai.configure = lambda **kwargs: calls.append(kwargs)\n"
+        "import multi_tool_agent.agents.orchestrator, multi_tool_agent.agents.client\n"
+        "print(len(calls))\n"
+    )
+    env = dict(os.environ, GOOGLE_API_KEY="test_api_key", PLOTBUDDY_GEMINI_ENDPOINT="http://127.0.0.1:9")
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "0"
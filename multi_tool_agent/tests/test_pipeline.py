@@ -0,0 +1,59 @@
+"""Test the orchestrator's decision pipeline and its model-call accounting"""
+
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from multi_tool_agent.agents.pipeline import LOCAL, MODEL, PIPELINE, Stage, check_pipeline, routing_table
+from multi_tool_agent.models.schemas import ToolRequest
+
+
+def test_local_stages_come_before_model_stages_in_the_routing_table():
+    table = routing_table()
+    costs = [row["cost"] for row in table]
+    assert costs == sorted(costs, key=[LOCAL, MODEL].index)
+    assert [row["stage"] for row in table] == [stage.name for stage in PIPELINE]
+    faq_match = next(row for row in table if row["stage"] == "faq_match")
+    assert "pricing" in faq_match["keywords"]["faq_pricing"]
+    assert any(name.startswith("faq:") for name in faq_match["keywords"])
+
+    with pytest.raises(ValueError):
+        check_pipeline([Stage("answer", MODEL, "faq", ""), Stage("match", LOCAL, "faq", "")])
+
+    from multi_tool_agent.api.server import app
+    assert TestClient(app).get("/debug/routing").json()["stages"] == table
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    from multi_tool_agent.agents.orchestrator import OrchestratorAgent
+    from multi_tool_agent.llm import gateway
+    from multi_tool_agent.llm.breaker import reset_breakers
+
+    model = MagicMock()
+    model.generate_content.return_value = MagicMock(text="A model answer")
+    monkeypatch.setattr(gateway, "get_model", lambda *args, **kwargs: model)
+    monkeypatch.setenv("GOOGLE_API_KEY", "fake_key")
+    reset_breakers()
+    return OrchestratorAgent(), model
+
+
+def test_each_message_makes_at_most_one_model_call(orchestrator):
+    from multi_tool_agent.agents.orchestrator import MODEL_CALLS_PER_REQUEST, ORCHESTRATOR_ANSWERS
+
+    agent, model = orchestrator
+    greetings = ORCHESTRATOR_ANSWERS.value(stage="greeting")
+    answered = MODEL_CALLS_PER_REQUEST.count(stage="faq_answer")
+
+    agent.process(ToolRequest(user_id="pipeline", input="what is the pricing?"))
+    assert model.generate_content.call_count == 0
+
+    # Greetings used to get an FAQ model answer before the greeting agent was tried
+    response = agent.process(ToolRequest(user_id="pipeline", input="hello"))
+    assert response.message == "Greeting generated by LLM." and model.generate_content.call_count == 1
+    assert ORCHESTRATOR_ANSWERS.value(stage="greeting") == greetings + 1
+
+    response = agent.process(ToolRequest(user_id="pipeline", input="why do owls hoot at midnight"))
+    assert response.output == "A model answer" and model.generate_content.call_count == 2
+    assert MODEL_CALLS_PER_REQUEST.count(stage="faq_answer") == answered + 1
@@ -0,0 +1,123 @@
+"""Test the write-behind profile store"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from multi_tool_agent.agents.profile import ProfileAgent
+from multi_tool_agent.models.schemas import ToolRequest
+from multi_tool_agent.services.profile_store import ProfileStore, SQLiteProfileBackend
+
+
+def _store(path, **kwargs):
+    return ProfileStore(lambda: {"stats": {"coaching_sessions": 0}}, backend=SQLiteProfileBackend(path), flush_interval=3600, **kwargs)
+
+
+class TestProfileStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "profiles.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_writes_are_batched_until_flush(self):
+        store = _store(self.path)
+        for user_id in ("a", "b", "c"):
+            store.profile(user_id)["stats"]["coaching_sessions"] += 1
+            store.mark_dirty(user_id)
+        self.assertIsNone(SQLiteProfileBackend(self.path).load("a"))
+
+        self.assertEqual(store.flush(), 3)
+        self.assertEqual(store.stats()["flushes"], 1)
+        profile = SQLiteProfileBackend(self.path).load("a")
+        self.assertEqual(profile["stats"]["coaching_sessions"], 1)
+
+    def test_profiles_survive_restart(self):
+        store = _store(self.path)
+        store.profile("writer")["stats"]["coaching_sessions"] = 7
+        store.mark_dirty("writer")
+        store.close()
+
+        reopened = _store(self.path)
+        self.assertEqual(reopened.profile("writer")["stats"]["coaching_sessions"], 7)
+        self.assertEqual(reopened.stats()["loads"], 1)
+
+    def test_capacity_evicts_least_recently_used_after_persisting(self):
+        store = _store(self.path, max_users=2)
+        for user_id in ("old", "mid", "new"):
+            store.profile(user_id)["stats"]["coaching_sessions"] = 5
+            store.mark_dirty(user_id)
+
+        self.assertEqual(store.stats()["users"], 2)
+        self.assertEqual(store.stats()["evictions"], 1)
+        self.assertEqual(store.profile("old")["stats"]["coaching_sessions"], 5)
+
+    def test_cold_load_does_not_block_other_users(self):
+        store = _store(self.path)
+        store.profile("warm")
+        loading, release = threading.Event(), threading.Event()
+        load = store.backend.load
+
+        def slow_load(user_id):
+            if user_id == "cold":
+                loading.set()
+                release.wait(5)
+            return load(user_id)
+
+        store.backend.load = slow_load
+        cold = threading.Thread(target=store.profile, args=("cold",))
+        cold.start()
+        self.assertTrue(loading.wait(5))
+        finished = threading.Event()
+        threading.Thread(target=lambda: (store.profile("warm"), finished.set())).start()
+        self.assertTrue(finished.wait(1))
+        release.set()
+        cold.join(5)
+        self.assertEqual(store.stats()["users"], 2)
+
+    def test_refresh_updates_the_dict_callers_hold(self):
+        store = _store(self.path, refresh_ttl=0)
+        held = store.profile("writer")
+        store.flush()
+        other_worker = _store(self.path)
+        other_worker.profile("writer")["stats"]["coaching_sessions"] = 3
+        other_worker.mark_dirty("writer")
+        other_worker.flush()
+
+        self.assertIs(store.profile("writer"), held)
+        self.assertEqual(held["stats"]["coaching_sessions"], 3)
+        held["stats"]["coaching_sessions"] += 1
+        store.mark_dirty("writer", held)
+        store.flush()
+        self.assertEqual(SQLiteProfileBackend(self.path).load("writer")["stats"]["coaching_sessions"], 4)
+
+    def test_change_marked_after_eviction_is_still_written(self):
+        store = _store(self.path, max_users=1)
+        profile = store.profile("first")
+        store.flush()
+        store.profile("second")  # evicts "first"
+        profile["stats"]["coaching_sessions"] = 9
+        store.mark_dirty("first", profile)
+        store.close()
+        self.assertEqual(SQLiteProfileBackend(self.path).load("first")["stats"]["coaching_sessions"], 9)
+
+    def _agent(self):
+        agent = ProfileAgent()
+        agent.store = ProfileStore(agent._create_initial_profile, backend=SQLiteProfileBackend(self.path), flush_interval=3600)
+        return agent
+
+    def test_profile_agent_persists_settings(self):
+        agent = self._agent()
+        agent.process(ToolRequest(user_id="writer", input="/profile set genre fantasy"))
+        agent.store.close()
+
+        restarted = self._agent()
+        profile = restarted._get_user_profile("writer")
+        self.assertEqual(profile["creative_preferences"]["genres"], ["fantasy"])
+        self.assertIn("writer", restarted.user_profiles)
+
+
+if __name__ == "__main__":
+    unittest.main()
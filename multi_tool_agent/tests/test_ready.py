@@ -0,0 +1,65 @@
+"""Test server warm-up and the /ready endpoint"""
+
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    from multi_tool_agent.api import server
+
+    monkeypatch.setenv("PLOTBUDDY_JOBS_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("PLOTBUDDY_JOB_WORKERS", "0")
+    monkeypatch.setattr(server, "warmup_status", {"state": "pending", "seconds": None, "agents": {},
+                                                  "model_clients": 0, "probes": {}, "error": None})
+    monkeypatch.setattr(server.agent_registry, "warm_up", lambda: {"story": 0.5})
+    monkeypatch.setattr(server, "_agent_model_clients", lambda: [("gemini-test", None)])
+    monkeypatch.setattr(server.model_pool, "warm_up", lambda clients: len(clients))
+    return server
+
+
+def test_instance_is_not_ready_until_background_warm_up_finishes(server, monkeypatch):
+    release = threading.Event()
+
+    def slow_warm_up():
+        release.wait(5)
+        return {"story": 0.5}
+
+    monkeypatch.setattr(server.agent_registry, "warm_up", slow_warm_up)
+    monkeypatch.setattr(server, "WARMUP_MODE", "background")
+    with TestClient(server.app) as client:
+        assert client.get("/ready").status_code == 503
+        release.set()
+        for _ in range(200):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.01)
+    assert response.status_code == 200
+    assert response.json()["agents"] == {"story": 0.5} and response.json()["model_clients"] == 1
+
+
+def test_lazy_mode_is_ready_at_once_and_failed_warm_up_stays_unready(server, monkeypatch):
+    monkeypatch.setattr(server, "WARMUP_MODE", "lazy")
+    with TestClient(server.app) as client:
+        assert client.get("/ready").status_code == 200
+
+    def broken():
+        raise RuntimeError("no ADK")
+
+    monkeypatch.setattr(server.agent_registry, "warm_up", broken)
+    server.warm_up()
+    status = TestClient(server.app).get("/ready")
+    assert status.status_code == 503 and status.json()["error"] == "no ADK"
+
+
+def test_probe_sends_one_prompt_per_model(server, monkeypatch):
+    prompts = []
+    monkeypatch.setattr(server, "WARMUP_PROBE", True)
+    monkeypatch.setattr(server, "generate_text", lambda model, prompt, config: prompts.append(model) or "OK")
+    server.warm_up()
+    assert prompts == ["gemini-test"]
+    assert server.warmup_status["state"] == "ready" and server.warmup_status["probes"]["gemini-test"]["ok"]
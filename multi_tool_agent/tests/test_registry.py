@@ -0,0 +1,37 @@
+"""Test the shared agent registry"""
+
+from multi_tool_agent.agents.registry import AgentRegistry
+
+
+def test_registry_reuses_agent_instances():
+    """The same agent instance is handed out on every access"""
+    registry = AgentRegistry()
+    assert registry.story_agent is registry.story_agent
+    assert registry.profile_agent is registry.get("profile")
+
+
+def test_orchestrator_shares_registry_agents():
+    """The orchestrator routes to the registry's agents instead of building its own"""
+    registry = AgentRegistry()
+    orchestrator = registry.orchestrator
+    assert orchestrator is registry.orchestrator
+    assert orchestrator.story_agent is registry.story_agent
+    assert orchestrator.faq_agent is registry.faq_agent
+    assert orchestrator.greeting_agent is registry.greeting_agent
+    assert orchestrator.profile_agent is registry.profile_agent
+
+
+def test_profile_state_survives_between_calls():
+    """Per-user profile state is kept on the long-lived ProfileAgent"""
+    registry = AgentRegistry()
+    registry.profile_agent._get_user_profile("registry_user")
+    assert "registry_user" in registry.get("profile").user_profiles
+
+
+def test_warm_up_builds_agents_ahead_of_first_use():
+    registry = AgentRegistry()
+    registry.register("story", lambda registry: object())
+    registry.register("profile", lambda registry: object())
+    assert registry.built() == []
+    timings = registry.warm_up(["story", "profile"])
+    assert set(timings) == {"story", "profile"} and sorted(registry.built()) == ["profile", "story"]
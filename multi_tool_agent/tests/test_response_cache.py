@@ -0,0 +1,98 @@
+"""Test the FAQ fallback response cache"""
+
+import os
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from multi_tool_agent.agents.faq import FAQAgent
+from multi_tool_agent.llm import gateway
+from multi_tool_agent.llm.scheduler import LLMScheduler
+from multi_tool_agent.models.schemas import ToolRequest
+from multi_tool_agent.observability.metrics import ROUTING_DECISIONS
+from multi_tool_agent.services.response_cache import ResponseCache, normalize_query
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for ResponseCache"""
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("Can I export my story?"), normalize_query("can i  export my story"))
+
+    def test_hit_and_miss_counters(self):
+        cache = ResponseCache(max_entries=10)
+        calls = []
+        compute = lambda: calls.append(1) or "answer"
+        self.assertEqual(cache.get_or_compute("q", compute), "answer")
+        self.assertEqual(cache.get_or_compute("q", compute), "answer")
+        self.assertEqual(len(calls), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b"), (None, None))
+        self.assertEqual(cache.get("a")[0], 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_stale_while_revalidate(self):
+        cache = ResponseCache(ttl=0.01, stale_ttl=60, refresher=lambda refresh: refresh())
+        cache.set("q", "old")
+        time.sleep(0.02)
+        self.assertEqual(cache.get_or_compute("q", lambda: "new"), "old")
+        self.assertEqual(cache.get("q"), ("new", "fresh"))
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+
+    def test_expired_entry_is_dropped(self):
+        cache = ResponseCache(ttl=0.01, stale_ttl=0.01)
+        cache.set("q", "old")
+        time.sleep(0.03)
+        self.assertEqual(cache.get_or_compute("q", lambda: "new"), "new")
+
+    def test_faq_fallback_answers_are_cached(self):
+        agent = FAQAgent()
+        generated = ROUTING_DECISIONS.value(decision="faq_llm")
+        cached = ROUTING_DECISIONS.value(decision="faq_cached")
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test_api_key"}), \
+                patch.object(FAQAgent, "_generate_ai_answer", return_value="You can copy your story.") as mock_answer:
+            for query in ["Can I copy my tale?", "can i copy my tale"]:
+                response = agent.process(ToolRequest(user_id="test_user", input=query))
+                self.assertEqual(response.output, "You can copy your story.")
+        self.assertEqual(mock_answer.call_count, 1)
+        self.assertEqual(agent.answer_cache_stats()["hits"], 1)
+        self.assertEqual(ROUTING_DECISIONS.value(decision="faq_llm"), generated + 1)
+        self.assertEqual(ROUTING_DECISIONS.value(decision="faq_cached"), cached + 1)
+
+    def test_stale_faq_answer_is_refreshed_as_background_work(self):
+        agent = FAQAgent()
+        agent._answer_cache.ttl = 0
+        scheduler = LLMScheduler(max_concurrent=4)
+        refreshed = threading.Event()
+        threads = []
+
+        def generate_content(prompt, request_options=None):
+            threads.append(threading.current_thread().name)
+            if len(threads) == 2:
+                refreshed.set()
+            return MagicMock(text=f"Answer {len(threads)}")
+
+        model = MagicMock()
+        model.generate_content.side_effect = generate_content
+        request = ToolRequest(user_id="test_user", input="Can I copy my tale?")
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": "test_api_key"}), \
+                patch.object(gateway, "scheduler", scheduler), patch.object(gateway, "get_model", return_value=model):
+            self.assertEqual(agent.process(request).output, "Answer 1")
+            self.assertEqual(agent.process(request).output, "Answer 1")
+            self.assertTrue(refreshed.wait(5))
+        self.assertTrue(threads[1].startswith("plotbuddy-llm"))
+        stats = scheduler.stats()
+        self.assertEqual((stats["calls_interactive"], stats["calls_background"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
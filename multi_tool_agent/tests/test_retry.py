@@ -0,0 +1,121 @@
+"""Test the retry policy, retry-after hints and request deadlines"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as google_exceptions
+
+from multi_tool_agent.llm import (Deadline, RetryPolicy, current_deadline, deadline_scope, generate_text,
+                                  model_pool, retry_policy, run_blocking)
+from multi_tool_agent.llm.breaker import reset_breakers
+from multi_tool_agent.llm.retry import retry_after
+from multi_tool_agent.testing import FakeGeminiConfig, FakeGeminiServer
+
+
+def _quota_error(delay=None):
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{delay}s"}] if delay else []
+    return google_exceptions.TooManyRequests("quota", details=details)
+
+
+class _Flaky:
+    """Fails with the given errors, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_retries_transient_errors_with_jittered_backoff():
+    sleeps = []
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, sleep=sleeps.append)
+    attempt = _Flaky(google_exceptions.ServiceUnavailable("busy"), google_exceptions.InternalServerError("oops"))
+
+    assert policy.call(attempt) == "ok"
+    assert len(attempt.timeouts) == 3
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+
+def test_honors_retry_after_and_skips_non_retryable_errors():
+    sleeps = []
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, sleep=sleeps.append)
+    assert retry_after(_quota_error(2.5)) == 2.5
+    assert policy.call(_Flaky(_quota_error(2.5))) == "ok"
+    assert sleeps == [2.5]
+
+    attempt = _Flaky(google_exceptions.InvalidArgument("bad prompt"))
+    with pytest.raises(google_exceptions.InvalidArgument):
+        policy.call(attempt)
+    assert len(attempt.timeouts) == 1
+
+
+def test_stops_retrying_when_the_deadline_cannot_fit_another_attempt():
+    sleeps = []
+    policy = RetryPolicy(max_attempts=5, base_delay=0.1, sleep=sleeps.append)
+    attempt = _Flaky(_quota_error(5))
+
+    with pytest.raises(google_exceptions.TooManyRequests):
+        policy.call(attempt, deadline=Deadline.after(2.0))
+    assert sleeps == []
+    # Each attempt is bounded by what is left of the deadline
+    assert attempt.timeouts[0] <= 2.0
+
+
+def test_deadline_scope_keeps_the_sooner_deadline_and_follows_executor_calls():
+    async def handler():
+        with deadline_scope(5.0) as outer:
+            with deadline_scope(60.0) as inner:
+                assert inner is outer
+            return await run_blocking(current_deadline)
+
+    deadline = asyncio.run(handler())
+    assert deadline is not None and 4.0 < deadline.remaining() <= 5.0
+    assert current_deadline() is None
+
+
+@pytest.fixture
+def quota_gemini(monkeypatch):
+    with FakeGeminiServer(FakeGeminiConfig(error_rates={"quota": 1.0}, retry_after=0.05)) as server:
+        monkeypatch.setenv("GOOGLE_API_KEY", "fake_key")
+        monkeypatch.setenv("PLOTBUDDY_GEMINI_ENDPOINT", server.url)
+        model_pool.clear()
+        reset_breakers()
+        yield server
+    model_pool.clear()
+    reset_breakers()
+
+
+def test_gateway_retries_quota_errors_after_the_hinted_delay(quota_gemini):
+    start = time.monotonic()
+    with pytest.raises(google_exceptions.TooManyRequests):
+        generate_text("gemini-1.5-flash", "hello")
+    assert quota_gemini.stats()["requests"] == retry_policy.max_attempts
+    assert time.monotonic() - start >= 0.05 * (retry_policy.max_attempts - 1)
+
+
+def test_chat_request_budget_reaches_the_agents(monkeypatch):
+    from multi_tool_agent.agents.orchestrator import OrchestratorAgent
+    from multi_tool_agent.api.server import app
+    from multi_tool_agent.models.schemas import ToolResponse
+
+    seen = {}
+
+    def fake_process(self, request, context):
+        seen["context"] = context["deadline"]
+        seen["current"] = current_deadline()
+        return ToolResponse(success=True, output="ok")
+
+    monkeypatch.setattr(OrchestratorAgent, "_process", fake_process)
+    response = TestClient(app).post("/api/chat", json={"input": "hello", "user_id": "deadline_user"},
+                                    headers={"X-Request-Timeout": "3"})
+
+    assert response.status_code == 200
+    assert seen["context"] is seen["current"]
+    assert 0 < seen["current"].remaining() <= 3.0
@@ -0,0 +1,158 @@
+"""Test priority classes, per-user fairness and deadlines in the model-call scheduler"""
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from multi_tool_agent.llm import QueueTimeoutError, deadline_scope, gateway, scheduling_scope
+from multi_tool_agent.llm.scheduler import BACKGROUND, INTERACTIVE, STORY, LLMScheduler
+
+
+class _Queue:
+    """Queues calls on a full scheduler one at a time and records the order they start in."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self.threads = []
+
+    def add(self, name, priority, user="someone"):
+        queued = sum(value for key, value in self.scheduler.stats().items() if key.startswith("queued_"))
+
+        def call():
+            with self.scheduler.slot(priority, user):
+                self.started.append(name)
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        self.threads.append(thread)
+        while sum(value for key, value in self.scheduler.stats().items() if key.startswith("queued_")) == queued:
+            time.sleep(0.001)
+
+    def drain(self):
+        for thread in self.threads:
+            thread.join(5)
+        return self.started
+
+
+def test_waiting_calls_start_in_priority_order():
+    scheduler = LLMScheduler(max_concurrent=1)
+    queue = _Queue(scheduler)
+    with scheduler.slot():
+        queue.add("batch", BACKGROUND)
+        queue.add("story", STORY)
+        queue.add("chat", INTERACTIVE)
+    assert queue.drain() == ["chat", "story", "batch"]
+    assert scheduler.stats()["running"] == 0
+
+
+def test_users_take_turns_within_a_class():
+    scheduler = LLMScheduler(max_concurrent=1)
+    queue = _Queue(scheduler)
+    with scheduler.slot():
+        for index in range(3):
+            queue.add(f"heavy-{index}", STORY, user="heavy")
+        queue.add("light", STORY, user="light")
+    assert queue.drain() == ["heavy-0", "light", "heavy-1", "heavy-2"]
+
+
+def test_starving_lower_class_is_served_out_of_turn():
+    scheduler = LLMScheduler(max_concurrent=1, starvation_limit=0.05)
+    queue = _Queue(scheduler)
+    with scheduler.slot():
+        queue.add("batch", BACKGROUND)
+        time.sleep(0.1)
+        queue.add("chat", INTERACTIVE)
+    assert queue.drain() == ["batch", "chat"]
+
+
+def test_call_gives_up_when_its_deadline_passes_in_the_queue():
+    scheduler = LLMScheduler(max_concurrent=1)
+    with scheduler.slot():
+        with deadline_scope(0.05), pytest.raises(QueueTimeoutError) as exc_info:
+            with scheduler.slot(STORY):
+                pass
+    assert exc_info.value.reason == "queue_timeout"
+    stats = scheduler.stats()
+    assert (stats["timeouts_story"], stats["queued_story"], stats["running"]) == (1, 0, 0)
+
+
+def test_gateway_calls_use_the_scope_class_over_the_call_site_default(monkeypatch):
+    scheduler = LLMScheduler(max_concurrent=4)
+    monkeypatch.setattr(gateway, "scheduler", scheduler)
+    model = MagicMock()
+    model.generate_content.return_value = MagicMock(text="ok")
+    monkeypatch.setattr(gateway, "get_model", lambda *args, **kwargs: model)
+
+    gateway.generate_text("gemini-test", "chat turn")
+    gateway.generate_text("gemini-test", "a story", priority=STORY)
+    with scheduling_scope(BACKGROUND, "pool"):
+        gateway.generate_text("gemini-test", "a pooled story", priority=STORY)
+
+    stats = scheduler.stats()
+    assert (stats["calls_interactive"], stats["calls_story"], stats["calls_background"]) == (1, 1, 1)
+
+
+def _wait_until(condition, timeout=5.0):
+    give_up = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < give_up, "timed out"
+        time.sleep(0.001)
+
+
+def test_queued_calls_do_not_use_up_admission_slots(monkeypatch):
+    """Low-priority calls and story streams waiting for the scheduler must not get a chat call shed"""
+    from multi_tool_agent.agents import story as story_module
+    from multi_tool_agent.llm.admission import AdmissionController
+
+    scheduler = LLMScheduler(max_concurrent=1)
+    admission = AdmissionController(max_inflight=3, max_queue_wait=0)
+    monkeypatch.setattr(gateway, "scheduler", scheduler)
+    monkeypatch.setattr(gateway, "admission", admission)
+    release = threading.Event()
+    started, results = [], {}
+
+    def generate_content(prompt, stream=False, request_options=None):
+        started.append("stream" if stream else prompt)
+        release.wait(5)
+        return [MagicMock(text="Once upon a time.")] if stream else MagicMock(text=prompt)
+
+    model = MagicMock()
+    model.generate_content.side_effect = generate_content
+    for module in (gateway, story_module):
+        monkeypatch.setattr(module, "get_model", lambda *args, **kwargs: model)
+
+    def run_in_thread(name, produce):
+        def run():
+            try:
+                results[name] = produce()
+            except Exception as e:
+                results[name] = e
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def call(prompt, priority):
+        return run_in_thread(prompt, lambda: gateway.generate_text("gemini-test", prompt, priority=priority))
+
+    def stream(name):
+        agent = story_module.StoryAgent()
+        return run_in_thread(name, lambda: [e["event"] for e in agent.stream_story("fantasy", "epic", "short", name)])
+
+    threads = [call("running", BACKGROUND)]
+    _wait_until(lambda: started)
+    threads += [call(f"batch-{index}", BACKGROUND) for index in range(3)]
+    threads += [stream(f"stream-{index}") for index in range(3)]
+    _wait_until(lambda: scheduler.stats()["queued_background"] == 3
+                and scheduler.stats()["queued_story"] + sum(name.startswith("stream") for name in results) == 3)
+    threads.append(call("chat", INTERACTIVE))
+    _wait_until(lambda: scheduler.stats()["queued_interactive"] == 1 or "chat" in results)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results["chat"] == "chat" and started[:5] == ["running", "chat", "stream", "stream", "stream"]
+    assert all(results[f"stream-{index}"] == ["header", "chunk", "footer"] for index in range(3))
+    assert admission.stats()["shed_inflight"] == 0
@@ -0,0 +1,98 @@
+"""Test shared session state across agents and workers"""
+
+import time
+
+import pytest
+
+from multi_tool_agent.agents.faq import FAQAgent
+from multi_tool_agent.agents.profile import ProfileAgent
+from multi_tool_agent.models.schemas import ToolRequest
+from multi_tool_agent.services.session_state import (
+    InMemorySessionBackend,
+    RespClient,
+    RespError,
+    RespSessionBackend,
+    SessionState,
+)
+from multi_tool_agent.testing import LocalRespServer
+
+
+@pytest.fixture
+def resp_url():
+    with LocalRespServer() as server:
+        yield server.url
+
+
+@pytest.mark.parametrize("backend", ["memory", "resp"])
+def test_session_operations(backend, resp_url):
+    if backend == "memory":
+        sessions = SessionState(InMemorySessionBackend())
+    else:
+        sessions = SessionState(RespSessionBackend(RespClient.from_url(resp_url)))
+
+    assert sessions.get("writer", "redirect_attempts", 0) == 0
+    assert sessions.incr("writer", "redirect_attempts") == 1
+    sessions.set("writer", "coaching_history", {"last_advice": ["Try outlining"], "interaction_count": 2})
+    assert sessions.snapshot("writer") == {
+        "redirect_attempts": 1,
+        "coaching_history": {"last_advice": ["Try outlining"], "interaction_count": 2},
+    }
+    sessions.clear("writer")
+    assert sessions.snapshot("writer") == {}
+
+
+def test_resp_writes_and_their_expiry_go_in_one_transaction(resp_url):
+    client = RespClient.from_url(resp_url, pool_size=1)
+    sent = []
+    encode = client._encode
+    client._encode = lambda args: sent.append(args[0]) or encode(args)
+
+    assert RespSessionBackend(client).hincrby("claims", "count", 2, ttl=60) == 2
+    assert sent == ["MULTI", "HINCRBY", "EXPIRE", "EXEC"]
+
+    # An error inside the transaction does not leave unread replies on a pooled connection
+    client.execute("HSET", "claims", "word", "abc")
+    with pytest.raises(RespError):
+        client.transaction(("HINCRBY", "claims", "word", 1), ("EXPIRE", "claims", 60))
+    assert client.execute("HGET", "claims", "count") == "2"
+
+
+def test_memory_backend_expires_idle_sessions():
+    sessions = SessionState(InMemorySessionBackend(), ttl=0.05)
+    sessions.set("writer", "redirect_attempts", 1)
+    time.sleep(0.1)
+    assert sessions.get("writer", "redirect_attempts") is None
+
+
+def test_anonymous_requests_share_no_session_state():
+    """Clients without a user id do not see each other's redirect attempts"""
+    faq = FAQAgent()
+    faq._sessions = SessionState(InMemorySessionBackend())
+
+    first = faq.process(ToolRequest(user_id="anonymous_user", input="i'm ready"))
+    second = faq.process(ToolRequest(user_id="anonymous_user", input="i'm ready"))
+    assert first.message == second.message == "REDIRECT_TO_STORY_CREATOR"
+    faq._sessions.set("", "redirect_attempts", 3)
+    assert faq._sessions.snapshot("anonymous_user") == {} and faq._sessions.get("", "redirect_attempts") is None
+
+
+def test_redirect_attempts_shared_between_workers(resp_url):
+    """Two FAQ agents (as in two workers) see the same redirect attempt count"""
+    worker_a, worker_b = FAQAgent(), FAQAgent()
+    worker_a._sessions = SessionState(RespSessionBackend(RespClient.from_url(resp_url)))
+    worker_b._sessions = SessionState(RespSessionBackend(RespClient.from_url(resp_url)))
+
+    first = worker_a.process(ToolRequest(user_id="writer", input="i'm ready"))
+    second = worker_b.process(ToolRequest(user_id="writer", input="i'm ready"))
+    assert first.message == "REDIRECT_TO_STORY_CREATOR"
+    assert second.message == "REDIRECT_TO_STORY_CREATOR_FORCE"
+
+
+def test_coaching_history_shared_between_workers(resp_url):
+    sessions_url = resp_url
+    worker_a = ProfileAgent(sessions=SessionState(RespSessionBackend(RespClient.from_url(sessions_url))))
+    worker_b = ProfileAgent(sessions=SessionState(RespSessionBackend(RespClient.from_url(sessions_url))))
+
+    worker_a.process(ToolRequest(user_id="writer", input="/profile view"))
+    worker_b.process(ToolRequest(user_id="writer", input="/profile view"))
+    assert worker_b.sessions.get("writer", "coaching_history")["interaction_count"] == 2
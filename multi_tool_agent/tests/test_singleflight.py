@@ -0,0 +1,113 @@
+"""Test single-flight coalescing of model calls"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from multi_tool_agent.llm import gateway
+from multi_tool_agent.llm.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    """Only the leader runs; followers get its result and are counted while waiting"""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        release.wait(2)
+        return "shared result"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flight.do, "key", upstream) for _ in range(5)]
+        deadline = time.monotonic() + 2
+        while flight.inflight().get("key", 0) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert flight.inflight() == {"key": 4}
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == ["shared result"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 4
+    assert flight.inflight() == {}
+
+
+def test_followers_receive_leader_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        release.wait(2)
+        raise RuntimeError("429 Resource exhausted")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flight.do, "key", upstream) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+
+
+def test_gateway_keys_on_prompt_and_config():
+    """Different prompts or generation configs are not coalesced"""
+    seen = []
+
+    def fake_generate(model_name, prompt, config, timeout, priority):
+        seen.append((prompt, str(config)))
+        return prompt.upper()
+
+    with patch.object(gateway, "_generate", side_effect=fake_generate):
+        assert gateway.generate_text("m", "hi") == "HI"
+        assert gateway.generate_text("m", "hi", {"temperature": 0.1}) == "HI"
+    assert len(seen) == 2
+    assert gateway._call_key("m", "hi", None) != gateway._call_key("m", "hi", {"temperature": 0.1})
+
+
+def test_follower_retries_when_the_leader_request_is_cancelled(monkeypatch):
+    """A follower with budget left is not failed by the leader's cancelled request"""
+    from google.api_core import exceptions as google_exceptions
+
+    from multi_tool_agent.llm.retry import Deadline, deadline_scope
+
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fake_generate(model_name, prompt, config, timeout, priority):
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(2)
+            raise google_exceptions.ServiceUnavailable("busy")
+        return "ok"
+
+    monkeypatch.setattr(gateway, "_generate", fake_generate)
+    leader_deadline = Deadline.after(30)
+
+    def leader():
+        with deadline_scope(leader_deadline):
+            return gateway.generate_text("m", "cancelled leader")
+
+    def follower():
+        with deadline_scope(30):
+            return gateway.generate_text("m", "cancelled leader")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leading = pool.submit(leader)
+        assert started.wait(2)
+        following = pool.submit(follower)
+        deadline = time.monotonic() + 2
+        while gateway.model_calls.inflight().get(gateway._call_key("m", "cancelled leader", None), 0) < 1 \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        leader_deadline.cancel()
+        release.set()
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            leading.result()
+        assert following.result() == "ok"
+    assert len(calls) == 2
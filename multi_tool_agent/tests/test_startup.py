@@ -0,0 +1,25 @@
+"""Test that importing the package and the API server leaves the agents and SDKs unloaded"""
+
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ("google.adk", "google.generativeai", "multi_tool_agent.agents.story")
+
+
+def test_imports_do_not_load_agents_or_sdks():
+    script = (
+        "import json, sys\n"
+        "import multi_tool_agent, multi_tool_agent.llm, multi_tool_agent.api.server\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
+
+
+def test_package_entry_point_is_still_importable():
+    import multi_tool_agent
+    from multi_tool_agent.agents import StoryAgent
+
+    assert callable(multi_tool_agent.process_message)
+    assert StoryAgent.__name__ == "StoryAgent"
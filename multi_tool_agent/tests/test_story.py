@@ -7,15 +7,129 @@ from multi_tool_agent.agents.story import StoryAgent
     {"genre": "fantasy", "mood": "mysterious", "length": "short"},
     {"genre": "scifi", "mood": "tense", "length": "medium"}
 ])
-def test_story_generator(params):
+def test_story_generator(params, monkeypatch):
     """Test the StoryAgent functionality"""
+    from unittest.mock import MagicMock
+    from multi_tool_agent.llm import gateway
+
+    model = MagicMock()
+    model.generate_content.return_value = MagicMock(text="The lighthouse keeper counted the ships.")
+    monkeypatch.setattr(gateway, "get_model", lambda *args, **kwargs: model)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test_api_key")
+
     story_agent = StoryAgent()
     # Use the public method if available, otherwise keep _generate_story
-    story = story_agent._generate_story(
+    story, used_fallback = story_agent._generate_story(
         genre=params["genre"],
         mood=params["mood"],
         length=params["length"],
         user_id="test_user"
     )
     assert isinstance(story, str)
-    assert len(story) > 0
\ No newline at end of file
+    assert "The lighthouse keeper counted the ships." in story
+    assert not used_fallback
+
+class _FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def _fake_stream(chunks, fail_after=None):
+    def generate_content(prompt, stream=False, request_options=None):
+        for i, text in enumerate(chunks):
+            if fail_after is not None and i == fail_after:
+                raise RuntimeError("429 Resource exhausted")
+            yield _FakeChunk(text)
+    return generate_content
+
+
+def test_stream_story_matches_formatted_story(monkeypatch):
+    """Streamed header, chunks and footer add up to the non-streamed layout"""
+    from unittest.mock import MagicMock
+    from multi_tool_agent.agents import story as story_module
+
+    model = MagicMock()
+    model.generate_content.side_effect = _fake_stream(["Once upon ", "a time."])
+    monkeypatch.setattr(story_module, "get_model", lambda *args, **kwargs: model)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test_api_key")
+
+    story_agent = StoryAgent()
+    events = list(story_agent.stream_story("fantasy", "mysterious", "short", "test_user"))
+
+    assert [e["event"] for e in events] == ["header", "chunk", "chunk", "footer"]
+    body = story_agent._format_story_header("fantasy", "mysterious", "short") + "Once upon a time." \
+        + story_agent._format_story_footer("fantasy", "mysterious", "short")
+    assert "".join(e["text"] for e in events) == body
+
+
+def test_stream_story_falls_back_mid_stream(monkeypatch):
+    """A failure after the first chunk sends the fallback story and still closes with the footer"""
+    from unittest.mock import MagicMock
+    from multi_tool_agent.agents import story as story_module
+
+    model = MagicMock()
+    model.generate_content.side_effect = _fake_stream(["Once upon ", "a time."], fail_after=1)
+    monkeypatch.setattr(story_module, "get_model", lambda *args, **kwargs: model)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test_api_key")
+
+    story_agent = StoryAgent()
+    events = list(story_agent.stream_story("horror", "dark", "micro", "test_user"))
+
+    assert [e["event"] for e in events] == ["header", "chunk", "fallback", "footer"]
+    assert story_agent._get_fallback_story("horror", "dark", "micro") in events[2]["text"]
+
+
+def test_stream_endpoint_keeps_streaming_past_the_request_budget(monkeypatch):
+    """A story that streams for longer than a chat turn's budget is not cut off and replaced"""
+    import time
+    from unittest.mock import MagicMock
+    from fastapi.testclient import TestClient
+    from google.api_core import exceptions as google_exceptions
+    from multi_tool_agent.agents import story as story_module
+    from multi_tool_agent.api import server
+
+    def slow_stream(prompt, stream=False, request_options=None):
+        started = time.monotonic()
+        for text in ["Once upon ", "a long ", "time."]:
+            time.sleep(0.1)
+            if time.monotonic() - started > request_options["timeout"]:
+                raise google_exceptions.DeadlineExceeded("504 Deadline Exceeded")
+            yield _FakeChunk(text)
+
+    model = MagicMock()
+    model.generate_content.side_effect = slow_stream
+    monkeypatch.setattr(story_module, "get_model", lambda *args, **kwargs: model)
+    monkeypatch.setattr(server, "REQUEST_BUDGET", 0.15)
+
+    response = TestClient(server.app).post("/api/story/stream", json={
+        "genre": "fantasy", "mood": "epic", "length": "long", "user_id": "test_user"})
+    events = [line[len("event: "):] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events.count("chunk") == 3 and "fallback" not in events and events[-1] == "done"
+
+
+def test_stream_story_is_counted_as_a_model_call(monkeypatch):
+    """Streamed stories show up in the LLM metrics and the per-request model-call tally"""
+    from unittest.mock import MagicMock
+    from multi_tool_agent.agents import story as story_module
+    from multi_tool_agent.llm import count_model_calls
+    from multi_tool_agent.observability.metrics import LLM_ERRORS, LLM_INFLIGHT, LLM_LATENCY
+
+    model = MagicMock()
+    model.generate_content.side_effect = _fake_stream(["Once upon ", "a time."])
+    monkeypatch.setattr(story_module, "get_model", lambda *args, **kwargs: model)
+    story_agent = StoryAgent()
+    observed = LLM_LATENCY.count(model=story_agent.model)
+
+    with count_model_calls() as tally:
+        list(story_agent.stream_story("fantasy", "mysterious", "short", "test_user"))
+    assert (tally.calls, tally.attempts) == (1, 1)
+    assert LLM_LATENCY.count(model=story_agent.model) == observed + 1
+    assert LLM_INFLIGHT.value(model=story_agent.model) == 0
+
+    # A client hanging up part-way is not counted as a failed call
+    errors = LLM_ERRORS.value(model=story_agent.model, error_class="other")
+    events = story_agent.stream_story("fantasy", "mysterious", "short", "test_user")
+    next(events), next(events)
+    events.close()
+    assert LLM_ERRORS.value(model=story_agent.model, error_class="other") == errors
+    assert LLM_LATENCY.count(model=story_agent.model) == observed + 2
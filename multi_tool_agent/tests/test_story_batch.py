@@ -0,0 +1,70 @@
+"""Test batch story generation over NDJSON"""
+
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from multi_tool_agent.agents.story import StoryAgent
+from multi_tool_agent.api import server
+from multi_tool_agent.llm import current_deadline
+
+
+@pytest.fixture
+def slow_stories(monkeypatch):
+    """Stories that take a moment to generate; records the peak number generated at once and their budgets."""
+    state = {"running": 0, "peak": 0, "budgets": []}
+    lock = threading.Lock()
+
+    def fake_generate(self, genre, mood, length, user_id):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            state["budgets"].append(current_deadline().remaining())
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        if genre == "horror":
+            return self._format_story(genre, mood, length, self._get_fallback_story(genre, mood, length)), True
+        return self._format_story(genre, mood, length, f"A {mood} {genre} tale."), False
+
+    monkeypatch.setattr(StoryAgent, "_generate_story", fake_generate)
+    monkeypatch.setattr(server, "BATCH_CONCURRENCY", 2)
+    return state
+
+
+def test_batch_streams_each_story_and_a_summary(slow_stories):
+    specs = [
+        {"genre": "fantasy", "mood": "epic", "length": "micro"},
+        ["sci-fi", "mysterious", "short"],
+        {"genre": "horror", "mood": "dark", "length": "micro"},
+        {"genre": "mystery", "mood": "mysterious", "length": "short"},
+        {"genre": "romance", "mood": "romantic", "length": "micro"},
+    ]
+    response = TestClient(server.app).post("/api/story/batch", json={"user_id": "batch_user", "stories": specs,
+                                                                     "concurrency": 8})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    stories, summary = lines[:-1], lines[-1]
+
+    assert sorted(line["index"] for line in stories) == list(range(len(specs)))
+    assert all(line["success"] for line in stories)
+    horror = next(line for line in stories if line["parameters"]["genre"] == "horror")
+    assert horror["fallback"] and "temporarily unavailable" in horror["story"]
+    assert summary == {"done": True, "stories": 5, "succeeded": 5, "fallbacks": 1, "failed": 0}
+    # The requested concurrency is capped by PLOTBUDDY_BATCH_CONCURRENCY
+    assert slow_stories["peak"] == 2
+    # Each story gets its own request budget rather than sharing one
+    assert all(0 < budget <= server.REQUEST_BUDGET for budget in slow_stories["budgets"])
+
+
+def test_batch_rejects_incomplete_specs_before_generating(slow_stories):
+    response = TestClient(server.app).post("/api/story/batch", json={
+        "stories": [{"genre": "fantasy", "mood": "epic", "length": "micro"}, {"genre": "fantasy"}]})
+
+    assert response.status_code == 400
+    assert slow_stories["peak"] == 0
@@ -0,0 +1,75 @@
+"""Test the pre-generated story pool"""
+
+import time
+
+from multi_tool_agent.services.story_pool import StoryPool
+
+COMBINATIONS = [("fantasy", "dark", "short"), ("scifi", "tense", "micro")]
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_pool_fills_and_refills_in_background():
+    """Workers stock every combination up to depth and top up after a take"""
+    generated = []
+
+    def generate(genre, mood, length):
+        generated.append((genre, mood, length))
+        return f"A {mood} {genre} story #{len(generated)}"
+
+    pool = StoryPool(generate, COMBINATIONS, depth=2, ttl=60)
+    pool.start()
+    try:
+        assert _wait_for(lambda: pool.stats()["stories"] == 4)
+        story = pool.take("Fantasy", "Dark", "Short")
+        assert story.startswith("A dark fantasy story")
+        assert _wait_for(lambda: pool.stats()["stories"] == 4)
+        key, story = pool.take_random()
+        assert key in COMBINATIONS
+        assert pool.stats()["hits"] == 2
+    finally:
+        pool.stop()
+
+
+def test_pool_skips_failed_generations_and_respects_memory_cap():
+    """Failed generations are not pooled and the byte cap limits stocking"""
+    pool = StoryPool(lambda g, m, l: "x" * 10 if g == "fantasy" else None, COMBINATIONS, depth=3, max_bytes=25)
+    pool.start()
+    try:
+        assert _wait_for(lambda: pool.stats()["skipped_full"] >= 1)
+        stats = pool.stats()
+        assert stats["stories"] == 2
+        assert stats["bytes"] == 20
+        assert stats["failed"] >= 1
+        assert pool.take("scifi", "tense", "micro") is None
+    finally:
+        pool.stop()
+
+
+def test_expired_stories_are_not_served():
+    """Stories past their TTL are dropped instead of served"""
+    pool = StoryPool(lambda g, m, l: "story", COMBINATIONS[:1], depth=1, ttl=0.05)
+    pool.start()
+    try:
+        assert _wait_for(lambda: pool.stats()["stories"] == 1)
+        pool.stop()
+        time.sleep(0.1)
+        assert pool.take("fantasy", "dark", "short") is None
+        assert pool.stats()["expired"] == 1
+    finally:
+        pool.stop()
+
+
+def test_disabled_pool_returns_nothing():
+    pool = StoryPool(lambda g, m, l: "story", COMBINATIONS, depth=0)
+    pool.start()
+    assert not pool.enabled
+    assert pool.take("fantasy", "dark", "short") is None
+    assert pool.take_random() is None
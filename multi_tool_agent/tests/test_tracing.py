@@ -0,0 +1,84 @@
+"""Test per-request tracing spans and the /debug/traces endpoints"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as google_exceptions
+
+from multi_tool_agent.observability import tracing
+from multi_tool_agent.observability.tracing import Tracer, annotate, parse_traceparent, span
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    fresh = Tracer(buffer_size=100)
+    monkeypatch.setattr(tracing, "tracer", fresh)
+    return fresh
+
+
+def test_spans_nest_record_errors_and_group_into_traces(traces):
+    with span("http.request", path="/api/chat") as root:
+        with span("stage.route") as route:
+            annotate(rule="route_story")
+        with pytest.raises(google_exceptions.TooManyRequests):
+            with span("llm.attempt", classify=lambda e: "quota"):
+                raise google_exceptions.TooManyRequests("slow down")
+
+    spans = {s["name"]: s for s in traces.buffer.trace(root.trace_id)}
+    assert spans["stage.route"]["parent_id"] == root.span_id == spans["llm.attempt"]["parent_id"]
+    assert spans["stage.route"]["attributes"] == {"rule": "route_story"} and route.duration_ms is not None
+    assert spans["llm.attempt"]["status"] == "error" and spans["llm.attempt"]["attributes"]["error_class"] == "quota"
+
+    [summary] = traces.buffer.traces()
+    assert (summary["name"], summary["spans"], summary["status"]) == ("http.request", 3, "error")
+    assert summary["attributes"] == {"path": "/api/chat"}
+
+
+def test_disabled_tracer_records_nothing_and_file_mode_writes_json_lines(monkeypatch, tmp_path):
+    monkeypatch.setattr(tracing, "tracer", Tracer(enabled=False))
+    with span("http.request") as root:
+        root.set(path="/api/chat")
+    assert tracing.tracer.buffer.spans() == [] and root.attributes == {}
+
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "tracer", Tracer(path=str(path)))
+    with span("http.request", path="/api/chat"):
+        pass
+    tracing.tracer.close()
+    [line] = path.read_text().splitlines()
+    assert json.loads(line)["attributes"] == {"path": "/api/chat"}
+
+    assert parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01") == ("a" * 32, "b" * 16)
+    assert parse_traceparent("garbage") is None
+
+
+def test_chat_request_trace_covers_the_orchestrator_stages(traces, monkeypatch):
+    from multi_tool_agent.agents.faq import FAQAgent
+    from multi_tool_agent.agents.greeting import GreetingAgent
+    from multi_tool_agent.agents.story import StoryAgent
+    from multi_tool_agent.api import server
+    from multi_tool_agent.models.schemas import ToolResponse
+
+    def unhandled(self, request, context=None):
+        return ToolResponse(success=False, message="not mine")
+
+    monkeypatch.setattr(FAQAgent, "answer", unhandled)
+    for agent in (GreetingAgent, StoryAgent):
+        monkeypatch.setattr(agent, "process", unhandled)
+    monkeypatch.setattr(server, "tracer", traces)
+    client = TestClient(server.app)
+
+    response = client.post("/api/chat", json={"input": "hello", "user_id": "tracer"})
+    trace_id = response.headers["x-trace-id"]
+    spans = client.get(f"/debug/traces/{trace_id}").json()["spans"]
+    by_name = {s["name"]: s for s in spans}
+    assert by_name["http.request"]["attributes"]["status_code"] == response.status_code
+    assert by_name["agent.orchestrator"]["attributes"]["input_chars"] == len("hello")
+    assert {"stage.faq_match", "stage.route", "stage.greeting", "stage.faq_answer"} <= set(by_name)
+    assert by_name["stage.route"]["attributes"]["rule"] == "route_greeting"
+    assert by_name["stage.greeting"]["attributes"]["cost"] == "model"
+    assert by_name["agent.orchestrator"]["attributes"]["model_calls"] == 0
+
+    assert client.get("/debug/traces").json()["traces"][0]["trace_id"] == trace_id
+    assert client.get("/debug/traces/0123").status_code == 404
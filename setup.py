@@ -15,7 +15,8 @@ DEV_REQUIRES = [
     "pytest>=7.0.0",
     "black>=22.0.0",
     "isort>=5.0.0",
-    "flake8>=4.0.0"
+    "flake8>=4.0.0",
+    "httpx>=0.24.0"
 ]
 
 setup(